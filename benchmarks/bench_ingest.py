@@ -0,0 +1,308 @@
+"""Ingest benchmark suite on synthetic Milan-shaped data.
+
+Generates traffic and mobility day files with ``benchmarks.synthetic``, then times, each
+in a fresh process so its peak RSS is its own:
+
+- ``parse``: reading the files with the declared-schema parser, per table
+- ``clean``: the cleaning rules over the already parsed chunks, per table
+- ``load-<loader>``: load_traffic_data/load_mobility_data into an empty schema for each
+  loader strategy, with the read/clean/write/rollup split reported by the loaders
+  (``--pipeline-depth`` overlaps reading and cleaning with the writes), for each storage
+  layout in ``--layouts``, with the on-disk size and full-scan time of the loaded tables
+
+Loads run against a throwaway database (``--db-name``, on the configured server) that is
+dropped at the end unless ``--keep-db``. Results are written as JSON named after the
+current commit, so a run can be compared with one from another commit:
+
+    python -m benchmarks.bench_ingest --days 2 --traffic-rows 500000
+    python -m benchmarks.bench_ingest --compare benchmarks/results/ingest-<commit>.json
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+
+from benchmarks.synthetic import PROVINCES, canonical_province, generate
+from src.config import DB_CONFIG
+from src.etl import LOADERS
+from src.layout import LAYOUTS
+
+TABLES = {
+    'fact_traffic_milan': 'sms-call-internet-mi-*.csv',
+    'fact_mobility_provinces': 'mi-to-provinces-*.csv',
+}
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+
+
+def _peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _files(data_dir, table):
+    return sorted(Path(data_dir).glob(TABLES[table]))
+
+
+def _cleaner(table):
+    from src.parsing import ProvinceNormalizer, clean_traffic_chunk, clean_mobility_chunk
+    if table == 'fact_traffic_milan':
+        return clean_traffic_chunk
+    normalizer = ProvinceNormalizer({canonical_province(name) for name in PROVINCES})
+    return lambda chunk: clean_mobility_chunk(chunk, normalizer)
+
+
+def _parse(table, data_dir):
+    from src.config import CHUNK_ROWS
+    from src.parsing import TRAFFIC_DTYPES, MOBILITY_DTYPES, read_csv_chunks
+    dtypes = TRAFFIC_DTYPES if table == 'fact_traffic_milan' else MOBILITY_DTYPES
+    return [chunk for path in _files(data_dir, table) for chunk in read_csv_chunks(path, CHUNK_ROWS, dtypes)]
+
+
+def bench_parse(table, data_dir):
+    start = time.perf_counter()
+    chunks = _parse(table, data_dir)
+    return {'rows': sum(len(chunk) for chunk in chunks), 'seconds': time.perf_counter() - start}
+
+
+def bench_clean(table, data_dir):
+    chunks = _parse(table, data_dir)
+    clean = _cleaner(table)
+    start = time.perf_counter()
+    rows = sum(len(clean(chunk)[0]) for chunk in chunks)
+    return {'rows': rows, 'seconds': time.perf_counter() - start}
+
+
+def bench_load(loader, layout='standard'):
+    """Load every file into a fresh schema with ``layout``; one result per fact table."""
+    from src.database import create_database, create_schema, get_sqlalchemy_engine
+    from src.etl import load_grid_geometries, load_provinces_geometries, load_traffic_data, load_mobility_data
+    from src.layout import storage_report
+
+    create_database()
+    create_schema(drop_existing=True, layout=layout)
+    load_grid_geometries()
+    load_provinces_geometries()
+
+    results = {}
+    for table, load in (('fact_traffic_milan', load_traffic_data), ('fact_mobility_provinces', load_mobility_data)):
+        start = time.perf_counter()
+        file_stats = load(loader=loader, workers=1, staging=False)
+        phases = {}
+        for stats in file_stats:
+            for phase, seconds in stats['timings'].items():
+                phases[phase] = phases.get(phase, 0.0) + seconds
+        results[table] = {
+            'rows': sum(stats['final'] for stats in file_stats),
+            'seconds': time.perf_counter() - start,
+            'phases': {phase: round(seconds, 3) for phase, seconds in sorted(phases.items())},
+        }
+    engine = get_sqlalchemy_engine()
+    for row in storage_report(engine).to_dict('records'):
+        if row['table'] in results:
+            results[row['table']]['storage'] = {
+                key: row[key] for key in ('total_bytes', 'index_bytes', 'bytes_per_row', 'scan_seconds')
+            }
+    with engine.connect() as conn:
+        server = conn.exec_driver_sql("SHOW server_version").scalar()
+    return {'tables': results, 'server_version': server}
+
+
+def drop_database():
+    import psycopg2
+    conn = psycopg2.connect(
+        dbname='postgres', user=DB_CONFIG['user'], password=DB_CONFIG['password'],
+        host=DB_CONFIG['host'], port=DB_CONFIG['port']
+    )
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP DATABASE IF EXISTS {DB_CONFIG['dbname']}")
+    conn.close()
+
+
+def _child(target, args, results):
+    try:
+        results.put({'result': target(*args), 'peak_rss_mb': _peak_rss_mb()})
+    except Exception as e:
+        results.put({'error': f"{type(e).__name__}: {e}"})
+
+
+def _in_child(ctx, target, *args):
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_child, args=(target, args, queue))
+    proc.start()
+    outcome = queue.get()
+    proc.join()
+    if 'error' in outcome:
+        raise RuntimeError(f"{target.__name__} failed: {outcome['error']}")
+    return outcome['result'], outcome['peak_rss_mb']
+
+
+def _record(benchmark, table, rows, seconds, peak_rss_mb, data_dir, **extra):
+    size = sum(path.stat().st_size for path in _files(data_dir, table))
+    return {
+        'benchmark': benchmark,
+        'table': table,
+        'rows': rows,
+        'bytes': size,
+        'seconds': round(seconds, 3),
+        'rows_per_s': round(rows / seconds) if seconds else None,
+        'mb_per_s': round(size / 1e6 / seconds, 2) if seconds else None,
+        'peak_rss_mb': peak_rss_mb,
+        **extra,
+    }
+
+
+def run(data_dir, loaders, layouts=('standard',), keep_db=False):
+    # Children are spawned so they import the configuration with the benchmark
+    # environment (DATA_DIR, DB_NAME, ETL_CHUNK_ROWS...) and get their own peak RSS
+    ctx = mp.get_context('spawn')
+    results = []
+    environment = {}
+    for table in TABLES:
+        for benchmark, target in (('parse', bench_parse), ('clean', bench_clean)):
+            result, peak = _in_child(ctx, target, table, data_dir)
+            results.append(_record(benchmark, table, result['rows'], result['seconds'], peak, data_dir))
+            print(f"  {benchmark:<20}{table:<26}{result['seconds']:>8.2f}s")
+    try:
+        for layout in layouts:
+            for loader in loaders:
+                result, peak = _in_child(ctx, bench_load, loader, layout)
+                environment['server_version'] = result['server_version']
+                # The standard layout keeps the benchmark names of earlier result files
+                name = f"load-{loader}" if layout == 'standard' else f"load-{loader}-{layout}"
+                for table, load in result['tables'].items():
+                    results.append(_record(
+                        name, table, load['rows'], load['seconds'], peak, data_dir,
+                        phases=load['phases'], storage=load['storage']
+                    ))
+                    storage = load['storage']
+                    print(
+                        f"  {name:<20}{table:<26}{load['seconds']:>8.2f}s  {load['phases']}\n"
+                        f"  {'':<20}{'':<26}{storage['total_bytes'] / 1e6:>7.1f}MB  "
+                        f"{storage['bytes_per_row']} B/row, scan {storage['scan_seconds']:.3f}s"
+                    )
+    finally:
+        if not keep_db:
+            _in_child(ctx, drop_database)
+    return results, environment
+
+
+def _git(*args):
+    try:
+        return subprocess.run(
+            ['git', *args], cwd=Path(__file__).parent, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _versions():
+    versions = {'python': platform.python_version(), 'pandas': pd.__version__}
+    try:
+        import pyarrow
+        versions['pyarrow'] = pyarrow.__version__
+    except ImportError:
+        versions['pyarrow'] = None
+    return versions
+
+
+def compare(baseline, current):
+    """Print the change in seconds of each benchmark present in both result files."""
+    base = {(r['benchmark'], r['table']): r for r in baseline['results']}
+    print(f"\nCompared with {baseline.get('commit') or '?'} ({baseline.get('created_at', '?')}):")
+    print(f"{'benchmark':<22}{'table':<26}{'base s':>9}{'now s':>9}{'change':>9}")
+    for r in current['results']:
+        previous = base.get((r['benchmark'], r['table']))
+        if previous is None or not previous['seconds']:
+            continue
+        change = (r['seconds'] - previous['seconds']) / previous['seconds'] * 100
+        print(f"{r['benchmark']:<22}{r['table']:<26}{previous['seconds']:>9.2f}{r['seconds']:>9.2f}{change:>+8.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingest benchmark suite on synthetic data')
+    parser.add_argument('--days', type=int, default=2, help='Day files per dataset')
+    parser.add_argument('--traffic-rows', type=int, default=500_000, help='Rows per traffic day file')
+    parser.add_argument('--mobility-rows', type=int, default=500_000, help='Rows per mobility day file')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-rows', type=int, default=None, help='Rows per chunk (default: ETL_CHUNK_ROWS)')
+    parser.add_argument('--pipeline-depth', type=int, default=None,
+                        help='Chunks read ahead while writing (default: ETL_PIPELINE_DEPTH)')
+    parser.add_argument('--loaders', nargs='+', choices=LOADERS, default=list(LOADERS))
+    parser.add_argument('--layouts', nargs='+', choices=LAYOUTS, default=['standard'],
+                        help='Fact table storage layouts to load into (default: %(default)s)')
+    parser.add_argument('--db-name', default='milan_telecom_bench',
+                        help='Throwaway database for the loads (default: %(default)s)')
+    parser.add_argument('--keep-db', action='store_true', help='Keep the benchmark database afterwards')
+    parser.add_argument('--data-dir', type=Path, default=None,
+                        help='Reuse synthetic files from this directory instead of generating them')
+    parser.add_argument('--output', type=Path, default=None,
+                        help='Result file (default: benchmarks/results/ingest-<commit>.json)')
+    parser.add_argument('--compare', type=Path, default=None, help='Earlier result file to compare with')
+    args = parser.parse_args()
+
+    if args.db_name == DB_CONFIG['dbname']:
+        parser.error(f"--db-name must not be the configured database '{DB_CONFIG['dbname']}', it is dropped")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir
+        if data_dir is None:
+            data_dir = Path(tmp) / 'data'
+            print(f"Generating {args.days} days of synthetic data...")
+            generate(data_dir, args.days, args.traffic_rows, args.mobility_rows, seed=args.seed)
+
+        os.environ.update({
+            'DB_NAME': args.db_name,
+            'DATA_DIR': str(data_dir),
+            'ETL_GEO_CACHE_DIR': str(Path(tmp) / 'geo'),
+            'ETL_METRICS_TEXTFILE': '',
+            'ETL_PUSHGATEWAY_URL': '',
+        })
+        if args.chunk_rows is not None:
+            os.environ['ETL_CHUNK_ROWS'] = str(args.chunk_rows)
+        if args.pipeline_depth is not None:
+            os.environ['ETL_PIPELINE_DEPTH'] = str(args.pipeline_depth)
+        print("Running benchmarks...")
+        results, environment = run(data_dir, args.loaders, args.layouts, args.keep_db)
+
+    commit = _git('rev-parse', 'HEAD')
+    dirty = bool(_git('status', '--porcelain', '--untracked-files=no'))
+    report = {
+        'commit': commit,
+        'dirty': dirty,
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'params': {
+            'days': args.days,
+            'traffic_rows': args.traffic_rows,
+            'mobility_rows': args.mobility_rows,
+            'seed': args.seed,
+            'chunk_rows': args.chunk_rows,
+            'pipeline_depth': args.pipeline_depth,
+            'layouts': args.layouts,
+        },
+        'environment': {**_versions(), **environment},
+        'results': results,
+    }
+
+    output = args.output
+    if output is None:
+        output = RESULTS_DIR / f"ingest-{(commit or 'unknown')[:12]}{'-dirty' if dirty else ''}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + '\n')
+    print(f"Results written to {output}")
+
+    if args.compare:
+        compare(json.loads(args.compare.read_text()), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Parse+clean micro-benchmark on a synthetic traffic day file.
+
+Compares the original inference-based cleaning loop with the declared-schema fast path
+(``--parser fast``) and the inference path that shares the new vectorized cleaning
+(``--parser infer``), plus the fast path streamed in ``CHUNK_ROWS`` chunks. Each variant runs in a fresh process so its peak RSS is its own.
+
+    python -m benchmarks.bench_parse --rows 2000000
+"""
+import argparse
+import json
+import multiprocessing as mp
+import resource
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from benchmarks.synthetic import write_traffic_day
+from src.config import CHUNK_ROWS
+from src.parsing import METRIC_COLS, TRAFFIC_DTYPES, read_csv_chunks, clean_traffic_chunk
+
+
+def baseline_parse_clean(path):
+    """The pre-fast-path cleaning loop, kept verbatim for comparison."""
+    df = pd.read_csv(path)
+    if 'datetime' in df.columns:
+        df['datetime'] = pd.to_datetime(df['datetime'], errors='coerce')
+        df = df.dropna(subset=['datetime'])
+    df = df.rename(columns={'CellID': 'cell_id'})
+    for col in METRIC_COLS:
+        if col not in df.columns:
+            df[col] = 0
+        else:
+            (df[col] < 0).sum()
+    df[METRIC_COLS] = df[METRIC_COLS].apply(pd.to_numeric, errors='coerce').fillna(0)
+    for col in METRIC_COLS:
+        df.loc[df[col] < 0, col] = 0
+    df = df[df['cell_id'].between(0, 9999)]
+    return len(df)
+
+
+def _new_parse_clean(path, dtypes, chunk_rows=0):
+    rows = 0
+    for chunk in read_csv_chunks(path, chunk_rows, dtypes):
+        df, _ = clean_traffic_chunk(chunk)
+        rows += len(df)
+    return rows
+
+
+VARIANTS = {
+    'baseline': baseline_parse_clean,
+    'infer': lambda path: _new_parse_clean(path, None),
+    'fast': lambda path: _new_parse_clean(path, TRAFFIC_DTYPES),
+    'fast-chunked': lambda path: _new_parse_clean(path, TRAFFIC_DTYPES, CHUNK_ROWS),
+}
+
+
+def _measure(variant, path, results):
+    start = time.perf_counter()
+    rows = VARIANTS[variant](path)
+    elapsed = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put({'variant': variant, 'rows': rows, 'seconds': round(elapsed, 3), 'peak_rss_mb': round(peak_kb / 1024, 1)})
+
+
+def run(rows, variants):
+    ctx = mp.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'sms-call-internet-mi-2013-11-01.csv'
+        # Generated in a child too: ru_maxrss survives fork+exec, so the parent must stay small.
+        writer = ctx.Process(target=write_traffic_day, args=(path, '2013-11-01', rows))
+        writer.start()
+        writer.join()
+        results = []
+        for variant in variants:
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_measure, args=(variant, path, queue))
+            proc.start()
+            results.append(queue.get())
+            proc.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parse+clean micro-benchmark')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='Rows in the synthetic day file')
+    parser.add_argument('--variants', nargs='+', choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    results = run(args.rows, args.variants)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'variant':<14}{'rows':>12}{'seconds':>10}{'peak RSS MB':>14}")
+    for r in results:
+        print(f"{r['variant']:<14}{r['rows']:>12}{r['seconds']:>10}{r['peak_rss_mb']:>14}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""Synthetic Milan-shaped source files for benchmarks.
+
+Writes ``sms-call-internet-mi-*.csv`` and ``mi-to-provinces-*.csv`` day files with the
+real column names, 10,000 cells (CellID 1..10000), 10-minute traffic slots and hourly
+mobility slots, weighted country codes and upper-case province names (plus the casing
+and spelling variants handled by PROVINCE_MAP), the missing-value rates of the real
+files and a few bad rows of each kind the cleaning rules reject. Keys are unique per
+file, as in the source. The grid and province GeoJSON files can be generated too, so
+a directory is a complete DATA_DIR.
+
+    python -m benchmarks.synthetic /tmp/milan-data --days 3 --traffic-rows 1000000
+"""
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.parsing import METRIC_COLS, PROVINCE_MAP
+
+CELLS = 10_000
+GRID_SIDE = 100
+
+# Country codes as dialing prefixes; Italy and "unknown" (0) dominate
+COUNTRY_CODES = np.array([39, 0, 33, 49, 44, 34, 41, 86, 1, 40, 355, 212, 7, 380, 91])
+COUNTRY_WEIGHTS = np.array([50, 25, 4, 4, 3, 3, 2, 2, 2, 1, 1, 1, 1, 0.5, 0.5])
+
+# Province names as they appear in the source files, Milan and its neighbours first
+PROVINCES = [
+    'MILANO', 'MONZA E DELLA BRIANZA', 'PAVIA', 'NAPOLI', 'BERGAMO', 'ROMA', 'VARESE', 'COMO',
+    'LODI', 'NOVARA', 'TORINO', 'BRESCIA', 'CREMONA', 'LECCO', 'PIACENZA', 'GENOVA', 'BOLOGNA',
+    'VERONA', 'FIRENZE', 'PALERMO', 'BARI', 'VENEZIA', 'PARMA', "REGGIO NELL'EMILIA",
+    'REGGIO DI CALABRIA', 'PESARO E URBINO', 'MASSA-CARRARA', "VALLE D'AOSTA", 'BOLZANO/BOZEN',
+    'TRENTO', 'CAGLIARI', 'OGLIASTRA',
+]
+
+# Spellings seen with other casings; all of them map to the same province once cleaned
+CASING_VARIANTS = {
+    'MONZA E DELLA BRIANZA': 'Monza E Della Brianza',
+    "REGGIO NELL'EMILIA": "reggio nell'emilia",
+    'MILANO': 'Milano',
+    'BOLZANO/BOZEN': 'Bolzano/Bozen',
+}
+
+UNKNOWN_PROVINCE = 'ATLANTIDE'
+
+# Share of missing values per column in the real files
+TRAFFIC_MISSING = {'smsin': 0.57, 'smsout': 0.75, 'callin': 0.74, 'callout': 0.55, 'internet': 0.57}
+MOBILITY_MISSING = {'cell2Province': 0.39, 'Province2cell': 0.37}
+
+# Grid origin and cell size (degrees) of the real Milan grid
+GRID_ORIGIN = (9.0114910478323, 45.35880131440966)
+GRID_STEP = (0.0030004, 0.0021153)
+
+
+def canonical_province(name):
+    """The dim_provinces_it name a source province name is cleaned to."""
+    title = name.title().strip()
+    return PROVINCE_MAP.get(title, title)
+
+
+def _province_weights():
+    weights = 1.0 / np.arange(1, len(PROVINCES) + 1)
+    return weights / weights.sum()
+
+
+def _unique_keys(rng, rows, slots, categories, weights):
+    """Draw ``rows`` distinct (slot, cell, category) keys, sorted like the source files."""
+    rows = min(rows, slots * CELLS * len(categories))
+    keys = pd.DataFrame(columns=['slot', 'cell', 'category'], dtype='int64')
+    while len(keys) < rows:
+        draw = int((rows - len(keys)) * 1.3) + 16
+        batch = pd.DataFrame({
+            'slot': rng.integers(0, slots, draw),
+            'cell': rng.integers(1, CELLS + 1, draw),
+            'category': rng.choice(len(categories), draw, p=weights),
+        })
+        keys = pd.concat([keys, batch]).drop_duplicates()
+    return keys.iloc[:rows].sort_values(['slot', 'cell', 'category'], ignore_index=True)
+
+
+def _measures(rng, rows, missing, scale):
+    values = {}
+    for col, share in missing.items():
+        column = np.round(rng.exponential(scale, rows), 4)
+        column[rng.random(rows) < share] = np.nan
+        values[col] = column
+    return values
+
+
+def _bad_rows(rows, bad_every, kinds):
+    """Row positions receiving each kind of bad value, spread through the file."""
+    positions = np.arange(0, rows, bad_every) if bad_every else np.array([], dtype=int)
+    return {kind: positions[i::len(kinds)] for i, kind in enumerate(kinds)}
+
+
+def write_traffic_day(path, day='2013-11-01', rows=1_000_000, seed=0, bad_every=10_000):
+    """Write one sms-call-internet day file; returns the number of rows written."""
+    rng = np.random.default_rng(seed)
+    keys = _unique_keys(rng, rows, 144, COUNTRY_CODES, COUNTRY_WEIGHTS / COUNTRY_WEIGHTS.sum())
+    rows = len(keys)
+    slots = pd.Timestamp(day) + pd.to_timedelta(keys['slot'].to_numpy() * 10, unit='min')
+    df = pd.DataFrame({
+        'datetime': slots.strftime('%Y-%m-%d %H:%M:%S'),
+        'CellID': keys['cell'].to_numpy(),
+        'countrycode': COUNTRY_CODES[keys['category'].to_numpy()],
+        **_measures(rng, rows, TRAFFIC_MISSING, 5.0),
+    })
+
+    bad = _bad_rows(rows, bad_every, ('date', 'cell', 'negative'))
+    df.loc[bad['date'], 'datetime'] = 'not-a-date'
+    df.loc[bad['cell'], 'CellID'] = CELLS * 10
+    df.loc[bad['negative'], 'smsin'] = -1.0
+    df[['datetime', 'CellID', 'countrycode'] + METRIC_COLS].to_csv(path, index=False)
+    return rows
+
+
+def write_mobility_day(path, day='2013-11-01', rows=1_000_000, seed=0, bad_every=10_000):
+    """Write one mi-to-provinces day file; returns the number of rows written."""
+    rng = np.random.default_rng(seed)
+    keys = _unique_keys(rng, rows, 24, PROVINCES, _province_weights())
+    rows = len(keys)
+    slots = pd.Timestamp(day) + pd.to_timedelta(keys['slot'].to_numpy(), unit='h')
+    names = np.array(PROVINCES, dtype=object)[keys['category'].to_numpy()]
+    for source, variant in CASING_VARIANTS.items():
+        matches = np.flatnonzero(names == source)
+        names[matches[rng.random(len(matches)) < 0.2]] = variant
+    df = pd.DataFrame({
+        'datetime': slots.strftime('%Y-%m-%d %H:%M:%S'),
+        'CellID': keys['cell'].to_numpy(),
+        'provinceName': names,
+        **_measures(rng, rows, MOBILITY_MISSING, 0.6),
+    })
+
+    bad = _bad_rows(rows, bad_every, ('date', 'cell', 'province'))
+    df.loc[bad['date'], 'datetime'] = ''
+    df.loc[bad['cell'], 'CellID'] = CELLS * 10
+    df.loc[bad['province'], 'provinceName'] = UNKNOWN_PROVINCE
+    df.to_csv(path, index=False)
+    return rows
+
+
+def _square(x0, y0, dx, dy):
+    return [[x0, y0], [x0 + dx, y0], [x0 + dx, y0 + dy], [x0, y0 + dy], [x0, y0]]
+
+
+def _write_geojson(path, features):
+    Path(path).write_text(json.dumps({
+        'type': 'FeatureCollection',
+        'crs': {'type': 'name', 'properties': {'name': 'urn:ogc:def:crs:OGC:1.3:CRS84'}},
+        'features': features,
+    }))
+
+
+def write_grid(path):
+    """Write a 100x100 grid of polygons at the position and size of the Milan grid."""
+    (x0, y0), (dx, dy) = GRID_ORIGIN, GRID_STEP
+    features = []
+    for i in range(CELLS):
+        row, col = divmod(i, GRID_SIDE)
+        features.append({
+            'type': 'Feature',
+            'properties': {'cellId': i + 1},
+            'geometry': {'type': 'Polygon', 'coordinates': [_square(x0 + col * dx, y0 + row * dy, dx, dy)]},
+        })
+    _write_geojson(path, features)
+
+
+def write_provinces(path):
+    """Write one square multipolygon per province, named as in dim_provinces_it.
+
+    Milan covers the southern two thirds of the grid and Monza the rest, so the cells along
+    their border are split between two provinces; the others lie away from the grid.
+    """
+    (x0, y0), (dx, dy) = GRID_ORIGIN, GRID_STEP
+    border = y0 + dy * GRID_SIDE * 2 / 3 + dy / 2
+    around_grid = {
+        'MILANO': _square(x0 - 0.2, y0 - 0.2, dx * GRID_SIDE + 0.4, border - y0 + 0.2),
+        'MONZA E DELLA BRIANZA': _square(x0 - 0.2, border, dx * GRID_SIDE + 0.4, 0.4),
+    }
+    features = []
+    for i, name in enumerate(PROVINCES):
+        row, col = divmod(i, 8)
+        square = around_grid.get(name) or _square(7.0 + col * 0.5, 38.0 + row * 1.5, 0.4, 1.0)
+        features.append({
+            'type': 'Feature',
+            'properties': {'PROVINCIA': canonical_province(name), 'population': 100_000 * (len(PROVINCES) - i)},
+            'geometry': {'type': 'MultiPolygon', 'coordinates': [[square]]},
+        })
+    _write_geojson(path, features)
+
+
+def generate(out_dir, days=1, traffic_rows=1_000_000, mobility_rows=1_000_000, start='2013-11-01',
+             seed=0, bad_every=10_000, geometries=True):
+    """Write a complete synthetic DATA_DIR; returns the paths written."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    if geometries:
+        write_grid(out_dir / 'milano-grid.geojson')
+        write_provinces(out_dir / 'Italian_provinces.geojson')
+        paths += [out_dir / 'milano-grid.geojson', out_dir / 'Italian_provinces.geojson']
+    for i, day in enumerate(pd.date_range(start, periods=days, freq='D').strftime('%Y-%m-%d')):
+        traffic = out_dir / f'sms-call-internet-mi-{day}.csv'
+        mobility = out_dir / f'mi-to-provinces-{day}.csv'
+        write_traffic_day(traffic, day, traffic_rows, seed + i, bad_every)
+        write_mobility_day(mobility, day, mobility_rows, seed + 1000 + i, bad_every)
+        paths += [traffic, mobility]
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic Milan-shaped source files')
+    parser.add_argument('out_dir', type=Path, help='Directory to write the files to')
+    parser.add_argument('--days', type=int, default=1, help='Day files per dataset')
+    parser.add_argument('--start', default='2013-11-01', help='First day')
+    parser.add_argument('--traffic-rows', type=int, default=1_000_000, help='Rows per traffic day file')
+    parser.add_argument('--mobility-rows', type=int, default=1_000_000, help='Rows per mobility day file')
+    parser.add_argument('--bad-every', type=int, default=10_000, help='One bad row every N rows (0: none)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-geometries', action='store_true', help='Skip the grid and province GeoJSON files')
+    args = parser.parse_args()
+
+    paths = generate(args.out_dir, args.days, args.traffic_rows, args.mobility_rows, args.start,
+                     args.seed, args.bad_every, not args.no_geometries)
+    for path in paths:
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
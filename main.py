@@ -1,13 +1,16 @@
 import argparse
 import logging
-from src.database import create_database, create_schema
-from src.etl import (
-    load_grid_geometries, 
-    load_provinces_geometries, 
-    load_traffic_data, 
-    load_mobility_data,
-    get_top_cells
+import subprocess
+import sys
+import time
+from src.config import (
+    DEFAULT_LOADER, DEFAULT_PARSER, DEFAULT_BACKEND, CHUNK_ROWS, WORKERS, PARTITIONING, PIPELINE_DEPTH, LAYOUT,
+    LOADERS, PARSERS, BACKENDS, GRANULARITIES, LAYOUTS, DUCKDB_SOURCES
 )
+from src.metrics import stage
+
+# Each step imports the modules it needs when it runs, so that --help or --setup do not
+# pay for pandas, geopandas/pyproj or pyarrow (see --profile-startup).
 
 logging.basicConfig(
     level=logging.INFO,
@@ -16,12 +19,14 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def setup_database():
+def setup_database(partitioning=None, layout=None):
     logger.info("=" * 60)
     logger.info("STEP 1: Database and schema creation")
     logger.info("=" * 60)
-    create_database()
-    create_schema()
+    from src.database import create_database, create_schema
+    with stage('setup'):
+        create_database()
+        create_schema(partitioning=partitioning, layout=layout)
     logger.info("✓ Database initialized\n")
 
 
@@ -29,64 +34,269 @@ def load_geometries():
     logger.info("=" * 60)
     logger.info("STEP 2: Geometries loading")
     logger.info("=" * 60)
-    load_grid_geometries()
-    load_provinces_geometries()
+    from src.etl import load_grid_geometries, load_provinces_geometries, load_cell_overlaps
+    with stage('geometries'):
+        load_grid_geometries()
+        load_provinces_geometries()
+        load_cell_overlaps()
     logger.info("✓ Geometries loaded\n")
 
 
-def load_csv_data(limit_files=None):
+def load_csv_data(limit_files=None, loader=None, chunk_rows=None, workers=None, parser=None,
+                  detached_partitions=False, deferred_indexes=False, staging=None, pipeline_depth=None,
+                  cube=False, rebuild_cube=False):
     logger.info("=" * 60)
     logger.info("STEP 3: CSV data loading")
     logger.info("=" * 60)
-    load_traffic_data(limit_files=limit_files)
-    load_mobility_data(limit_files=limit_files)
+    from src.database import get_sqlalchemy_engine
+    from src.deferred import defer_secondary_objects, rebuild_deferred_objects, pending_deferred_objects
+    from src.etl import load_traffic_data, load_mobility_data
+    options = {
+        'loader': loader,
+        'chunk_rows': chunk_rows,
+        'workers': workers,
+        'parser': parser,
+        'detached_partitions': detached_partitions,
+        'staging': staging,
+        'pipeline_depth': pipeline_depth,
+    }
+    if deferred_indexes:
+        defer_secondary_objects()
+    elif pending_deferred_objects(get_sqlalchemy_engine()):
+        logger.warning("⚠ Indexes left dropped by an interrupted bulk load, rebuilding them first")
+        rebuild_deferred_objects()
+
+    start = time.perf_counter()
+    loaded = []
+    try:
+        with stage('traffic'):
+            loaded += load_traffic_data(limit_files=limit_files, **options)
+        with stage('mobility'):
+            loaded += load_mobility_data(limit_files=limit_files, **options)
+    finally:
+        if deferred_indexes:
+            load_time = time.perf_counter() - start
+            with stage('index_rebuild'):
+                timings = rebuild_deferred_objects()
+            logger.info(
+                f"✓ Bulk load: {load_time:.2f}s loading, {timings['indexes']:.2f}s index rebuild, "
+                f"{timings['foreign_keys']:.2f}s foreign key validation"
+            )
     logger.info("✓ CSV data loaded\n")
+    # After any deferred index rebuild, so the per-file range reads of the export are indexed
+    if cube:
+        export_cube(rebuild=rebuild_cube)
+    return [stats['file'] for stats in loaded]
+
+
+def refresh_rollup():
+    logger.info("=" * 60)
+    logger.info("Hourly traffic rollup rebuild")
+    logger.info("=" * 60)
+    from src.etl import rebuild_hourly_rollup
+    with stage('rollup'):
+        rebuild_hourly_rollup()
+    logger.info("✓ Rollup rebuilt\n")
+
+
+def validate_data(files=None, sample_percent=None):
+    logger.info("=" * 60)
+    logger.info("Data validation")
+    logger.info("=" * 60)
+    if files is not None and not files:
+        logger.info("✓ No newly loaded files to validate\n")
+        return
+    from src.etl import validate_schema_constraints
+    with stage('validation'):
+        report = validate_schema_constraints(files=files, sample_percent=sample_percent)
+    if report.ok:
+        logger.info("✓ No constraint violations\n")
+    else:
+        logger.warning(f"⚠ {report.violations} constraint violations in {len(report.failed())} rules\n")
+
+
+def build_duckdb(source='staging', limit_files=None):
+    logger.info("=" * 60)
+    logger.info("DuckDB analytical database build")
+    logger.info("=" * 60)
+    from src.duckdb_backend import build_duckdb_database
+    with stage('duckdb_build'):
+        build_duckdb_database(source=source, limit_files=limit_files)
+    logger.info("✓ DuckDB database built\n")
+
+
+def export_cube(rebuild=False):
+    logger.info("=" * 60)
+    logger.info("Traffic cube export")
+    logger.info("=" * 60)
+    from src.cube import export_traffic_cube
+    with stage('cube_export'):
+        export_traffic_cube(rebuild=rebuild)
+    logger.info("✓ Traffic cube exported\n")
+
+
+def report_storage():
+    logger.info("=" * 60)
+    logger.info("Fact table storage report")
+    logger.info("=" * 60)
+    from src.database import get_sqlalchemy_engine
+    from src.layout import log_storage_report
+    log_storage_report(get_sqlalchemy_engine())
+    logger.info("✓ Storage report done\n")
 
 
-def run_test_query():
+def run_test_query(backend=None):
     logger.info("=" * 60)
     logger.info("STEP 4: Test query")
     logger.info("=" * 60)
-    df = get_top_cells(limit=10)
+    from src.kpi import get_top_cells
+    with stage('test_query'):
+        df = get_top_cells(limit=10, backend=backend)
     print("\nTop 10 cells by activity:")
     print(df.to_string(index=False))
     logger.info("✓ Query executed\n")
 
 
+def profile_startup(argv, top=15):
+    """Run the same command under ``python -X importtime`` and report import time per package.
+
+    The time of each imported module (excluding its own imports) is summed by top-level
+    package, e.g. every ``pandas.*`` module under ``pandas``.
+    """
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', __file__, *argv], stderr=subprocess.PIPE, text=True
+    )
+    elapsed = time.perf_counter() - start
+
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            print(line, file=sys.stderr)
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        if not self_us.strip().isdigit():
+            continue
+        package = name.strip().split('.')[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+
+    total = sum(packages.values())
+    logger.info("=" * 60)
+    logger.info(f"Startup profile: {total / 1e3:.0f} ms of imports in {elapsed:.2f}s total")
+    logger.info("=" * 60)
+    for package, micros in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        logger.info(f"    - {package:<24} {micros / 1e3:8.1f} ms  ({micros / total:.0%})")
+    return result.returncode
+
+
 def main():
     parser = argparse.ArgumentParser(description='Milan Telecom ETL Pipeline')
     parser.add_argument('--setup', action='store_true', help='Create database and schema')
+    parser.add_argument('--partitioning', choices=('none',) + GRANULARITIES, default=PARTITIONING,
+                        help='Range-partition the fact tables by time at setup (default: %(default)s)')
+    parser.add_argument('--layout', choices=LAYOUTS, default=LAYOUT,
+                        help='Fact table storage layout created at setup (default: %(default)s)')
     parser.add_argument('--load-geo', action='store_true', help='Load geometries')
     parser.add_argument('--load-data', action='store_true', help='Load CSV data')
     parser.add_argument('--limit-files', type=int, default=None, help='Max CSV files to load')
+    parser.add_argument('--loader', choices=LOADERS, default=DEFAULT_LOADER,
+                        help='Fact table write strategy (default: %(default)s)')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS,
+                        help='Rows per CSV chunk when streaming files, 0 reads whole files (default: %(default)s)')
+    parser.add_argument('--parser', choices=PARSERS, default=DEFAULT_PARSER,
+                        help='CSV parsing path: declared schema or type inference (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help='Worker processes loading files in parallel (default: %(default)s)')
+    parser.add_argument('--pipeline-depth', type=int, default=PIPELINE_DEPTH,
+                        help='Chunks read and cleaned ahead in a background thread while the current one is '
+                             'written, 0 disables the overlap (default: %(default)s)')
+    parser.add_argument('--detached-partitions', action='store_true',
+                        help='Load new partitions detached and index-free, then index and attach them')
+    parser.add_argument('--staging', action='store_true', default=None,
+                        help='Stage cleaned files as Parquet and reuse them instead of re-parsing CSV '
+                             '(default: ETL_STAGING)')
+    parser.add_argument('--deferred-indexes', action='store_true',
+                        help='Drop fact indexes and foreign keys during the load, rebuild them in parallel afterwards')
+    parser.add_argument('--refresh-rollup', action='store_true', help='Rebuild the hourly traffic rollup')
+    parser.add_argument('--validate', action='store_true',
+                        help='Check constraint rules (only the newly loaded files when used with --load-data)')
+    parser.add_argument('--sample-percent', type=float, default=None,
+                        help='Validate a TABLESAMPLE block sample of this percentage of each table')
+    parser.add_argument('--build-duckdb', action='store_true',
+                        help='Build the embedded DuckDB database for offline analysis (no Postgres access)')
+    parser.add_argument('--duckdb-source', choices=DUCKDB_SOURCES, default='staging',
+                        help='Fact data for --build-duckdb: staged Parquet or the CSV files (default: %(default)s)')
+    parser.add_argument('--export-cube', action='store_true',
+                        help='Export the loaded traffic to the memory-mapped cube (files loaded since the last export); '
+                             'runs as part of --load-data when given with it; --all always runs it')
+    parser.add_argument('--rebuild-cube', action='store_true',
+                        help='Rewrite the whole cube with --export-cube')
+    parser.add_argument('--storage-report', action='store_true',
+                        help='Report the on-disk size and full-scan time of the fact tables')
     parser.add_argument('--test', action='store_true', help='Run test query')
+    parser.add_argument('--backend', choices=BACKENDS, default=DEFAULT_BACKEND,
+                        help='Query backend for --test (default: %(default)s)')
     parser.add_argument('--all', action='store_true', help='Run all steps')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='Run the command with the other options and report the import time per package')
     
     args = parser.parse_args()
+    if args.profile_startup:
+        sys.exit(profile_startup([arg for arg in sys.argv[1:] if arg != '--profile-startup']))
+
+    load_options = {
+        'limit_files': args.limit_files,
+        'loader': args.loader,
+        'chunk_rows': args.chunk_rows,
+        'workers': args.workers,
+        'parser': args.parser,
+        'detached_partitions': args.detached_partitions,
+        'deferred_indexes': args.deferred_indexes,
+        'staging': args.staging,
+        'pipeline_depth': args.pipeline_depth,
+        'rebuild_cube': args.rebuild_cube,
+    }
     
     try:
         if args.all:
-            setup_database()
+            setup_database(partitioning=args.partitioning, layout=args.layout)
             load_geometries()
-            load_csv_data(limit_files=args.limit_files)
-            run_test_query()
+            load_csv_data(cube=True, **load_options)
+            run_test_query(backend=args.backend)
             logger.info("=" * 60)
             logger.info("✓ PIPELINE COMPLETED SUCCESSFULLY!")
             logger.info("=" * 60)
         else:
             if args.setup:
-                setup_database()
+                setup_database(partitioning=args.partitioning, layout=args.layout)
             
             if args.load_geo:
                 load_geometries()
             
+            loaded_files = None
             if args.load_data:
-                load_csv_data(limit_files=args.limit_files)
+                loaded_files = load_csv_data(cube=args.export_cube, **load_options)
+
+            if args.validate:
+                validate_data(files=loaded_files, sample_percent=args.sample_percent)
+            
+            if args.refresh_rollup:
+                refresh_rollup()
+
+            if args.build_duckdb:
+                build_duckdb(source=args.duckdb_source, limit_files=args.limit_files)
+
+            if args.export_cube and not args.load_data:
+                export_cube(rebuild=args.rebuild_cube)
+
+            if args.storage_report:
+                report_storage()
             
             if args.test:
-                run_test_query()
+                run_test_query(backend=args.backend)
             
-            if not any([args.setup, args.load_geo, args.load_data, args.test]):
+            if not any([args.setup, args.load_geo, args.load_data, args.validate, args.refresh_rollup,
+                        args.build_duckdb, args.export_cube, args.storage_report, args.test]):
                 parser.print_help()
                 
     except Exception as e:
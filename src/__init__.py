@@ -1,9 +1,31 @@
-from .config import DB_CONFIG, DATA_DIR
-from .database import create_database, create_schema, get_connection, get_sqlalchemy_engine
-from .etl import load_grid_geometries, load_provinces_geometries, load_traffic_data, load_mobility_data
-
-__all__ = [
-    'DB_CONFIG', 'DATA_DIR',
-    'create_database', 'create_schema', 'get_connection', 'get_sqlalchemy_engine',
-    'load_grid_geometries', 'load_provinces_geometries', 'load_traffic_data', 'load_mobility_data'
-]
+import importlib
+
+# Public API -> defining submodule. Names are imported on first access (PEP 562), so that
+# `import src.config` or `python main.py --help` does not load pandas, SQLAlchemy or geopandas.
+_EXPORTS = {
+    'DB_CONFIG': 'config',
+    'DATA_DIR': 'config',
+    'create_database': 'database',
+    'create_schema': 'database',
+    'get_connection': 'database',
+    'get_sqlalchemy_engine': 'database',
+    'load_grid_geometries': 'etl',
+    'load_provinces_geometries': 'etl',
+    'load_traffic_data': 'etl',
+    'load_mobility_data': 'etl',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -12,13 +12,84 @@ DB_CONFIG = {
     'port': os.getenv('DB_PORT', '5432')
 }
 
+# Shared connection pool (one per process); a statement timeout of 0 disables it
+DB_POOL = {
+    'size': int(os.getenv('DB_POOL_SIZE', 5)),
+    'max_overflow': int(os.getenv('DB_POOL_MAX_OVERFLOW', 5)),
+    'pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes'),
+    'recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+    'statement_timeout_ms': int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 0)),
+}
+
 BASE_DIR = Path(__file__).parent.parent
 DATA_DIR = Path(os.getenv('DATA_DIR', BASE_DIR / 'data_milan_cdr_kaggle'))
 
 MILANO_GRID_FILE = DATA_DIR / 'milano-grid.geojson'
 PROVINCES_FILE = DATA_DIR / 'Italian_provinces.geojson'
 
+# Source CSV names; .gz/.zst variants and members of .zip archives in DATA_DIR also match
 TRAFFIC_PATTERN = 'sms-call-internet-mi-*.csv'
 MOBILITY_PATTERN = 'mi-to-provinces-*.csv'
 
 TARGET_CRS = 'EPSG:32632'
+
+# Reprojected geometry files, keyed by source hash and CRS
+GEO_CACHE_DIR = Path(os.getenv('ETL_GEO_CACHE_DIR', BASE_DIR / '.cache' / 'geo'))
+
+# The option values are declared here rather than in the modules using them, so that
+# main.py can build its command line without importing pandas, SQLAlchemy or geopandas.
+
+# Fact table write strategy: 'copy' (COPY FROM STDIN) or 'insert' (DataFrame.to_sql)
+LOADERS = ('copy', 'insert')
+DEFAULT_LOADER = os.getenv('ETL_LOADER', 'copy')
+
+# Rows per CSV chunk when streaming source files (0 reads each file whole)
+CHUNK_ROWS = int(os.getenv('ETL_CHUNK_ROWS', 500_000))
+
+# Worker processes used to load fact files in parallel (1 = sequential)
+WORKERS = int(os.getenv('ETL_WORKERS', 1))
+
+# CSV parsing: 'fast' (declared schema, pyarrow reader when installed) or 'infer' (pandas type inference)
+PARSERS = ('fast', 'infer')
+DEFAULT_PARSER = os.getenv('ETL_PARSER', 'fast')
+
+# Time partitioning of the fact tables applied by --setup: 'none', 'daily' or 'weekly'
+GRANULARITIES = ('daily', 'weekly')
+PARTITIONING = os.getenv('ETL_PARTITIONING', 'none')
+
+# Fact table storage layout applied by --setup: 'standard', 'compact' (REAL/SMALLINT) or 'wide'
+LAYOUTS = ('standard', 'compact', 'wide')
+LAYOUT = os.getenv('ETL_LAYOUT', 'standard')
+
+# Cleaned chunks read ahead by a background thread while the previous ones are written (0 = off)
+PIPELINE_DEPTH = int(os.getenv('ETL_PIPELINE_DEPTH', 0))
+
+# Bulk loads with deferred indexes: parallel index builds and memory per build
+INDEX_WORKERS = int(os.getenv('ETL_INDEX_WORKERS', 4))
+INDEX_BUILD_MEM = os.getenv('ETL_INDEX_BUILD_MEM', '256MB')
+
+# Parquet staging of cleaned source files ('off' or 'on'), keyed by source hash
+STAGING = os.getenv('ETL_STAGING', 'off')
+STAGING_DIR = Path(os.getenv('ETL_STAGING_DIR', BASE_DIR / '.cache' / 'staging'))
+
+# Query backend for the KPI functions: 'postgres' or 'duckdb' (embedded, offline)
+BACKENDS = ('postgres', 'duckdb')
+DEFAULT_BACKEND = os.getenv('ETL_BACKEND', 'postgres')
+DUCKDB_PATH = Path(os.getenv('ETL_DUCKDB_PATH', BASE_DIR / '.cache' / 'milan.duckdb'))
+# Fact data for the DuckDB build: staged Parquet or the CSV files
+DUCKDB_SOURCES = ('staging', 'csv')
+
+# In-process cache of the dashboard queries (src.queries): max entries and lifetime in seconds
+QUERY_CACHE_SIZE = int(os.getenv('ETL_QUERY_CACHE_SIZE', 256))
+QUERY_CACHE_TTL = float(os.getenv('ETL_QUERY_CACHE_TTL', 300))
+
+# Memory-mapped float32 traffic cube (src.cube): directory of the array and its sidecar
+CUBE_DIR = Path(os.getenv('ETL_CUBE_DIR', BASE_DIR / '.cache' / 'cube'))
+
+# Per-day sparse origin-destination matrices of the mobility data (src.od_matrix)
+OD_CACHE_DIR = Path(os.getenv('ETL_OD_CACHE_DIR', BASE_DIR / '.cache' / 'od'))
+
+# Pipeline metrics: Prometheus textfile written after each stage and/or pushgateway URL (empty = off)
+METRICS_TEXTFILE = os.getenv('ETL_METRICS_TEXTFILE', '')
+PUSHGATEWAY_URL = os.getenv('ETL_PUSHGATEWAY_URL', '')
+METRICS_JOB = os.getenv('ETL_METRICS_JOB', 'milan_etl')
@@ -0,0 +1,233 @@
+import io
+import json
+import logging
+import time
+import numpy as np
+import pandas as pd
+from .config import CUBE_DIR
+from .database import get_sqlalchemy_engine
+from .layout import get_layout
+from .manifest import STATUS_LOADED, read_manifest
+from .parsing import METRIC_COLS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# The cube is CUBE_DIR/traffic.f32, a raw C-order float32 array shaped
+# (time slot, cell, metric), and CUBE_DIR/traffic.json describing its time axis and
+# which source files it holds. Time is the outer axis, so appending a day only grows the file.
+DATA_FILE = 'traffic.f32'
+META_FILE = 'traffic.json'
+
+CELLS = 10_000
+SLOT_MINUTES = 10
+DTYPE = np.float32
+FORMAT_VERSION = 1
+
+_SLOT = pd.Timedelta(minutes=SLOT_MINUTES)
+
+
+def _read_meta(directory):
+    path = directory / META_FILE
+    if not path.exists():
+        return None
+    meta = json.loads(path.read_text())
+    return meta if meta.get('format') == FORMAT_VERSION else None
+
+
+def _write_meta(directory, meta):
+    path = directory / META_FILE
+    tmp_path = path.with_suffix('.tmp')
+    tmp_path.write_text(json.dumps(meta, indent=1))
+    tmp_path.replace(path)
+
+
+def _new_meta(start, timezone):
+    return {
+        'format': FORMAT_VERSION,
+        'dtype': np.dtype(DTYPE).name,
+        'start': start.isoformat(),
+        'timezone': timezone,
+        'slot_minutes': SLOT_MINUTES,
+        'slots': 0,
+        'cells': CELLS,
+        'metrics': METRIC_COLS,
+        'files': {},
+    }
+
+
+def _open(directory, slots, mode):
+    if slots == 0:
+        # np.memmap cannot map an empty file; nothing is mapped until the first slots are written
+        return np.zeros((0, CELLS, len(METRIC_COLS)), dtype=DTYPE)
+    path = directory / DATA_FILE
+    size = slots * CELLS * len(METRIC_COLS) * np.dtype(DTYPE).itemsize
+    if mode == 'r+' and (not path.exists() or path.stat().st_size < size):
+        # Growing the file leaves the new slots zero-filled (sparse where supported)
+        with open(path, 'ab') as f:
+            f.truncate(size)
+    return np.memmap(path, dtype=DTYPE, mode=mode, shape=(slots, CELLS, len(METRIC_COLS)))
+
+
+def _slot(start, ts):
+    return int((pd.Timestamp(ts) - start) // _SLOT)
+
+
+def _fetch_slots(conn, source, start, first, last):
+    """Per (slot, cell) sums over the countries of the rows between ``first`` and ``last``."""
+    sums = ', '.join(f"SUM({col})" for col in METRIC_COLS)
+    cursor = conn.connection.cursor()
+    try:
+        query = cursor.mogrify(f"""
+            SELECT CAST(FLOOR(EXTRACT(EPOCH FROM datetime - %(start)s) / {SLOT_MINUTES * 60}) AS INTEGER),
+                   cell_id, {sums}
+            FROM {source}
+            WHERE datetime BETWEEN %(first)s AND %(last)s
+            GROUP BY 1, 2
+        """, {'start': start.to_pydatetime(), 'first': first, 'last': last}).decode()
+        buffer = io.StringIO()
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+    buffer.seek(0)
+    return pd.read_csv(
+        buffer, header=None, names=['slot', 'cell_id'] + METRIC_COLS,
+        dtype={'slot': np.int64, 'cell_id': np.int64, **{col: DTYPE for col in METRIC_COLS}}
+    )
+
+
+def export_traffic_cube(directory=None, engine=None, rebuild=False):
+    """Write the loaded traffic into the on-disk cube, only for files loaded since the last export.
+
+    Each source file maps to the slots of its time range: a reloaded file has its slots
+    cleared and rewritten, a file no longer in the manifest has them cleared, and new days
+    grow the array. Data earlier than the cube start triggers a full rebuild.
+    Returns the number of files written.
+    """
+    directory = directory or CUBE_DIR
+    engine = engine or get_sqlalchemy_engine()
+    try:
+        start_time = time.perf_counter()
+        directory.mkdir(parents=True, exist_ok=True)
+        entries = {
+            name: entry for name, entry in read_manifest(engine, 'fact_traffic_milan').items()
+            if entry['status'] == STATUS_LOADED and entry['min_datetime'] is not None
+        }
+        if not entries:
+            logger.warning("⚠ No loaded traffic files to export to the cube")
+            return 0
+
+        with engine.connect() as conn:
+            timezone = conn.exec_driver_sql("SHOW TimeZone").scalar()
+            source = 'fact_traffic_cell_totals' if get_layout(conn) == 'wide' else 'fact_traffic_milan'
+
+        earliest = pd.Timestamp(min(entry['min_datetime'] for entry in entries.values()))
+        meta = None if rebuild else _read_meta(directory)
+        if meta is None or earliest < pd.Timestamp(meta['start']):
+            meta = _new_meta(earliest.tz_convert(timezone).normalize(), timezone)
+            (directory / DATA_FILE).unlink(missing_ok=True)
+        start = pd.Timestamp(meta['start'])
+
+        stale = [name for name in meta['files'] if name not in entries]
+        pending = [
+            name for name, entry in entries.items()
+            if meta['files'].get(name, {}).get('loaded_at') != entry['loaded_at'].isoformat()
+        ]
+        if not stale and not pending:
+            logger.info("✓ Traffic cube up to date")
+            return 0
+
+        slots = max(meta['slots'], max(_slot(start, entry['max_datetime']) + 1 for entry in entries.values()))
+        cube = _open(directory, slots, 'r+')
+        for name in stale + pending:
+            previous = meta['files'].pop(name, None)
+            if previous is not None:
+                cube[previous['first_slot']:previous['last_slot'] + 1] = 0
+
+        with engine.connect() as conn:
+            for name in sorted(pending):
+                entry = entries[name]
+                df = _fetch_slots(conn, source, start, entry['min_datetime'], entry['max_datetime'])
+                cube[df['slot'].to_numpy(), df['cell_id'].to_numpy()] = df[METRIC_COLS].to_numpy()
+                meta['files'][name] = {
+                    'loaded_at': entry['loaded_at'].isoformat(),
+                    'first_slot': _slot(start, entry['min_datetime']),
+                    'last_slot': _slot(start, entry['max_datetime']),
+                }
+                logger.info(f"    - {name}: {len(df)} cell slots written to the cube")
+
+        cube.flush()
+        del cube
+        meta['slots'] = slots
+        _write_meta(directory, meta)
+        logger.info(
+            f"✓ Traffic cube {directory / DATA_FILE}: {len(pending)} files written, {len(stale)} cleared, "
+            f"{slots} slots x {CELLS} cells in {time.perf_counter() - start_time:.2f}s"
+        )
+        return len(pending)
+    except Exception as e:
+        logger.error(f"Traffic cube export error: {e}")
+        raise
+
+
+class TrafficCube:
+    """Read-only, memory-mapped view of the exported traffic cube.
+
+    Slices are views on the mapped file (no copy): ``cube.day('2013-11-04')`` is every cell
+    for one day, ``cube.cell(5060, '2013-11-01', '2014-01-01')`` one cell over two months.
+    Arrays are shaped (slot, cell, metric) with the metrics in ``cube.metrics`` order.
+    Naive times are taken in the database time zone recorded at export.
+    """
+
+    def __init__(self, directory=None):
+        directory = directory or CUBE_DIR
+        meta = _read_meta(directory)
+        if meta is None:
+            raise FileNotFoundError(f"No traffic cube in {directory}, run export_traffic_cube() first")
+        self.meta = meta
+        self.start = pd.Timestamp(meta['start'])
+        self.timezone = meta['timezone']
+        self.metrics = list(meta['metrics'])
+        self.data = _open(directory, meta['slots'], 'r')
+
+    @property
+    def times(self):
+        """Start time of each slot."""
+        return pd.date_range(self.start, periods=len(self.data), freq=_SLOT)
+
+    def slot(self, ts):
+        """Index of the slot containing ``ts`` (may fall outside the cube)."""
+        ts = pd.Timestamp(ts)
+        if ts.tzinfo is None:
+            ts = ts.tz_localize(self.timezone)
+        return _slot(self.start, ts)
+
+    def _slots(self, start, end):
+        first = 0 if start is None else max(self.slot(start), 0)
+        last = len(self.data) if end is None else min(max(self.slot(end), 0), len(self.data))
+        return slice(first, max(first, last))
+
+    def _metric(self, metric):
+        if metric is None:
+            return slice(None)
+        if metric not in self.metrics:
+            raise ValueError(f"Unknown metric '{metric}', expected one of {self.metrics}")
+        return self.metrics.index(metric)
+
+    def window(self, start=None, end=None, first_cell=0, last_cell=CELLS - 1, metric=None):
+        """Slots in [start, end) of cells ``first_cell``..``last_cell``; one metric drops that axis."""
+        return self.data[self._slots(start, end), first_cell:last_cell + 1, self._metric(metric)]
+
+    def day(self, day, metric=None):
+        """Every cell for one calendar day, shaped (144, cells[, metrics])."""
+        start = pd.Timestamp(day).normalize()
+        return self.window(start, start + pd.Timedelta(days=1), metric=metric)
+
+    def cell(self, cell_id, start=None, end=None, metric=None):
+        """One cell over [start, end), shaped (slots[, metrics])."""
+        return self.data[self._slots(start, end), cell_id, self._metric(metric)]
+
+    def cell_frame(self, cell_id, start=None, end=None):
+        """One cell over [start, end) as a DataFrame indexed by slot start (copies the values)."""
+        slots = self._slots(start, end)
+        return pd.DataFrame(self.data[slots, cell_id], index=self.times[slots], columns=self.metrics)
@@ -1,23 +1,55 @@
+import io
+import os
 import psycopg2
+from sqlalchemy import text
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 from sqlalchemy import create_engine
 import logging
-from .config import DB_CONFIG
+from .config import DB_CONFIG, DB_POOL, GRANULARITIES, LAYOUTS
+from .layout import get_layout
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+_engine = None
+
+
 def get_connection():
-    return psycopg2.connect(**DB_CONFIG)
+    """A pooled psycopg2 connection; ``close()`` returns it to the pool."""
+    return get_sqlalchemy_engine().raw_connection()
 
 
 def get_sqlalchemy_engine():
-    connection_string = (
-        f"postgresql://{DB_CONFIG['user']}:{DB_CONFIG['password']}@"
-        f"{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['dbname']}"
-    )
-    return create_engine(connection_string)
+    """Return the process-wide pooled engine, created on first use."""
+    global _engine
+    if _engine is None:
+        connection_string = (
+            f"postgresql://{DB_CONFIG['user']}:{DB_CONFIG['password']}@"
+            f"{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['dbname']}"
+        )
+        connect_args = {}
+        if DB_POOL['statement_timeout_ms']:
+            connect_args['options'] = f"-c statement_timeout={DB_POOL['statement_timeout_ms']}"
+        _engine = create_engine(
+            connection_string,
+            pool_size=DB_POOL['size'],
+            max_overflow=DB_POOL['max_overflow'],
+            pool_pre_ping=DB_POOL['pre_ping'],
+            pool_recycle=DB_POOL['recycle'],
+            connect_args=connect_args
+        )
+    return _engine
+
+
+def _reset_engine_after_fork():
+    # A forked worker must not reuse the parent's sockets: drop the inherited pool
+    # without closing its connections, the child then opens its own.
+    if _engine is not None:
+        _engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_reset_engine_after_fork)
 
 
 def create_database():
@@ -55,10 +87,208 @@ def create_database():
         raise
 
 
-def create_schema(drop_existing: bool = False):
+def _fact_tables_sql(layout, by_datetime):
+    if layout == 'standard':
+        return f"""
+    CREATE TABLE IF NOT EXISTS fact_traffic_milan (
+        datetime TIMESTAMPTZ NOT NULL,
+        cell_id INTEGER NOT NULL REFERENCES dim_grid_milan(cell_id),
+        countrycode INTEGER NOT NULL,
+        smsin NUMERIC DEFAULT 0 NOT NULL CHECK (smsin >= 0), 
+        smsout NUMERIC DEFAULT 0 NOT NULL CHECK (smsout >= 0),
+        callin NUMERIC DEFAULT 0 NOT NULL CHECK (callin >= 0), 
+        callout NUMERIC DEFAULT 0 NOT NULL CHECK (callout >= 0),
+        internet NUMERIC DEFAULT 0 NOT NULL CHECK (internet >= 0),
+        PRIMARY KEY (datetime, cell_id, countrycode)
+    ){by_datetime};
+
+    CREATE TABLE IF NOT EXISTS fact_mobility_provinces (
+        datetime TIMESTAMPTZ NOT NULL,
+        cell_id INTEGER NOT NULL REFERENCES dim_grid_milan(cell_id),
+        provincia VARCHAR(50) NOT NULL REFERENCES dim_provinces_it(provincia),
+        cell2province NUMERIC DEFAULT 0 NOT NULL CHECK (cell2province >= 0),
+        province2cell NUMERIC DEFAULT 0 NOT NULL CHECK (province2cell >= 0),
+        PRIMARY KEY (datetime, cell_id, provincia)
+    ){by_datetime};"""
+
+    # Fixed-width columns from the widest to the narrowest: 8 + 5*4 + 2*2 bytes, no padding
+    sql = f"""
+    CREATE TABLE IF NOT EXISTS dim_country (
+        country_key SMALLINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        countrycode INTEGER NOT NULL UNIQUE
+    );
+
+    CREATE TABLE IF NOT EXISTS fact_traffic_milan (
+        datetime TIMESTAMPTZ NOT NULL,
+        smsin REAL DEFAULT 0 NOT NULL CHECK (smsin >= 0),
+        smsout REAL DEFAULT 0 NOT NULL CHECK (smsout >= 0),
+        callin REAL DEFAULT 0 NOT NULL CHECK (callin >= 0),
+        callout REAL DEFAULT 0 NOT NULL CHECK (callout >= 0),
+        internet REAL DEFAULT 0 NOT NULL CHECK (internet >= 0),
+        cell_id SMALLINT NOT NULL REFERENCES dim_grid_milan(cell_id),
+        country_key SMALLINT NOT NULL REFERENCES dim_country(country_key),
+        PRIMARY KEY (datetime, cell_id, country_key)
+    ){by_datetime};
+
+    CREATE TABLE IF NOT EXISTS fact_mobility_provinces (
+        datetime TIMESTAMPTZ NOT NULL,
+        cell2province REAL DEFAULT 0 NOT NULL CHECK (cell2province >= 0),
+        province2cell REAL DEFAULT 0 NOT NULL CHECK (province2cell >= 0),
+        cell_id SMALLINT NOT NULL REFERENCES dim_grid_milan(cell_id),
+        provincia VARCHAR(50) NOT NULL REFERENCES dim_provinces_it(provincia),
+        PRIMARY KEY (datetime, cell_id, provincia)
+    ){by_datetime};"""
+    if layout == 'wide':
+        sql += f"""
+
+    CREATE TABLE IF NOT EXISTS fact_traffic_cell_totals (
+        datetime TIMESTAMPTZ NOT NULL,
+        smsin REAL NOT NULL,
+        smsout REAL NOT NULL,
+        callin REAL NOT NULL,
+        callout REAL NOT NULL,
+        internet REAL NOT NULL,
+        cell_id SMALLINT NOT NULL,
+        countries SMALLINT NOT NULL,
+        PRIMARY KEY (datetime, cell_id)
+    ){by_datetime};"""
+    return sql
+
+
+def _hourly_sums(layout):
+    """Source table and SUM() expressions of the hourly rollup for a storage layout."""
+    source = 'fact_traffic_cell_totals' if layout == 'wide' else 'fact_traffic_milan'
+    # REAL measures are summed in double precision, so the totals do not drift with row count
+    cast = "CAST({} AS DOUBLE PRECISION)" if layout != 'standard' else "{}"
+    sums = [f"SUM({cast.format(col)})" for col in ('smsin', 'smsout', 'callin', 'callout', 'internet')]
+    sums.append(f"SUM({cast.format('smsin + smsout + callin + callout + internet')})")
+    return source, sums
+
+
+def _hourly_tables_sql(layout, by_hour):
+    source, sums = _hourly_sums(layout)
+    total_type = 'NUMERIC' if layout == 'standard' else 'DOUBLE PRECISION'
+    cell_type = 'INTEGER' if layout == 'standard' else 'SMALLINT'
+    return f"""
+    CREATE OR REPLACE VIEW v_hourly_traffic AS
+    SELECT 
+        DATE_TRUNC('hour', datetime) AS hour,
+        cell_id,
+        {sums[0]} AS total_smsin,
+        {sums[1]} AS total_smsout,
+        {sums[2]} AS total_callin,
+        {sums[3]} AS total_callout,
+        {sums[4]} AS total_internet,
+        {sums[5]} AS total_activity
+    FROM {source} 
+    GROUP BY 1, 2;
+
+    CREATE TABLE IF NOT EXISTS agg_hourly_traffic (
+        hour TIMESTAMPTZ NOT NULL,
+        total_smsin {total_type} NOT NULL,
+        total_smsout {total_type} NOT NULL,
+        total_callin {total_type} NOT NULL,
+        total_callout {total_type} NOT NULL,
+        total_internet {total_type} NOT NULL,
+        total_activity {total_type} NOT NULL,
+        cell_id {cell_type} NOT NULL,
+        PRIMARY KEY (hour, cell_id)
+    ){by_hour};"""
+
+
+def _existing_layout(requested):
+    """Layout of the fact tables already in the database, or ``requested`` when there are none.
+
+    Schemas created before layouts existed have no 'layout' setting and use 'standard'.
+    """
+    with get_sqlalchemy_engine().connect() as conn:
+        if conn.execute(text("SELECT to_regclass('fact_traffic_milan') IS NULL")).scalar():
+            return requested
+        has_settings = conn.execute(text("SELECT to_regclass('etl_schema_settings') IS NOT NULL")).scalar()
+        existing = get_layout(conn) if has_settings else 'standard'
+    if existing != requested:
+        logger.warning(
+            f"⚠ Existing schema uses layout '{existing}', requested '{requested}' "
+            f"was not applied (recreate the schema with drop_existing=True)"
+        )
+    return existing
+
+
+def _existing_partitioning(requested):
+    """Partitioning of the fact tables already in the database, or ``requested`` when there are none.
+
+    Whether the tables are partitioned is read from pg_partitioned_table, so the rollup and
+    the stored setting follow the fact tables even when etl_schema_settings is missing.
+    """
+    with get_sqlalchemy_engine().connect() as conn:
+        if conn.execute(text("SELECT to_regclass('fact_traffic_milan') IS NULL")).scalar():
+            return requested
+        partitioned = conn.execute(text(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'fact_traffic_milan'::regclass)"
+        )).scalar()
+        has_settings = conn.execute(text("SELECT to_regclass('etl_schema_settings') IS NOT NULL")).scalar()
+        existing = None
+        if partitioned and has_settings:
+            existing = conn.execute(text("SELECT value FROM etl_schema_settings WHERE key = 'partitioning'")).scalar()
+        if partitioned and existing not in GRANULARITIES:
+            existing = requested
+    if existing != requested:
+        logger.warning(
+            f"⚠ Existing schema uses partitioning '{existing or 'none'}', requested '{requested or 'none'}' "
+            f"was not applied (recreate the schema with drop_existing=True)"
+        )
+    return existing
+
+
+def _ensure_mobility_key(cursor):
+    """Add the (datetime, cell_id, provincia) primary key to a mobility table created without it.
+
+    Older schemas let reloads duplicate rows; repeats of a key are deleted first, keeping one.
+    """
+    cursor.execute(
+        "SELECT 1 FROM pg_constraint WHERE conrelid = 'fact_mobility_provinces'::regclass AND contype = 'p'"
+    )
+    if cursor.fetchone():
+        return
+    cursor.execute("""
+        DELETE FROM fact_mobility_provinces a
+        USING fact_mobility_provinces b
+        WHERE a.datetime = b.datetime AND a.cell_id = b.cell_id AND a.provincia = b.provincia
+          AND a.ctid > b.ctid
+    """)
+    removed = cursor.rowcount
+    cursor.execute("ALTER TABLE fact_mobility_provinces ADD PRIMARY KEY (datetime, cell_id, provincia)")
+    logger.warning(f"⚠ Added the fact_mobility_provinces primary key, {removed} duplicate rows removed")
+
+
+def create_schema(drop_existing: bool = False, partitioning: str = None, layout: str = None):
+    """Create the schema; ``partitioning`` ('daily' or 'weekly') range-partitions the fact tables on time.
+
+    ``layout`` picks the fact table storage: 'standard', 'compact' or 'wide' (see src.layout).
+    """
+    if partitioning not in (None, 'none') + GRANULARITIES:
+        raise ValueError(f"Unknown partitioning '{partitioning}', expected one of {GRANULARITIES}")
+    layout = layout or 'standard'
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout '{layout}', expected one of {LAYOUTS}")
+    partitioning = None if partitioning == 'none' else partitioning
+    if not drop_existing:
+        layout = _existing_layout(layout)
+        partitioning = _existing_partitioning(partitioning)
+    by_datetime = " PARTITION BY RANGE (datetime)" if partitioning else ""
+    by_hour = " PARTITION BY RANGE (hour)" if partitioning else ""
+
     drop_sql = "" if not drop_existing else """
+    DROP TABLE IF EXISTS etl_schema_settings CASCADE;
+    DROP TABLE IF EXISTS etl_deferred_objects CASCADE;
+    DROP TABLE IF EXISTS etl_load_manifest CASCADE;
+    DROP TABLE IF EXISTS agg_hourly_traffic CASCADE;
+    DROP TABLE IF EXISTS fact_traffic_cell_totals CASCADE;
     DROP TABLE IF EXISTS fact_mobility_provinces CASCADE;
     DROP TABLE IF EXISTS fact_traffic_milan CASCADE;
+    DROP TABLE IF EXISTS dim_country CASCADE;
+    DROP TABLE IF EXISTS dim_cell_neighbours CASCADE;
+    DROP TABLE IF EXISTS dim_cell_province CASCADE;
     DROP TABLE IF EXISTS dim_provinces_it CASCADE;
     DROP TABLE IF EXISTS dim_grid_milan CASCADE;
     """
@@ -78,52 +308,79 @@ def create_schema(drop_existing: bool = False):
         population INTEGER DEFAULT 0 CHECK (population >= 0)
     );
 
-    CREATE TABLE IF NOT EXISTS fact_traffic_milan (
-        datetime TIMESTAMPTZ NOT NULL,
+    CREATE TABLE IF NOT EXISTS dim_cell_province (
         cell_id INTEGER NOT NULL REFERENCES dim_grid_milan(cell_id),
-        countrycode INTEGER NOT NULL,
-        smsin NUMERIC DEFAULT 0 NOT NULL CHECK (smsin >= 0), 
-        smsout NUMERIC DEFAULT 0 NOT NULL CHECK (smsout >= 0),
-        callin NUMERIC DEFAULT 0 NOT NULL CHECK (callin >= 0), 
-        callout NUMERIC DEFAULT 0 NOT NULL CHECK (callout >= 0),
-        internet NUMERIC DEFAULT 0 NOT NULL CHECK (internet >= 0),
-        PRIMARY KEY (datetime, cell_id, countrycode)
+        provincia VARCHAR(50) NOT NULL REFERENCES dim_provinces_it(provincia),
+        overlap_area DOUBLE PRECISION NOT NULL CHECK (overlap_area > 0),
+        weight DOUBLE PRECISION NOT NULL CHECK (weight > 0),
+        PRIMARY KEY (cell_id, provincia)
     );
 
-    CREATE TABLE IF NOT EXISTS fact_mobility_provinces (
-        datetime TIMESTAMPTZ NOT NULL,
+    CREATE TABLE IF NOT EXISTS dim_cell_neighbours (
         cell_id INTEGER NOT NULL REFERENCES dim_grid_milan(cell_id),
-        provincia VARCHAR(50) NOT NULL REFERENCES dim_provinces_it(provincia),
-        cell2province NUMERIC DEFAULT 0 NOT NULL CHECK (cell2province >= 0),
-        province2cell NUMERIC DEFAULT 0 NOT NULL CHECK (province2cell >= 0)
+        neighbour_id INTEGER NOT NULL REFERENCES dim_grid_milan(cell_id),
+        shared_length DOUBLE PRECISION NOT NULL,
+        PRIMARY KEY (cell_id, neighbour_id)
     );
 
-    CREATE OR REPLACE VIEW v_hourly_traffic AS
-    SELECT 
-        DATE_TRUNC('hour', datetime) AS hour,
-        cell_id,
-        SUM(smsin) AS total_smsin,
-        SUM(smsout) AS total_smsout,
-        SUM(callin) AS total_callin,
-        SUM(callout) AS total_callout,
-        SUM(internet) AS total_internet,
-        SUM(smsin + smsout + callin + callout + internet) AS total_activity
-    FROM fact_traffic_milan 
-    GROUP BY 1, 2;
+    {_fact_tables_sql(layout, by_datetime)}
+
+    CREATE TABLE IF NOT EXISTS etl_load_manifest (
+        target_table VARCHAR(64) NOT NULL,
+        file_name TEXT NOT NULL,
+        file_size BIGINT NOT NULL,
+        file_mtime DOUBLE PRECISION,
+        content_hash CHAR(32) NOT NULL,
+        rows_read BIGINT,
+        rows_loaded BIGINT,
+        rows_rejected BIGINT,
+        min_datetime TIMESTAMPTZ,
+        max_datetime TIMESTAMPTZ,
+        status VARCHAR(16) NOT NULL,
+        error TEXT,
+        loaded_at TIMESTAMP DEFAULT NOW(),
+        PRIMARY KEY (target_table, file_name)
+    );
+
+    {_hourly_tables_sql(layout, by_hour)}
+
+    CREATE TABLE IF NOT EXISTS etl_schema_settings (
+        key VARCHAR(64) PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS etl_deferred_objects (
+        object_name VARCHAR(64) PRIMARY KEY,
+        table_name VARCHAR(64) NOT NULL,
+        kind VARCHAR(16) NOT NULL,
+        definition TEXT NOT NULL,
+        deferred_at TIMESTAMP DEFAULT NOW()
+    );
+
+    INSERT INTO etl_schema_settings (key, value)
+    VALUES ('partitioning', '{partitioning or 'none'}')
+    ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value;
+
+    INSERT INTO etl_schema_settings (key, value)
+    VALUES ('layout', '{layout}')
+    ON CONFLICT (key) DO NOTHING;
 
     CREATE INDEX IF NOT EXISTS idx_grid_geom ON dim_grid_milan USING GIST(geometry);
+    CREATE INDEX IF NOT EXISTS idx_cell_province_provincia ON dim_cell_province(provincia);
     CREATE INDEX IF NOT EXISTS idx_traffic_time ON fact_traffic_milan(datetime);
     CREATE INDEX IF NOT EXISTS idx_traffic_cell ON fact_traffic_milan(cell_id);
     CREATE INDEX IF NOT EXISTS idx_traffic_composite ON fact_traffic_milan(cell_id, datetime);
     CREATE INDEX IF NOT EXISTS idx_mobility_provincia ON fact_mobility_provinces(provincia);
     CREATE INDEX IF NOT EXISTS idx_mobility_cell ON fact_mobility_provinces(cell_id);
     CREATE INDEX IF NOT EXISTS idx_mobility_datetime ON fact_mobility_provinces(datetime);
+    CREATE INDEX IF NOT EXISTS idx_hourly_cell ON agg_hourly_traffic(cell_id);
     """
     
     try:
         conn = get_connection()
         cursor = conn.cursor()
         cursor.execute(schema_sql)
+        _ensure_mobility_key(cursor)
         conn.commit()
         logger.info("Schema created successfully")
         cursor.close()
@@ -152,3 +409,121 @@ def execute_query(query, fetch=True):
     except Exception as e:
         logger.error(f"Query execution error: {e}")
         raise
+
+
+def copy_payload(df, columns=None):
+    """Render ``columns`` of a DataFrame as the CSV text copy_dataframe() sends to COPY."""
+    buffer = io.StringIO()
+    df.to_csv(buffer, columns=list(columns or df.columns), header=False, index=False)
+    buffer.seek(0)
+    return buffer
+
+
+def copy_dataframe(df, table, conn, columns=None, payload=None):
+    """Stream a DataFrame into ``table`` with COPY FROM STDIN (CSV text format).
+
+    ``conn`` is an open SQLAlchemy connection; the COPY runs inside its transaction.
+    ``payload`` is the frame already rendered by copy_payload() with the same columns.
+    """
+    columns = list(columns or df.columns)
+    buffer = payload if payload is not None else copy_payload(df, columns)
+
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+    finally:
+        cursor.close()
+
+
+def _hour_window(ranges, params):
+    """Hour-aligned (low, high) SQL bounds covering every (start, end) pair, or None if all are empty."""
+    ranges = [(start, end) for start, end in ranges if start is not None]
+    if not ranges:
+        return None
+    starts, ends = [], []
+    for i, (start, end) in enumerate(ranges):
+        params[f'start_{i}'], params[f'end_{i}'] = start, end
+        starts.append(f"CAST(:start_{i} AS timestamptz)")
+        ends.append(f"CAST(:end_{i} AS timestamptz)")
+    low = f"DATE_TRUNC('hour', LEAST({', '.join(starts)}))"
+    high = f"DATE_TRUNC('hour', GREATEST({', '.join(ends)})) + INTERVAL '1 hour'"
+    return low, high
+
+
+def refresh_cell_totals(conn, ranges=None):
+    """Recompute fact_traffic_cell_totals (wide layout) for the hours touched by ``ranges``.
+
+    Same contract as refresh_hourly_traffic(), which calls it first in the wide layout and
+    then computes the rollup from these totals. Returns the rows written.
+    """
+    params = {}
+    if ranges is None:
+        fact_filter = "TRUE"
+    else:
+        window = _hour_window(ranges, params)
+        if window is None:
+            return 0
+        fact_filter = f"datetime >= {window[0]} AND datetime < {window[1]}"
+
+    conn.execute(text(f"DELETE FROM fact_traffic_cell_totals WHERE {fact_filter}"), params)
+    result = conn.execute(text(f"""
+        INSERT INTO fact_traffic_cell_totals (
+            datetime, smsin, smsout, callin, callout, internet, cell_id, countries
+        )
+        SELECT datetime, SUM(smsin), SUM(smsout), SUM(callin), SUM(callout), SUM(internet), cell_id, COUNT(*)
+        FROM fact_traffic_milan
+        WHERE {fact_filter}
+        GROUP BY datetime, cell_id
+        """), params)
+    return result.rowcount
+
+
+def refresh_hourly_traffic(conn, ranges=None, layout=None):
+    """Recompute agg_hourly_traffic for the hours touched by ``ranges`` ((start, end) pairs).
+
+    With ``ranges=None`` the whole rollup is rebuilt. Runs inside the caller's transaction
+    so it commits atomically with the fact rows it summarizes. In the wide layout the
+    per-cell totals are refreshed first and the rollup is computed from them.
+    Returns the rows written.
+    """
+    layout = layout or get_layout(conn)
+    if layout == 'wide':
+        refresh_cell_totals(conn, ranges)
+
+    params = {}
+    if ranges is None:
+        agg_filter = fact_filter = "TRUE"
+    else:
+        window = _hour_window(ranges, params)
+        if window is None:
+            return 0
+        low, high = window
+        agg_filter = f"hour >= {low} AND hour < {high}"
+        fact_filter = f"datetime >= {low} AND datetime < {high}"
+
+    source, sums = _hourly_sums(layout)
+    conn.execute(text(f"DELETE FROM agg_hourly_traffic WHERE {agg_filter}"), params)
+    result = conn.execute(text(f"""
+        INSERT INTO agg_hourly_traffic (
+            hour, cell_id, total_smsin, total_smsout, total_callin, total_callout,
+            total_internet, total_activity
+        )
+        SELECT
+            DATE_TRUNC('hour', datetime) AS hour,
+            cell_id,
+            {', '.join(sums)}
+        FROM {source}
+        WHERE {fact_filter}
+        GROUP BY 1, 2
+        ON CONFLICT (hour, cell_id) DO UPDATE SET
+            total_smsin = EXCLUDED.total_smsin,
+            total_smsout = EXCLUDED.total_smsout,
+            total_callin = EXCLUDED.total_callin,
+            total_callout = EXCLUDED.total_callout,
+            total_internet = EXCLUDED.total_internet,
+            total_activity = EXCLUDED.total_activity
+        """), params)
+    return result.rowcount
@@ -0,0 +1,183 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
+from .config import INDEX_WORKERS, INDEX_BUILD_MEM
+from .database import get_sqlalchemy_engine
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFERRED_TABLE = 'etl_deferred_objects'
+
+# Fact tables whose secondary indexes and foreign keys can be deferred during a bulk load.
+# Primary keys are kept: they reject duplicate rows and serve the per-file delete and rollup.
+BULK_TABLES = ('fact_traffic_milan', 'fact_mobility_provinces')
+
+KIND_INDEX = 'index'
+KIND_FOREIGN_KEY = 'foreign_key'
+
+
+def pending_deferred_objects(engine):
+    """Return the stashed (dropped, not yet rebuilt) indexes and foreign keys."""
+    with engine.connect() as conn:
+        return conn.execute(text(
+            f"SELECT object_name, table_name, kind, definition FROM {DEFERRED_TABLE} ORDER BY deferred_at, object_name"
+        )).mappings().all()
+
+
+def defer_secondary_objects(tables=BULK_TABLES):
+    """Drop the secondary indexes and foreign keys of ``tables`` ahead of a bulk load.
+
+    Definitions are stashed in etl_deferred_objects first, so an interrupted load can
+    still restore them with rebuild_deferred_objects().
+    """
+    try:
+        engine = get_sqlalchemy_engine()
+        with engine.begin() as conn:
+            indexes = conn.execute(text("""
+                SELECT c.relname AS object_name, t.relname AS table_name,
+                       pg_get_indexdef(i.indexrelid) AS definition
+                FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                JOIN pg_class t ON t.oid = i.indrelid
+                WHERE t.relname = ANY(:tables)
+                  AND NOT i.indisunique
+                  AND NOT EXISTS (SELECT 1 FROM pg_constraint k WHERE k.conindid = i.indexrelid)
+            """), {'tables': list(tables)}).mappings().all()
+            foreign_keys = conn.execute(text("""
+                SELECT k.conname AS object_name, t.relname AS table_name,
+                       pg_get_constraintdef(k.oid) AS definition
+                FROM pg_constraint k
+                JOIN pg_class t ON t.oid = k.conrelid
+                WHERE t.relname = ANY(:tables) AND k.contype = 'f' AND k.conparentid = 0
+            """), {'tables': list(tables)}).mappings().all()
+
+            for index in indexes:
+                # Keep only the access method and key ("USING btree (cell_id)") so the
+                # definition can be replayed on the parent and on each partition.
+                using = index['definition'][index['definition'].index(' USING ') + 1:]
+                _stash(conn, index['object_name'], index['table_name'], KIND_INDEX, using)
+                conn.execute(text(f"DROP INDEX {index['object_name']}"))
+            for fk in foreign_keys:
+                _stash(conn, fk['object_name'], fk['table_name'], KIND_FOREIGN_KEY, fk['definition'])
+                conn.execute(text(f"ALTER TABLE {fk['table_name']} DROP CONSTRAINT {fk['object_name']}"))
+
+        logger.info(
+            f"✓ Deferred {len(indexes)} indexes and {len(foreign_keys)} foreign keys "
+            f"on {', '.join(tables)} until the end of the load"
+        )
+    except Exception as e:
+        logger.error(f"Index deferral error: {e}")
+        raise
+
+
+def _stash(conn, name, table, kind, definition):
+    conn.execute(
+        text(f"""
+        INSERT INTO {DEFERRED_TABLE} (object_name, table_name, kind, definition)
+        VALUES (:name, :table, :kind, :definition)
+        ON CONFLICT (object_name) DO NOTHING
+        """),
+        {'name': name, 'table': table, 'kind': kind, 'definition': definition}
+    )
+
+
+def _unstash(conn, name):
+    conn.execute(text(f"DELETE FROM {DEFERRED_TABLE} WHERE object_name = :name"), {'name': name})
+
+
+def _partitions(conn, table):
+    return conn.execute(text("""
+        SELECT inhrelid::regclass::text FROM pg_inherits
+        WHERE inhparent = CAST(:table AS regclass) ORDER BY 1
+    """), {'table': table}).scalars().all()
+
+
+def _run_ddl(engine, statements):
+    """Run DDL statements in autocommit on a connection of their own (one index build per thread)."""
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text(f"SET maintenance_work_mem = '{INDEX_BUILD_MEM}'"))
+        try:
+            for statement in statements:
+                conn.execute(text(statement))
+        finally:
+            conn.execute(text("RESET maintenance_work_mem"))
+
+
+def _index_builds(conn, index):
+    """Statements building one stashed index, as independent jobs that can run in parallel.
+
+    On a partitioned table the parent index is created ON ONLY the parent (no data scan)
+    and each partition's index is built separately and attached to it, so partitions are
+    indexed concurrently instead of one after another.
+    """
+    name, table, using = index['object_name'], index['table_name'], index['definition']
+    partitions = _partitions(conn, table)
+    if not partitions:
+        return [], [[f"CREATE INDEX IF NOT EXISTS {name} ON {table} {using}"]]
+
+    parent = [f"CREATE INDEX IF NOT EXISTS {name} ON ONLY {table} {using}"]
+    jobs = []
+    for partition in partitions:
+        child = f"{partition}_{name}"
+        jobs.append([
+            f"CREATE INDEX IF NOT EXISTS {child} ON {partition} {using}",
+            f"ALTER INDEX {name} ATTACH PARTITION {child}",
+        ])
+    return parent, jobs
+
+
+def rebuild_deferred_objects(workers=None):
+    """Rebuild the stashed indexes in parallel, then re-add and validate the foreign keys once.
+
+    Returns the seconds spent on indexes and on foreign keys.
+    """
+    try:
+        engine = get_sqlalchemy_engine()
+        pending = pending_deferred_objects(engine)
+        indexes = [obj for obj in pending if obj['kind'] == KIND_INDEX]
+        foreign_keys = [obj for obj in pending if obj['kind'] == KIND_FOREIGN_KEY]
+        timings = {'indexes': 0.0, 'foreign_keys': 0.0}
+
+        start = time.perf_counter()
+        if indexes:
+            jobs = []
+            with engine.begin() as conn:
+                for index in indexes:
+                    parent, index_jobs = _index_builds(conn, index)
+                    for statement in parent:
+                        conn.execute(text(statement))
+                    jobs.extend(index_jobs)
+
+            workers = max(1, min(workers or INDEX_WORKERS, len(jobs)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for future in [pool.submit(_run_ddl, engine, job) for job in jobs]:
+                    future.result()
+
+            with engine.begin() as conn:
+                for index in indexes:
+                    _unstash(conn, index['object_name'])
+            timings['indexes'] = time.perf_counter() - start
+            logger.info(
+                f"✓ Rebuilt {len(indexes)} indexes ({len(jobs)} builds, {workers} in parallel) "
+                f"in {timings['indexes']:.2f}s"
+            )
+
+        start = time.perf_counter()
+        for fk in foreign_keys:
+            # The cleaning step already enforces the cell range and the province list, so
+            # the constraint is checked here in a single pass instead of once per row.
+            with engine.begin() as conn:
+                conn.execute(text(
+                    f"ALTER TABLE {fk['table_name']} ADD CONSTRAINT {fk['object_name']} {fk['definition']}"
+                ))
+                _unstash(conn, fk['object_name'])
+        if foreign_keys:
+            timings['foreign_keys'] = time.perf_counter() - start
+            logger.info(f"✓ Validated {len(foreign_keys)} foreign keys in {timings['foreign_keys']:.2f}s")
+
+        return timings
+    except Exception as e:
+        logger.error(f"Index rebuild error: {e}")
+        raise
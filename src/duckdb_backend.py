@@ -0,0 +1,259 @@
+import logging
+import re
+import time
+import pandas as pd
+from .config import (
+    DUCKDB_PATH, DUCKDB_SOURCES, MILANO_GRID_FILE, PROVINCES_FILE, STAGING_DIR, TRAFFIC_PATTERN,
+    MOBILITY_PATTERN, CHUNK_ROWS
+)
+from .parsing import (
+    TRAFFIC_DTYPES, MOBILITY_DTYPES, METRIC_COLS, FLOW_COLS, MOBILITY_KEY, ProvinceNormalizer,
+    read_csv_chunks, clean_traffic_chunk, clean_mobility_chunk
+)
+from .sources import find_sources
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Postgres stores the metrics as NUMERIC parsed from the CSV text the loader writes, so
+# they go through the same text form (numpy's shortest repr) into an exact DECIMAL here.
+DECIMAL_TYPE = 'DECIMAL(38, 18)'
+
+SCHEMA_SQL = f"""
+CREATE TABLE dim_grid_milan (
+    cell_id INTEGER PRIMARY KEY,
+    bounds VARCHAR,
+    geometry BLOB
+);
+
+CREATE TABLE dim_provinces_it (
+    provincia VARCHAR PRIMARY KEY,
+    population INTEGER,
+    geometry BLOB
+);
+
+CREATE TABLE fact_traffic_milan (
+    datetime TIMESTAMP NOT NULL,
+    cell_id INTEGER NOT NULL,
+    countrycode INTEGER NOT NULL,
+    smsin {DECIMAL_TYPE} NOT NULL,
+    smsout {DECIMAL_TYPE} NOT NULL,
+    callin {DECIMAL_TYPE} NOT NULL,
+    callout {DECIMAL_TYPE} NOT NULL,
+    internet {DECIMAL_TYPE} NOT NULL
+);
+
+CREATE TABLE fact_mobility_provinces (
+    datetime TIMESTAMP NOT NULL,
+    cell_id INTEGER NOT NULL,
+    provincia VARCHAR NOT NULL,
+    cell2province {DECIMAL_TYPE} NOT NULL,
+    province2cell {DECIMAL_TYPE} NOT NULL,
+    PRIMARY KEY (datetime, cell_id, provincia)
+);
+"""
+
+ROLLUP_SQL = """
+CREATE TABLE agg_hourly_traffic AS
+SELECT
+    DATE_TRUNC('hour', datetime) AS hour,
+    cell_id,
+    SUM(smsin) AS total_smsin,
+    SUM(smsout) AS total_smsout,
+    SUM(callin) AS total_callin,
+    SUM(callout) AS total_callout,
+    SUM(internet) AS total_internet,
+    SUM(smsin + smsout + callin + callout + internet) AS total_activity
+FROM fact_traffic_milan
+GROUP BY 1, 2
+"""
+
+FACT_SOURCES = {
+    'fact_traffic_milan': {
+        'pattern': TRAFFIC_PATTERN,
+        'keys': ['datetime', 'cell_id', 'countrycode'],
+        'measures': METRIC_COLS,
+        'dtypes': TRAFFIC_DTYPES,
+        'merge_key': None,
+    },
+    'fact_mobility_provinces': {
+        'pattern': MOBILITY_PATTERN,
+        'keys': ['datetime', 'cell_id', 'provincia'],
+        'measures': FLOW_COLS,
+        'dtypes': MOBILITY_DTYPES,
+        'merge_key': MOBILITY_KEY,
+    },
+}
+
+
+def _require_duckdb():
+    if duckdb is None:
+        raise ImportError("The duckdb package is required for the DuckDB backend (pip install duckdb)")
+
+
+def _insert(con, table, df, target=None):
+    """Append a cleaned frame, formatting the measures exactly as copy_dataframe() does."""
+    spec = FACT_SOURCES[table]
+    frame = df[spec['keys']].assign(**{col: df[col].to_numpy().astype(str) for col in spec['measures']})
+    measures = [f"CAST({col} AS {DECIMAL_TYPE})" for col in spec['measures']]
+    con.register('chunk_frame', frame)
+    try:
+        con.execute(f"INSERT INTO {target or table} SELECT {', '.join(spec['keys'] + measures)} FROM chunk_frame")
+    finally:
+        con.unregister('chunk_frame')
+
+
+def _load_frames(con, table, frames):
+    """Append the cleaned frames of one source file.
+
+    Tables with a merge key are written as the Postgres loader writes them: rows of the
+    file sharing a key are summed and a key loaded from an earlier file is overwritten.
+    """
+    spec = FACT_SOURCES[table]
+    if spec['merge_key'] is None:
+        for df in frames:
+            _insert(con, table, df)
+        return
+    keys = ', '.join(spec['merge_key'])
+    sums = ', '.join(f"SUM({col})" for col in spec['measures'])
+    updates = ', '.join(f"{col} = EXCLUDED.{col}" for col in spec['measures'])
+    con.execute(f"CREATE OR REPLACE TEMP TABLE merge_rows AS SELECT * FROM {table} LIMIT 0")
+    try:
+        for df in frames:
+            _insert(con, table, df, target='merge_rows')
+        con.execute(f"""
+            INSERT INTO {table}
+            SELECT {keys}, {sums} FROM merge_rows GROUP BY {keys}
+            ON CONFLICT ({keys}) DO UPDATE SET {updates}
+        """)
+    finally:
+        con.execute("DROP TABLE merge_rows")
+
+
+def _load_dimensions(con):
+    # Imported here so the query side of the backend does not need geopandas
+    from .geo import read_grid, read_provinces
+
+    provinces = None
+    if MILANO_GRID_FILE.exists():
+        grid = read_grid()
+        con.register('grid_frame', pd.DataFrame({
+            'cell_id': grid['cell_id'], 'bounds': grid['bounds'], 'geometry': grid.geometry.to_wkb()
+        }))
+        con.execute("INSERT INTO dim_grid_milan SELECT cell_id, bounds, geometry FROM grid_frame")
+        con.unregister('grid_frame')
+    else:
+        logger.warning(f"⚠ {MILANO_GRID_FILE.name} not found, dim_grid_milan left empty")
+
+    if PROVINCES_FILE.exists():
+        provinces = read_provinces()
+        con.register('province_frame', pd.DataFrame({
+            'provincia': provinces['provincia'], 'population': provinces['population'],
+            'geometry': provinces.geometry.to_wkb()
+        }))
+        con.execute("INSERT INTO dim_provinces_it SELECT provincia, population, geometry FROM province_frame")
+        con.unregister('province_frame')
+        provinces = provinces['provincia'].tolist()
+    else:
+        logger.warning(f"⚠ {PROVINCES_FILE.name} not found, dim_provinces_it left empty")
+    return provinces
+
+
+def _load_staged_facts(con):
+    for table in FACT_SOURCES:
+        files = sorted((STAGING_DIR / table).glob('day=*/*.parquet'))
+        if not files:
+            logger.warning(f"⚠ No staged Parquet files for {table} under {STAGING_DIR}")
+            continue
+        for path in files:
+            _load_frames(con, table, [con.execute("SELECT * FROM read_parquet(?)", [path.as_posix()]).df()])
+        logger.info(f"    - {table}: {len(files)} staged files")
+
+
+def _load_csv_facts(con, valid_provinces, limit_files=None):
+    normalizer = ProvinceNormalizer(valid_provinces) if valid_provinces is not None else None
+    cleaners = {
+        'fact_traffic_milan': clean_traffic_chunk,
+        'fact_mobility_provinces': lambda df: clean_mobility_chunk(df, normalizer),
+    }
+    for table, spec in FACT_SOURCES.items():
+        if table == 'fact_mobility_provinces' and valid_provinces is None:
+            logger.warning("⚠ Mobility data skipped: the province list is needed to clean it")
+            continue
+        csv_files = find_sources(spec['pattern'])[:limit_files]
+        for csv_file in csv_files:
+            chunks = read_csv_chunks(csv_file, CHUNK_ROWS, spec['dtypes'])
+            _load_frames(con, table, (cleaners[table](chunk)[0] for chunk in chunks))
+        logger.info(f"    - {table}: {len(csv_files)} CSV files")
+
+
+def build_duckdb_database(path=None, source='staging', limit_files=None):
+    """(Re)build the embedded DuckDB analytical database, without any Postgres access.
+
+    Facts come from the Parquet staging area or are parsed and cleaned from the CSV files
+    with the same rules as the Postgres loaders; dimensions come from the GeoJSON files.
+    The database is built next to ``path`` and swapped in once complete.
+    """
+    _require_duckdb()
+    if source not in DUCKDB_SOURCES:
+        raise ValueError(f"Unknown DuckDB source '{source}', expected one of {DUCKDB_SOURCES}")
+    path = path or DUCKDB_PATH
+    tmp_path = path.with_name(path.name + '.tmp')
+    try:
+        start = time.perf_counter()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path.unlink(missing_ok=True)
+
+        con = duckdb.connect(str(tmp_path))
+        try:
+            con.execute(SCHEMA_SQL)
+            valid_provinces = _load_dimensions(con)
+            if source == 'staging':
+                _load_staged_facts(con)
+            else:
+                _load_csv_facts(con, valid_provinces, limit_files)
+            con.execute(ROLLUP_SQL)
+            counts = {
+                table: con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ('fact_traffic_milan', 'fact_mobility_provinces', 'agg_hourly_traffic')
+            }
+        finally:
+            con.close()
+
+        tmp_path.replace(path)
+        logger.info(
+            f"✓ DuckDB database {path} built from {source} in {time.perf_counter() - start:.2f}s "
+            f"({', '.join(f'{table}={rows}' for table, rows in counts.items())})"
+        )
+    except Exception as e:
+        tmp_path.unlink(missing_ok=True)
+        logger.error(f"DuckDB build error: {e}")
+        raise
+
+
+class DuckDBBackend:
+    """Runs the KPI queries against the embedded DuckDB database (read-only)."""
+
+    name = 'duckdb'
+    timestamp_type = 'TIMESTAMP'
+
+    def __init__(self, path=None):
+        _require_duckdb()
+        self.path = path or DUCKDB_PATH
+        if not self.path.exists():
+            raise FileNotFoundError(f"{self.path} does not exist, build it with --build-duckdb")
+
+    def query(self, sql, params=None):
+        # The KPI queries use :name placeholders; DuckDB spells them $name
+        sql = re.sub(r'(?<![:\w]):(\w+)', r'$\1', sql)
+        with duckdb.connect(str(self.path), read_only=True) as con:
+            result = con.execute(sql, params or {})
+            columns = [column[0] for column in result.description]
+            # Same conversion as pandas.read_sql: DECIMAL values arrive as Decimal and are
+            # rounded to float once, so both backends return identical numbers
+            return pd.DataFrame.from_records(result.fetchall(), columns=columns, coerce_float=True)
@@ -1,12 +1,187 @@
-import geopandas as gpd
+import hashlib
 import pandas as pd
 import logging
-from .config import DATA_DIR, MILANO_GRID_FILE, PROVINCES_FILE, TRAFFIC_PATTERN, MOBILITY_PATTERN, TARGET_CRS
-from .database import get_sqlalchemy_engine
+import time
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+from sqlalchemy import text
+from .config import (
+    MILANO_GRID_FILE, PROVINCES_FILE, TRAFFIC_PATTERN, MOBILITY_PATTERN, TARGET_CRS,
+    LOADERS, DEFAULT_LOADER, DEFAULT_PARSER, CHUNK_ROWS, WORKERS, STAGING, PIPELINE_DEPTH
+)
+from .database import get_sqlalchemy_engine, copy_dataframe, copy_payload, refresh_hourly_traffic
+from .parsing import (
+    PARSERS, TRAFFIC_DTYPES, MOBILITY_DTYPES, MOBILITY_KEY, ProvinceNormalizer, read_csv_chunks, clean_traffic_chunk,
+    clean_mobility_chunk
+)
+from .pipeline import prefetch
+from .partitions import (
+    get_partitioning, period_starts, period_end, partition_name, create_partition, attach_partition, ensure_partitions
+)
+from .kpi import get_top_cells
+from .layout import get_layout, to_layout
+from .metrics import peak_rss_bytes, record_files
+from .sources import find_sources
+from .staging import staging_available, staging_key, read_entry, staged_chunks, StagedWriter
+from .validation import validate
+from .manifest import (
+    file_fingerprint, read_manifest, plan_files, is_same_content, touch_manifest,
+    delete_file_rows, record_loaded, record_failed, bump_data_version
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Compact and wide layouts store country_key in place of countrycode
+TRAFFIC_COLUMNS = [
+    'datetime', 'cell_id', 'countrycode', 'country_key', 'smsin', 'smsout', 'callin', 'callout', 'internet'
+]
+MOBILITY_COLUMNS = ['datetime', 'cell_id', 'provincia', 'cell2province', 'province2cell']
+
+FACT_TABLES = {
+    'traffic': {
+        'table': 'fact_traffic_milan',
+        'pattern': TRAFFIC_PATTERN,
+        'columns': TRAFFIC_COLUMNS,
+        'dtypes': TRAFFIC_DTYPES,
+        'chunksize': 1000,
+        'merge_key': None,
+        'rollup': True,
+        'reasons': ['invalid_dates', 'invalid_cells', 'invalid_countries'],
+    },
+    'mobility': {
+        'table': 'fact_mobility_provinces',
+        'pattern': MOBILITY_PATTERN,
+        'columns': MOBILITY_COLUMNS,
+        'dtypes': MOBILITY_DTYPES,
+        'chunksize': 100,
+        'merge_key': MOBILITY_KEY,
+        'rollup': False,
+        'reasons': ['invalid_dates', 'invalid_provinces', 'invalid_cells'],
+    },
+}
+
+
+def _load_options(loader=None, chunk_rows=None, parser=None, detached_partitions=False, staging=None,
+                  pipeline_depth=None):
+    """Resolve the per-file load options, falling back to the configured defaults."""
+    options = {
+        'loader': loader or DEFAULT_LOADER,
+        'chunk_rows': CHUNK_ROWS if chunk_rows is None else chunk_rows,
+        'parser': parser or DEFAULT_PARSER,
+        'detached_partitions': detached_partitions,
+        'staging': STAGING == 'on' if staging is None else staging,
+        'staging_variant': '',
+        'pipeline_depth': PIPELINE_DEPTH if pipeline_depth is None else pipeline_depth,
+        'partitioning': None,
+        'layout': 'standard',
+    }
+    if options['loader'] not in LOADERS:
+        raise ValueError(f"Unknown loader '{options['loader']}', expected one of {LOADERS}")
+    if options['parser'] not in PARSERS:
+        raise ValueError(f"Unknown parser '{options['parser']}', expected one of {PARSERS}")
+    if options['staging'] and not staging_available():
+        logger.warning("⚠ pyarrow is not installed, Parquet staging is disabled")
+        options['staging'] = False
+    return options
+
+
+def _frame_columns(df, columns):
+    return [c for c in columns if c in df.columns]
+
+
+def _write_frame(df, table, conn, loader, columns, chunksize=1000, payload=None):
+    """Write a cleaned frame to ``table`` and return the elapsed seconds."""
+    columns = _frame_columns(df, columns)
+    start = time.perf_counter()
+    if loader == 'copy':
+        copy_dataframe(df, table, conn, columns=columns, payload=payload)
+    else:
+        df[columns].to_sql(table, conn, if_exists='append', index=False, chunksize=chunksize)
+    return time.perf_counter() - start
+
+
+def _open_partition(conn, engine, table, start, options):
+    """Return (partition name, created detached) for the period starting at ``start``."""
+    granularity = options['partitioning']
+    if options['detached_partitions']:
+        return create_partition(conn, table, start, granularity, attach=False)
+    ensure_partitions(engine, table, start, start, granularity)
+    return partition_name(table, start), False
+
+
+def _write_chunk(df, table, conn, engine, spec, options, partitions, payload=None):
+    """Write a cleaned chunk to its fact table, straight into the target partitions when partitioned."""
+    if not options['partitioning']:
+        return _write_frame(
+            df, table, conn, options['loader'], spec['columns'], chunksize=spec['chunksize'], payload=payload
+        )
+
+    elapsed = 0.0
+    periods = period_starts(df['datetime'], options['partitioning'])
+    starts = periods.unique()
+    for start in starts:
+        start = pd.Timestamp(start)
+        if start not in partitions:
+            partitions[start] = _open_partition(conn, engine, table, start, options)
+        part = df if len(starts) == 1 else df[periods == start]
+        elapsed += _write_frame(
+            part, partitions[start][0], conn, options['loader'], spec['columns'], chunksize=spec['chunksize']
+        )
+    return elapsed
+
+
+def _merge_table(conn, table):
+    """Create the temporary table collecting a file's rows before they are merged into ``table``."""
+    name = f"tmp_{table}"
+    conn.execute(text(f"CREATE TEMPORARY TABLE {name} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP"))
+    return name
+
+
+def _merge_rows(conn, engine, source, table, spec, options, partitions, periods):
+    """Insert the rows collected in ``source`` into ``table`` with one row per merge key.
+
+    Rows of the file sharing a key are summed. A key already in the table (rows loaded
+    outside the manifest, or by another file) is overwritten rather than duplicated.
+    When partitioned, each period goes to its partition; new detached partitions are
+    empty, so they are filled without the ON CONFLICT clause (they have no key index yet).
+    Returns the number of rows written.
+    """
+    keys = spec['merge_key']
+    measures = [col for col in spec['columns'] if col not in keys]
+    columns = ', '.join(keys + measures)
+    select = f"SELECT {', '.join(keys + [f'SUM({col})' for col in measures])} FROM {source}"
+    upsert = (
+        f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET "
+        + ', '.join(f"{col} = EXCLUDED.{col}" for col in measures)
+    )
+    group_by = f"GROUP BY {', '.join(keys)}"
+    if not options['partitioning']:
+        return conn.execute(text(f"INSERT INTO {table} ({columns}) {select} {group_by} {upsert}")).rowcount
+
+    written = 0
+    for start in sorted(periods):
+        if start not in partitions:
+            partitions[start] = _open_partition(conn, engine, table, start, options)
+        name, detached = partitions[start]
+        # Same bounds as the partition (session time zone), see partitions.attach_partition()
+        bounds = {
+            'low': f"{start:%Y-%m-%d %H:%M:%S}",
+            'high': f"{period_end(start, options['partitioning']):%Y-%m-%d %H:%M:%S}",
+        }
+        written += conn.execute(text(f"""
+            INSERT INTO {name} ({columns}) {select}
+            WHERE datetime >= CAST(:low AS TIMESTAMPTZ) AND datetime < CAST(:high AS TIMESTAMPTZ)
+            {group_by} {'' if detached else upsert}
+        """), bounds).rowcount
+    return written
+
+
+def _log_write(name, rows, elapsed, loader):
+    rate = rows / elapsed if elapsed > 0 else float('inf')
+    logger.info(f"    - {name}: {rows} rows written via {loader} in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+
 
 def load_grid_geometries():
     try:
@@ -29,17 +204,9 @@ def load_grid_geometries():
                 ))
             return
         
-        gdf = gpd.read_file(MILANO_GRID_FILE)
-        
-        if gdf.crs != TARGET_CRS:
-            gdf = gdf.to_crs(TARGET_CRS)
-        
-        gdf['cell_id'] = gdf.index
-
-        bounds_df = gdf.geometry.bounds
-        gdf['bounds'] = bounds_df.apply(
-            lambda row: f"{row.minx},{row.miny},{row.maxx},{row.maxy}", axis=1
-        )
+        # Imported here so the fact loaders and queries do not load geopandas
+        from .geo import read_grid
+        gdf = read_grid(MILANO_GRID_FILE, TARGET_CRS)
         
         gdf[['cell_id', 'geometry', 'bounds']].to_postgis(
             'dim_grid_milan',
@@ -66,20 +233,8 @@ def load_provinces_geometries():
             logger.info(f"✓ {existing_count} provinces already loaded (skipping)")
             return
         
-        gdf = gpd.read_file(PROVINCES_FILE)
-        
-        if gdf.crs != TARGET_CRS:
-            gdf = gdf.to_crs(TARGET_CRS)
-        
-        if 'PROVINCIA' in gdf.columns:
-            gdf = gdf.rename(columns={'PROVINCIA': 'provincia'})
-        elif 'name' in gdf.columns:
-            gdf = gdf.rename(columns={'name': 'provincia'})
-
-        if 'population' in gdf.columns:
-            gdf['population'] = pd.to_numeric(gdf['population'], errors='coerce').fillna(0).astype(int)
-        else:
-            gdf['population'] = 0
+        from .geo import read_provinces
+        gdf = read_provinces(PROVINCES_FILE, TARGET_CRS)
         
         gdf[['provincia', 'geometry', 'population']].to_postgis(
             'dim_provinces_it',
@@ -87,6 +242,7 @@ def load_provinces_geometries():
             if_exists='append',
             index=False
         )
+        reset_province_normalizer()
         
         logger.info(f"✓ {len(gdf)} provinces loaded")
         
@@ -95,234 +251,508 @@ def load_provinces_geometries():
         raise
 
 
-def load_traffic_data(file_pattern=None, limit_files=None):
+def load_cell_overlaps():
+    """Precompute the cell -> province overlap weights and the cell neighbours.
+
+    Province-level traffic is then a plain join on cell_id (see get_province_traffic())
+    instead of an ST_Intersects join at query time.
+    """
     try:
         engine = get_sqlalchemy_engine()
-
-        existing_count = pd.read_sql(
-            "SELECT COUNT(*) as count FROM fact_traffic_milan",
-            engine
-        ).iloc[0]['count']
+        existing_count = pd.read_sql("SELECT COUNT(*) FROM dim_cell_province", engine).iloc[0, 0]
 
         if existing_count > 0:
-            logger.info(f"✓ {existing_count} traffic rows already loaded (skipping)")
+            logger.info(f"✓ {existing_count} cell/province overlaps already computed (skipping)")
             return
 
-        pattern = file_pattern or TRAFFIC_PATTERN
-        csv_files = sorted(DATA_DIR.glob(pattern))
-        
-        if limit_files:
-            csv_files = csv_files[:limit_files]
-        
-        if not csv_files:
-            logger.warning(f"No files found for pattern: {pattern}")
+        from .geo import read_grid, read_provinces, cell_province_overlaps, cell_neighbours
+        start = time.perf_counter()
+        grid = read_grid(MILANO_GRID_FILE, TARGET_CRS)
+        overlaps = cell_province_overlaps(grid, read_provinces(PROVINCES_FILE, TARGET_CRS))
+        neighbours = cell_neighbours(grid)
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM dim_cell_neighbours"))
+            copy_dataframe(overlaps, 'dim_cell_province', conn)
+            copy_dataframe(neighbours, 'dim_cell_neighbours', conn)
+            bump_data_version(conn)
+
+        outside = len(grid) - overlaps['cell_id'].nunique()
+        logger.info(
+            f"✓ {len(overlaps)} cell/province overlaps and {len(neighbours)} neighbour pairs computed "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+        if outside:
+            logger.warning(f"⚠ {outside} grid cells do not overlap any province")
+
+    except Exception as e:
+        logger.error(f"Cell overlaps computation error: {e}")
+        raise
+
+
+def get_province_traffic(start=None, end=None, engine=None):
+    """Area-weighted traffic per province between ``start`` (included) and ``end`` (excluded).
+
+    Each cell's hourly totals are spread over the provinces it overlaps by the share of its
+    area in each of them. ``cells`` counts the cells contributing to a province.
+    """
+    conditions, params = [], {}
+    if start is not None:
+        conditions.append("a.hour >= CAST(:start AS timestamptz)")
+        params['start'] = start
+    if end is not None:
+        conditions.append("a.hour < CAST(:end AS timestamptz)")
+        params['end'] = end
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    weighted = ', '.join(
+        f"SUM(CAST(a.total_{measure} AS DOUBLE PRECISION) * o.weight) AS {measure}"
+        for measure in ('smsin', 'smsout', 'callin', 'callout', 'internet', 'activity')
+    )
+    try:
+        return pd.read_sql(text(f"""
+        SELECT o.provincia, COUNT(DISTINCT a.cell_id) AS cells, {weighted}
+        FROM agg_hourly_traffic a
+        JOIN dim_cell_province o ON o.cell_id = a.cell_id
+        {where}
+        GROUP BY o.provincia
+        ORDER BY activity DESC, o.provincia
+        """), engine or get_sqlalchemy_engine(), params=params)
+    except Exception as e:
+        logger.error(f"Province traffic query error: {e}")
+        raise
+
+
+_province_normalizer = None
+
+
+def get_province_normalizer(engine=None):
+    """The province normalizer over dim_provinces_it, built once per process."""
+    global _province_normalizer
+    if _province_normalizer is None:
+        valid_provinces = pd.read_sql(
+            "SELECT provincia FROM dim_provinces_it",
+            engine or get_sqlalchemy_engine()
+        )['provincia'].tolist()
+        _province_normalizer = ProvinceNormalizer(valid_provinces)
+    return _province_normalizer
+
+
+def reset_province_normalizer():
+    """Forget the cached province list, e.g. after dim_provinces_it was reloaded."""
+    global _province_normalizer
+    _province_normalizer = None
+
+
+def _merge_stats(total, part):
+    for key, value in part.items():
+        if isinstance(value, dict):
+            _merge_stats(total.setdefault(key, {}), value)
+        else:
+            total[key] = total.get(key, 0) + value
+
+
+def _extend_range(time_range, datetimes):
+    if datetimes.empty:
+        return
+    start, end = datetimes.min(), datetimes.max()
+    time_range[0] = start if time_range[0] is None else min(time_range[0], start)
+    time_range[1] = end if time_range[1] is None else max(time_range[1], end)
+
+
+def _log_file_stats(kind, name, stats):
+    if kind == 'traffic':
+        if stats['invalid_dates']:
+            logger.warning(f"    - {name}: {stats['invalid_dates']} invalid dates dropped")
+        for col, neg_count in stats['negative'].items():
+            if neg_count > 0:
+                logger.warning(f"    - {name}: {neg_count} negative values in {col}, set to 0")
+        if stats['rejected']:
+            logger.info(f"    - {name}: cleaned, {stats['rejected']} rows rejected ({stats['final']} kept)")
+    else:
+        if stats['invalid_dates']:
+            logger.info(f"    - dropped {stats['invalid_dates']} rows with null/invalid datetime from {name}")
+        if stats['invalid_provinces']:
+            logger.info(f"    - dropped {stats['invalid_provinces']} rows with unmatched provinces from {name}")
+        if stats.get('duplicates_merged'):
+            logger.info(f"    - merged {stats['duplicates_merged']} rows with a repeated key into others in {name}")
+
+
+def _add_time(timings, phase, start):
+    timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - start
+
+
+def _timed_chunks(chunks, timings):
+    """Iterate ``chunks``, adding the time spent producing them to the 'read' phase."""
+    chunks = iter(chunks)
+    while True:
+        start = time.perf_counter()
+        chunk = next(chunks, None)
+        _add_time(timings, 'read', start)
+        if chunk is None:
             return
-        
-        logger.info(f"Loading {len(csv_files)} traffic files...")
-        
-        total_rows = 0
-        rejected_rows = []
-        
-        for csv_file in csv_files:
-            logger.info(f"  - {csv_file.name}")
-            df = pd.read_csv(csv_file)
-            initial_count = len(df)
-            invalid_dates = 0
-            invalid_cells = 0
-            
-            if 'datetime' in df.columns:
-                df['datetime'] = pd.to_datetime(df['datetime'], errors='coerce')
-                before = len(df)
-                df = df.dropna(subset=['datetime'])
-                invalid_dates = before - len(df)
-                if invalid_dates:
-                    logger.warning(f"    - {invalid_dates} invalid dates will be dropped")
-            
-            df = df.rename(columns={'CellID': 'cell_id'})
-
-            metric_cols = ['smsin', 'smsout', 'callin', 'callout', 'internet']
-            for col in metric_cols:
-                if col not in df.columns:
-                    df[col] = 0
-                else:
-                    neg_count = (df[col] < 0).sum()
-                    if neg_count > 0:
-                        logger.warning(f"    - {neg_count} negative values in {col}, setting to 0")
-            df[metric_cols] = df[metric_cols].apply(pd.to_numeric, errors='coerce').fillna(0)
-            for col in metric_cols:
-                df.loc[df[col] < 0, col] = 0
-
-            invalid_cells = df[~df['cell_id'].between(0, 9999)].shape[0]
-            df = df[df['cell_id'].between(0, 9999)]
-
-            final_count = len(df)
-            rejected = initial_count - final_count
-            if rejected:
-                logger.info(f"    - Cleaned: {rejected} rows rejected ({final_count} kept)")
-                rejected_rows.append({
-                    'file': csv_file.name,
-                    'initial': initial_count,
-                    'final': final_count,
-                    'rejected': rejected,
-                    'invalid_dates': invalid_dates,
-                    'invalid_cells': invalid_cells
-                })
-            
-            df.to_sql(
-                'fact_traffic_milan',
-                engine,
-                if_exists='append',
-                index=False,
-                chunksize=1000
-            )
-            total_rows += len(df)
-        
-        logger.info(f"✓ {total_rows} traffic rows loaded from {len(csv_files)} files")
-        if rejected_rows:
-            total_rejected = sum(r['rejected'] for r in rejected_rows)
-            logger.info(f"⚠ {total_rejected} total rows were rejected during cleaning")
+        yield chunk
+
+
+def _cleaned_chunks(kind, csv_file, fingerprint, options, clean, stats):
+    """Yield the cleaned chunks of a source file and add their cleaning counters to ``stats``.
+
+    With staging on, a file already staged with the same content, parser and cleaning
+    inputs is read back from Parquet without parsing the CSV; otherwise the cleaned chunks
+    are staged as they are read and published once the whole file went through.
+    Time spent reading, cleaning and staging the chunks is added to ``stats['timings']``.
+    """
+    spec = FACT_TABLES[kind]
+    timings = stats['timings']
+    # Counters are added to these, so a file without any chunk still reports 0 rows
+    for key in ['initial', 'final'] + spec['reasons']:
+        stats.setdefault(key, 0)
+    writer = None
+    if options['staging']:
+        key = staging_key(fingerprint['content_hash'], options['parser'], options['staging_variant'])
+        entry = read_entry(spec['table'], csv_file.name, key)
+        if entry is not None:
+            logger.info(f"    - {csv_file.name}: reading cleaned rows from the staging area")
+            _merge_stats(stats, entry['stats'])
+            yield from _timed_chunks(staged_chunks(spec['table'], entry), timings)
+            return
+        writer = StagedWriter(spec['table'], csv_file.name, key)
+
+    counters = {}
+    dtypes = spec['dtypes'] if options['parser'] == 'fast' else None
+    try:
+        for chunk in _timed_chunks(read_csv_chunks(csv_file, options['chunk_rows'], dtypes), timings):
+            start = time.perf_counter()
+            df, chunk_stats = clean(chunk)
+            del chunk
+            _merge_stats(counters, chunk_stats)
+            _add_time(timings, 'clean', start)
+            if writer is not None:
+                start = time.perf_counter()
+                writer.write(df)
+                _add_time(timings, 'stage', start)
+            yield df
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+
+    _merge_stats(stats, counters)
+    if writer is not None:
+        writer.publish(counters)
+        logger.info(f"    - {csv_file.name}: cleaned rows staged as Parquet")
+
+
+def _layout_chunks(kind, chunks, options, engine, timings):
+    """Cast the cleaned chunks to the column types of the schema layout (after staging)."""
+    with closing(chunks):
+        for df in chunks:
+            start = time.perf_counter()
+            df = to_layout(df, kind, options['layout'], engine)
+            _add_time(timings, 'clean', start)
+            yield df
+
+
+def _pipelined_chunks(chunks, spec, options, timings):
+    """Pair each cleaned chunk with its COPY payload, rendered on the producer side.
+
+    Runs in the prefetch thread, so serializing the next chunk overlaps the current COPY.
+    Payloads are only rendered where a chunk goes to one table by COPY: a merge table (COPY
+    with every loader) or an unpartitioned table with the COPY loader.
+    """
+    render = spec['merge_key'] or (options['loader'] == 'copy' and not options['partitioning'])
+    with closing(chunks):
+        for df in chunks:
+            payload = None
+            if render:
+                start = time.perf_counter()
+                payload = copy_payload(df, _frame_columns(df, spec['columns']))
+                _add_time(timings, 'serialize', start)
+            yield df, payload
+
+
+def _load_file(kind, csv_file, previous, engine, options, clean):
+    """Stream one source file into its fact table in a single transaction and record it in the manifest.
+
+    Rows from a previous load of the same file are replaced within that transaction.
+    Returns the file stats, or None when the content turned out to be unchanged.
+    """
+    spec = FACT_TABLES[kind]
+    table = spec['table']
+    logger.info(f"  - {csv_file.label}")
+
+    fingerprint = file_fingerprint(csv_file)
+    if is_same_content(previous, fingerprint):
+        touch_manifest(engine, table, csv_file.name, fingerprint)
+        logger.info(f"    - {csv_file.name}: content unchanged (skipping)")
+        return None
+
+    stats = {'file': csv_file.name, 'bytes': fingerprint['file_size'], 'timings': {}}
+    time_range = [None, None]
+    write_time = 0.0
+    partitions = {}
+    loader = options['loader']
+
+    try:
+        with engine.begin() as conn:
+            replaced = delete_file_rows(conn, table, previous)
+            if replaced:
+                logger.info(f"    - {csv_file.name}: replacing {replaced} rows from a previous load")
+            merge_table = _merge_table(conn, table) if spec['merge_key'] else None
+            periods = set()
+
+            chunks = _cleaned_chunks(kind, csv_file, fingerprint, options, clean, stats)
+            if options['layout'] != 'standard':
+                chunks = _layout_chunks(kind, chunks, options, engine, stats['timings'])
+            if options['pipeline_depth']:
+                chunks = prefetch(
+                    _pipelined_chunks(chunks, spec, options, stats['timings']),
+                    options['pipeline_depth'], stats['timings']
+                )
+            else:
+                chunks = ((df, None) for df in chunks)
+            with closing(chunks):
+                for df, payload in chunks:
+                    _extend_range(time_range, df['datetime'])
+                    if merge_table is None:
+                        write_time += _write_chunk(df, table, conn, engine, spec, options, partitions, payload)
+                    else:
+                        # Always COPY: to_sql cannot see the temporary table and warns on every chunk
+                        write_time += _write_frame(df, merge_table, conn, 'copy', spec['columns'], payload=payload)
+                        if options['partitioning']:
+                            starts = period_starts(df['datetime'], options['partitioning']).unique()
+                            periods.update(map(pd.Timestamp, starts))
+                    del df, payload
+
+            if merge_table is not None:
+                start = time.perf_counter()
+                written = _merge_rows(conn, engine, merge_table, table, spec, options, partitions, periods)
+                write_time += time.perf_counter() - start
+                stats['duplicates_merged'] = stats.get('duplicates_merged', 0) + stats['final'] - written
+                stats['final'] = written
+
+            stats['rejected'] = stats['initial'] - stats['final'] - stats.get('duplicates_merged', 0)
+            stats['min_datetime'], stats['max_datetime'] = time_range
+
+            for start, (name, detached) in partitions.items():
+                if detached:
+                    attach_start = time.perf_counter()
+                    attach_partition(conn, table, name, start, options['partitioning'])
+                    attach_time = time.perf_counter() - attach_start
+                    write_time += attach_time
+                    logger.info(
+                        f"    - {csv_file.name}: partition {name} indexed and attached in {attach_time:.2f}s"
+                    )
+
+            if spec['rollup']:
+                if options['partitioning']:
+                    ensure_partitions(engine, 'agg_hourly_traffic', *time_range, options['partitioning'])
+                    if options['layout'] == 'wide':
+                        ensure_partitions(engine, 'fact_traffic_cell_totals', *time_range, options['partitioning'])
+                ranges = [tuple(time_range)]
+                if previous is not None:
+                    ranges.append((previous['min_datetime'], previous['max_datetime']))
+                start = time.perf_counter()
+                rollup_rows = refresh_hourly_traffic(conn, ranges, options['layout'])
+                _add_time(stats['timings'], 'rollup', start)
+                logger.info(
+                    f"    - {csv_file.name}: {rollup_rows} hourly rollup rows refreshed "
+                    f"in {stats['timings']['rollup']:.2f}s"
+                )
+
+            record_loaded(conn, table, csv_file.name, fingerprint, stats)
+    except Exception as e:
+        record_failed(engine, table, csv_file.name, fingerprint, e)
+        raise
+
+    stats['timings']['write'] = write_time
+    stats['peak_rss'] = peak_rss_bytes()
+    _log_file_stats(kind, csv_file.name, stats)
+    _log_write(csv_file.name, stats['final'], write_time, loader)
+    return stats
+
+
+_worker_engine = None
+
+
+def _init_worker():
+    global _worker_engine
+    _worker_engine = get_sqlalchemy_engine()
+
+
+def _file_job(kind, csv_file, previous, options, clean):
+    return _load_file(kind, csv_file, previous, _worker_engine, options, clean)
+
+
+def _run_file_jobs(kind, pending, workers, *args):
+    """Load every pending (file, manifest entry) pair, in a process pool when ``workers`` > 1.
+
+    Returns the stats of the files actually loaded.
+    """
+    if workers <= 1 or len(pending) <= 1:
+        _init_worker()
+        file_stats = [_file_job(kind, csv_file, previous, *args) for csv_file, previous in pending]
+        return [stats for stats in file_stats if stats is not None]
+
+    workers = min(workers, len(pending))
+    logger.info(f"Dispatching {len(pending)} files to {workers} worker processes")
+    file_stats = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(_file_job, kind, csv_file, previous, *args) for csv_file, previous in pending]
+        try:
+            for future in as_completed(futures):
+                stats = future.result()
+                if stats is not None:
+                    file_stats.append(stats)
+        except Exception:
+            pool.shutdown(wait=True, cancel_futures=True)
+            raise
+    return sorted(file_stats, key=lambda stats: stats['file'])
+
+
+def _log_summary(kind, file_stats, reasons):
+    total_rows = sum(stats['final'] for stats in file_stats)
+    logger.info(f"✓ {total_rows} {kind} rows loaded from {len(file_stats)} files")
+
+    total_rejected = sum(stats['rejected'] for stats in file_stats)
+    if total_rejected:
+        breakdown = ', '.join(f"{reason}={sum(stats[reason] for stats in file_stats)}" for reason in reasons)
+        logger.info(f"⚠ {total_rejected} total rows were rejected during cleaning ({breakdown})")
+
+
+def _log_unknown_provinces(file_stats):
+    """Report the unknown province names of all loaded files, most frequent first."""
+    unknown = {}
+    for stats in file_stats:
+        _merge_stats(unknown, stats.get('unknown_provinces', {}))
+    if unknown:
+        names = sorted(unknown.items(), key=lambda item: (-item[1], item[0]))
+        listed = ', '.join(f"'{name}' ({count})" for name, count in names[:20])
+        more = f" and {len(names) - 20} more" if len(names) > 20 else ""
+        logger.warning(f"⚠ {len(names)} unknown province names in the mobility files: {listed}{more}")
+    return unknown
+
+
+def _plan_fact_files(kind, engine, file_pattern, limit_files):
+    """List the source files of a fact table that are new or changed since their last load."""
+    table = FACT_TABLES[kind]['table']
+    pattern = file_pattern or FACT_TABLES[kind]['pattern']
+    csv_files = find_sources(pattern)
+
+    if limit_files:
+        csv_files = csv_files[:limit_files]
+
+    if not csv_files:
+        logger.warning(f"No files found for pattern: {pattern}")
+        return []
+
+    manifest = read_manifest(engine, table)
+    if not manifest:
+        has_rows = pd.read_sql(f"SELECT EXISTS (SELECT 1 FROM {table}) AS has_rows", engine).iloc[0]['has_rows']
+        if has_rows:
+            logger.warning(f"⚠ {table} has rows not tracked in the load manifest; they will not be replaced")
+
+    pending, unchanged = plan_files(csv_files, manifest)
+    if unchanged:
+        logger.info(f"✓ {unchanged} {kind} files already loaded and unchanged (skipping)")
+    return pending
+
+
+def load_traffic_data(file_pattern=None, limit_files=None, loader=None, chunk_rows=None, workers=None,
+                      parser=None, detached_partitions=False, staging=None, pipeline_depth=None):
+    options = _load_options(loader, chunk_rows, parser, detached_partitions, staging, pipeline_depth)
+    workers = workers or WORKERS
+    try:
+        engine = get_sqlalchemy_engine()
+        with engine.connect() as conn:
+            options['partitioning'] = get_partitioning(conn)
+            options['layout'] = get_layout(conn)
+
+        pending = _plan_fact_files('traffic', engine, file_pattern, limit_files)
+        if not pending:
+            return []
+
+        logger.info(f"Loading {len(pending)} traffic files...")
+
+        file_stats = _run_file_jobs('traffic', pending, workers, options, clean_traffic_chunk)
+        _log_summary('traffic', file_stats, FACT_TABLES['traffic']['reasons'])
+        record_files(FACT_TABLES['traffic']['table'], file_stats, FACT_TABLES['traffic']['reasons'])
+        return file_stats
         
     except Exception as e:
         logger.error(f"Traffic data loading error: {e}")
         raise
 
 
-def load_mobility_data(file_pattern=None, limit_files=None):
+def load_mobility_data(file_pattern=None, limit_files=None, loader=None, chunk_rows=None, workers=None,
+                       parser=None, detached_partitions=False, staging=None, pipeline_depth=None):
+    options = _load_options(loader, chunk_rows, parser, detached_partitions, staging, pipeline_depth)
+    workers = workers or WORKERS
     try:
         engine = get_sqlalchemy_engine()
+        with engine.connect() as conn:
+            options['partitioning'] = get_partitioning(conn)
+            options['layout'] = get_layout(conn)
 
-        existing_count = pd.read_sql(
-            "SELECT COUNT(*) as count FROM fact_mobility_provinces",
-            engine
-        ).iloc[0]['count']
+        pending = _plan_fact_files('mobility', engine, file_pattern, limit_files)
+        if not pending:
+            return []
 
-        if existing_count > 0:
-            logger.info(f"✓ {existing_count} mobility rows already loaded (skipping)")
-            return
+        logger.info(f"Loading {len(pending)} mobility files...")
 
-        pattern = file_pattern or MOBILITY_PATTERN
-        csv_files = sorted(DATA_DIR.glob(pattern))
-        
-        if limit_files:
-            csv_files = csv_files[:limit_files]
-        
-        if not csv_files:
-            logger.warning(f"No files found for pattern: {pattern}")
-            return
-        
-        logger.info(f"Loading {len(csv_files)} mobility files...")
-        
-        total_rows = 0
-        
-        province_map = {
-            "Monza E Della Brianza": "Monza e della Brianza",
-            "Reggio Nell'Emilia": "Reggio nell'Emilia",
-            "Reggio Di Calabria": "Reggio di Calabria",
-            "Pesaro E Urbino": "Pesaro e Urbino",
-            "Massa-Carrara": "Massa Carrara",
-            "Valle D'Aosta": "Aosta",
-            "Bolzano/Bozen": "Bolzano",
-        }
+        normalizer = get_province_normalizer(engine)
+        # Staged mobility rows depend on the province list they were filtered against
+        options['staging_variant'] = hashlib.blake2b(
+            '\n'.join(normalizer.dtype.categories).encode(), digest_size=8
+        ).hexdigest()
 
-        valid_provinces = pd.read_sql(
-            "SELECT provincia FROM dim_provinces_it",
-            engine
-        )['provincia']
-
-        for csv_file in csv_files:
-            logger.info(f"  - {csv_file.name}")
-            df = pd.read_csv(csv_file)
-            
-            if 'datetime' in df.columns:
-                df['datetime'] = pd.to_datetime(df['datetime'], errors='coerce')
-                before = len(df)
-                df = df.dropna(subset=['datetime'])
-                dropped_null = before - len(df)
-                if dropped_null:
-                    logger.info(f"    - dropped {dropped_null} rows with null/invalid datetime from {csv_file.name}")
-            
-            df = df.rename(columns={
-                'CellID': 'cell_id',
-                'provinceName': 'provincia',
-                'cell2Province': 'cell2province',
-                'Province2cell': 'province2cell'
-            })
-
-            for col in ['cell2province', 'province2cell']:
-                if col not in df.columns:
-                    df[col] = 0
-            df[['cell2province', 'province2cell']] = df[['cell2province', 'province2cell']].apply(pd.to_numeric, errors='coerce').fillna(0)
-
-            if 'provincia' in df.columns:
-                df['provincia'] = df['provincia'].str.title().str.strip()
-                df['provincia'] = df['provincia'].replace(province_map)
-                before = len(df)
-                df = df[df['provincia'].isin(valid_provinces)]
-                dropped = before - len(df)
-                if dropped:
-                    logger.info(f"    - dropped {dropped} rows with unmatched provinces from {csv_file.name}")
-            
-            df = df[df['cell_id'].between(0, 9999)]
-            
-            df.to_sql(
-                'fact_mobility_provinces',
-                engine,
-                if_exists='append',
-                index=False,
-                chunksize=100
-            )
-            total_rows += len(df)
-        
-        logger.info(f"✓ {total_rows} mobility rows loaded from {len(csv_files)} files")
+        clean = partial(clean_mobility_chunk, valid_provinces=normalizer)
+        file_stats = _run_file_jobs('mobility', pending, workers, options, clean)
+        _log_summary('mobility', file_stats, FACT_TABLES['mobility']['reasons'])
+        _log_unknown_provinces(file_stats)
+        record_files(FACT_TABLES['mobility']['table'], file_stats, FACT_TABLES['mobility']['reasons'])
+        return file_stats
         
     except Exception as e:
         logger.error(f"Mobility data loading error: {e}")
         raise
 
 
-def get_top_cells(limit=10):
-    query = f"""
-    SELECT cell_id, AVG(total_activity) as avg_load 
-    FROM v_hourly_traffic 
-    WHERE hour >= '2013-11-01 00:00'::timestamptz
-    GROUP BY cell_id 
-    ORDER BY avg_load DESC 
-    LIMIT {limit};
-    """
-    
+def rebuild_hourly_rollup():
+    """Rebuild agg_hourly_traffic from the whole fact table (e.g. after upgrading an existing database)."""
     try:
         engine = get_sqlalchemy_engine()
-        df = pd.read_sql(query, engine)
-        return df
+        start = time.perf_counter()
+        with engine.begin() as conn:
+            rows = refresh_hourly_traffic(conn)
+            bump_data_version(conn)
+        logger.info(f"✓ {rows} hourly rollup rows rebuilt in {time.perf_counter() - start:.2f}s")
     except Exception as e:
-        logger.error(f"Query error: {e}")
+        logger.error(f"Hourly rollup rebuild error: {e}")
         raise
 
 
-def validate_schema_constraints(engine=None):
-    """Check simple non-negative constraints at the DB level."""
+def validate_schema_constraints(engine=None, sample_percent=None, start=None, end=None, files=None,
+                                partitions=None):
+    """Check the non-negative and range rules at the DB level, one scan per table.
+
+    ``files`` (source file names), ``start``/``end`` (end excluded) or ``partitions`` limit
+    the fact tables to those rows, e.g. to validate only what an incremental load wrote.
+    Returns a ValidationReport.
+    """
     engine = engine or get_sqlalchemy_engine()
-    constraints = [
-        ("dim_grid_milan", "(cell_id BETWEEN 0 AND 9999)"),
-        ("dim_provinces_it", "(population >= 0)"),
-        ("fact_traffic_milan", "(smsin >= 0)"),
-        ("fact_traffic_milan", "(smsout >= 0)"),
-        ("fact_traffic_milan", "(callin >= 0)"),
-        ("fact_traffic_milan", "(callout >= 0)"),
-        ("fact_traffic_milan", "(internet >= 0)"),
-        ("fact_mobility_provinces", "(cell2province >= 0)"),
-        ("fact_mobility_provinces", "(province2cell >= 0)")
-    ]
-
-    for table, condition in constraints:
-        query = f"""
-        SELECT COUNT(*) AS violations
-        FROM {table}
-        WHERE NOT {condition}
-        """
-        df = pd.read_sql(query, engine)
-        violations = int(df.iloc[0]['violations'])
-        if violations > 0:
-            logger.warning(f"⚠ {violations} violations in {table} for constraint {condition}")
+    try:
+        report = validate(
+            engine, sample_percent=sample_percent, start=start, end=end, files=files, partitions=partitions
+        )
+    except Exception as e:
+        logger.error(f"Validation error: {e}")
+        raise
+
+    for check in report.tables:
+        sampled = f", {sample_percent}% sample" if check.sampled else ""
+        logger.info(f"    - {check.table}: {check.rows_checked} rows checked ({check.scope}{sampled})")
+    for result in report.results:
+        if result.violations > 0:
+            logger.warning(f"⚠ {result.violations} violations in {result.table} for constraint {result.condition}")
         else:
-            logger.info(f"✓ {table}: {condition} - No violations")
+            logger.info(f"✓ {result.table}: {result.condition} - No violations")
+    return report
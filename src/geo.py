@@ -0,0 +1,166 @@
+import logging
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from pyproj import CRS, Transformer
+from .config import GEO_CACHE_DIR, MILANO_GRID_FILE, PROVINCES_FILE, TARGET_CRS
+from .manifest import file_hash
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _cache_prefix(source, crs):
+    crs_token = CRS.from_user_input(crs).to_string().replace(':', '').lower()
+    return f"{source.stem}-{crs_token}-"
+
+
+def _cache_path(source, crs):
+    return GEO_CACHE_DIR / f"{_cache_prefix(source, crs)}{file_hash(source)}.parquet"
+
+
+def read_geometries(source, crs=TARGET_CRS):
+    """Read a geometry file reprojected to ``crs``, through a local GeoParquet cache.
+
+    The cache entry is keyed by the source content hash and the CRS, so an edited file or
+    another CRS is read and reprojected again. Without pyarrow the cache is bypassed.
+    """
+    cache_file = _cache_path(source, crs)
+    if cache_file.exists():
+        try:
+            gdf = gpd.read_parquet(cache_file)
+            logger.info(f"    - {source.name}: {len(gdf)} geometries read from cache")
+            return gdf
+        except Exception as e:
+            logger.warning(f"⚠ Ignoring unreadable geometry cache {cache_file.name}: {e}")
+
+    gdf = gpd.read_file(source)
+    if gdf.crs != crs:
+        gdf = gdf.to_crs(crs)
+
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_file.with_suffix('.tmp')
+        gdf.to_parquet(tmp_file)
+        tmp_file.replace(cache_file)
+        # Only older hashes for the same CRS are stale; other CRSes keep their entries
+        for stale in cache_file.parent.glob(f"{_cache_prefix(source, crs)}*.parquet"):
+            if stale != cache_file:
+                stale.unlink()
+    except ImportError:
+        pass
+    except OSError as e:
+        logger.warning(f"⚠ Could not write geometry cache {cache_file.name}: {e}")
+    return gdf
+
+
+def format_bounds(geometries):
+    """Format each geometry's bounding box as 'minx,miny,maxx,maxy'."""
+    bounds = geometries.bounds.astype(str)
+    return bounds['minx'] + ',' + bounds['miny'] + ',' + bounds['maxx'] + ',' + bounds['maxy']
+
+
+def read_grid(source=MILANO_GRID_FILE, crs=TARGET_CRS):
+    """The Milan grid with its cell_id (row position in the source file) and bounds."""
+    gdf = read_geometries(source, crs)
+    gdf['cell_id'] = gdf.index
+    gdf['bounds'] = format_bounds(gdf.geometry)
+    return gdf
+
+
+def read_provinces(source=PROVINCES_FILE, crs=TARGET_CRS):
+    """The Italian provinces with their provincia name and population (0 when unknown)."""
+    gdf = read_geometries(source, crs)
+    if 'PROVINCIA' in gdf.columns:
+        gdf = gdf.rename(columns={'PROVINCIA': 'provincia'})
+    elif 'name' in gdf.columns:
+        gdf = gdf.rename(columns={'name': 'provincia'})
+
+    if 'population' in gdf.columns:
+        gdf['population'] = pd.to_numeric(gdf['population'], errors='coerce').fillna(0).astype(int)
+    else:
+        gdf['population'] = 0
+    return gdf
+
+
+def cell_province_overlaps(grid, provinces):
+    """Area of each grid cell lying in each province it overlaps.
+
+    ``weight`` is that area as a share of the cell, so a cell split by a border spreads its
+    traffic over the provinces in proportion; cells only touching a border are left out.
+    Both frames must be in the same projected CRS.
+    """
+    cells = grid.geometry.values
+    tree = shapely.STRtree(provinces.geometry.values)
+    cell_idx, province_idx = tree.query(cells, predicate='intersects')
+    areas = shapely.area(shapely.intersection(cells[cell_idx], provinces.geometry.values[province_idx]))
+    overlaps = pd.DataFrame({
+        'cell_id': grid['cell_id'].to_numpy()[cell_idx],
+        'provincia': provinces['provincia'].to_numpy()[province_idx],
+        'overlap_area': areas,
+        'weight': areas / shapely.area(cells[cell_idx]),
+    })
+    return overlaps[overlaps['overlap_area'] > 0].reset_index(drop=True)
+
+
+def cell_neighbours(grid, tolerance=0.001):
+    """Pairs of grid cells sharing an edge or a corner, with the length of the shared border.
+
+    ``tolerance`` (CRS units, metres for the target CRS) absorbs the rounding left by the
+    reprojection between vertices that coincide in the source; corners share a length of ~0.
+    """
+    cells = grid.geometry.values
+    cell_idx, neighbour_idx = shapely.STRtree(cells).query(cells, predicate='dwithin', distance=tolerance)
+    pairs = cell_idx != neighbour_idx
+    cell_idx, neighbour_idx = cell_idx[pairs], neighbour_idx[pairs]
+    shared = shapely.length(shapely.intersection(
+        shapely.boundary(cells[cell_idx]), shapely.buffer(shapely.boundary(cells[neighbour_idx]), tolerance)
+    ))
+    return pd.DataFrame({
+        'cell_id': grid['cell_id'].to_numpy()[cell_idx],
+        'neighbour_id': grid['cell_id'].to_numpy()[neighbour_idx],
+        'shared_length': np.round(shared, 3),
+    })
+
+
+class GridIndex:
+    """In-process point -> cell_id lookup over the Milan grid, backed by a shapely STRtree."""
+
+    def __init__(self, grid):
+        self.crs = grid.crs
+        self.cell_ids = grid['cell_id'].to_numpy()
+        self.tree = shapely.STRtree(grid.geometry.values)
+        self._transformers = {}
+
+    @classmethod
+    def from_file(cls, source=MILANO_GRID_FILE, crs=TARGET_CRS):
+        return cls(read_grid(source, crs))
+
+    def _to_index_crs(self, x, y, crs):
+        if crs is None or CRS.from_user_input(crs) == self.crs:
+            return x, y
+        key = CRS.from_user_input(crs).to_string()
+        if key not in self._transformers:
+            self._transformers[key] = Transformer.from_crs(crs, self.crs, always_xy=True)
+        return self._transformers[key].transform(x, y)
+
+    def lookup(self, x, y, crs=None):
+        """Return the cell_id containing each point, -1 where a point is outside the grid.
+
+        ``x``/``y`` are coordinate arrays in ``crs`` (default: the grid CRS; pass
+        'EPSG:4326' for longitude/latitude). Points on a shared edge get the lowest cell_id.
+        """
+        x, y = self._to_index_crs(np.asarray(x, dtype=float), np.asarray(y, dtype=float), crs)
+        points = shapely.points(np.atleast_1d(x), np.atleast_1d(y))
+        point_idx, cell_idx = self.tree.query(points, predicate='intersects')
+
+        cells = np.full(len(points), -1, dtype=np.int64)
+        order = np.lexsort((cell_idx, point_idx))
+        first_points, first = np.unique(point_idx[order], return_index=True)
+        cells[first_points] = self.cell_ids[cell_idx[order][first]]
+        return cells
+
+    def lookup_frame(self, df, x='lon', y='lat', crs='EPSG:4326'):
+        """Return ``df`` coordinates as a cell_id Series aligned on its index."""
+        return pd.Series(self.lookup(df[x].to_numpy(), df[y].to_numpy(), crs), index=df.index, name='cell_id')
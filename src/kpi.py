@@ -0,0 +1,114 @@
+import logging
+import pandas as pd
+from sqlalchemy import text
+from .config import BACKENDS, DEFAULT_BACKEND
+from .database import get_sqlalchemy_engine
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Start of the study period used by the top-cells query
+DEFAULT_SINCE = '2013-11-01 00:00'
+
+
+class PostgresBackend:
+    """Runs the KPI queries against the Postgres warehouse."""
+
+    name = 'postgres'
+    timestamp_type = 'TIMESTAMPTZ'
+
+    def query(self, sql, params=None):
+        return pd.read_sql(text(sql), get_sqlalchemy_engine(), params=params)
+
+
+def get_backend(backend=None):
+    """Resolve ``backend`` (a name, an instance or None for the configured default)."""
+    backend = backend or DEFAULT_BACKEND
+    if not isinstance(backend, str):
+        return backend
+    if backend == 'postgres':
+        return PostgresBackend()
+    if backend == 'duckdb':
+        from .duckdb_backend import DuckDBBackend
+        return DuckDBBackend()
+    raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+
+
+def _run(name, backend, sql, params=None):
+    backend = get_backend(backend)
+    try:
+        return backend.query(sql.format(ts=backend.timestamp_type), params)
+    except Exception as e:
+        logger.error(f"{name} query error ({backend.name}): {e}")
+        raise
+
+
+def _mean(df, total, count, name):
+    """Replace the ``total``/``count`` columns by their ratio.
+
+    Averages are divided here rather than in SQL, where each engine rounds differently,
+    so both backends return bit-identical values.
+    """
+    position = df.columns.get_loc(total)
+    values = df.pop(total) / df.pop(count)
+    df.insert(position, name, values)
+    return df
+
+
+def get_top_cells(limit=10, since=DEFAULT_SINCE, backend=None):
+    """Cells with the highest average hourly activity since ``since``."""
+    df = _run('Top cells', backend, """
+    SELECT cell_id, SUM(total_activity) AS total_activity, COUNT(*) AS hours
+    FROM agg_hourly_traffic
+    WHERE hour >= CAST(:since AS {ts})
+    GROUP BY cell_id
+    ORDER BY SUM(total_activity) / COUNT(*) DESC, cell_id
+    LIMIT :limit
+    """, {'since': since, 'limit': int(limit)})
+    return _mean(df, 'total_activity', 'hours', 'avg_load')
+
+
+def get_daily_totals(backend=None):
+    """Total SMS, call and internet activity per day."""
+    return _run('Daily totals', backend, """
+    SELECT
+        CAST(DATE_TRUNC('day', hour) AS DATE) AS day,
+        SUM(total_smsin + total_smsout) AS sms,
+        SUM(total_callin + total_callout) AS calls,
+        SUM(total_internet) AS internet,
+        SUM(total_activity) AS activity
+    FROM agg_hourly_traffic
+    GROUP BY 1
+    ORDER BY 1
+    """)
+
+
+def get_hourly_profile(cell_id=None, backend=None):
+    """Average activity per hour of the day, over all cells or for one ``cell_id``."""
+    where = "" if cell_id is None else "WHERE cell_id = :cell_id"
+    df = _run('Hourly profile', backend, f"""
+    SELECT
+        CAST(EXTRACT(HOUR FROM hour) AS INTEGER) AS hour_of_day,
+        SUM(total_activity) AS total_activity,
+        COUNT(*) AS hours
+    FROM agg_hourly_traffic
+    {where}
+    GROUP BY 1
+    ORDER BY 1
+    """, None if cell_id is None else {'cell_id': int(cell_id)})
+    return _mean(df, 'total_activity', 'hours', 'avg_activity')
+
+
+def get_top_provinces(limit=10, backend=None):
+    """Provinces exchanging the most mobility flows with Milan."""
+    return _run('Top provinces', backend, """
+    SELECT
+        provincia,
+        SUM(cell2province) AS outgoing,
+        SUM(province2cell) AS incoming,
+        SUM(cell2province + province2cell) AS total_flow
+    FROM fact_mobility_provinces
+    GROUP BY provincia
+    ORDER BY total_flow DESC, provincia
+    LIMIT :limit
+    """, {'limit': int(limit)})
@@ -0,0 +1,127 @@
+import logging
+import time
+from sqlalchemy import text
+from .config import LAYOUTS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Storage layouts of the fact tables (LAYOUTS):
+# - standard: NUMERIC measures, INTEGER keys, countrycode stored in each traffic row
+# - compact: REAL measures, SMALLINT cell and country keys (countrycode -> dim_country),
+#   fixed-width columns ordered widest first so rows carry no alignment padding
+# - wide: compact plus fact_traffic_cell_totals, one row per (datetime, cell) summed over
+#   the countries, which the hourly rollup and v_hourly_traffic read instead
+
+# Tables covered by the storage report
+REPORT_TABLES = ('fact_traffic_milan', 'fact_traffic_cell_totals', 'fact_mobility_provinces', 'agg_hourly_traffic')
+
+# Measure columns stored as REAL outside the standard layout
+_MEASURES = {
+    'traffic': ('smsin', 'smsout', 'callin', 'callout', 'internet'),
+    'mobility': ('cell2province', 'province2cell'),
+}
+
+
+def get_layout(conn):
+    """Return the storage layout the fact tables were created with ('standard' for older schemas)."""
+    layout = conn.execute(text("SELECT value FROM etl_schema_settings WHERE key = 'layout'")).scalar()
+    return layout if layout in LAYOUTS else 'standard'
+
+
+def country_keys(engine, codes):
+    """Map country codes to their dim_country keys, registering unknown codes first.
+
+    Runs in its own short transaction, so parallel loads only wait on each other while
+    a new code is being added. Only missing codes are inserted: a conflicting insert
+    would still consume a value of the SMALLINT key sequence.
+    """
+    codes = [int(code) for code in codes]
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO dim_country (countrycode)
+            SELECT code FROM unnest(CAST(:codes AS integer[])) AS code
+            WHERE NOT EXISTS (SELECT 1 FROM dim_country d WHERE d.countrycode = code)
+            ON CONFLICT (countrycode) DO NOTHING
+        """), {'codes': codes})
+        rows = conn.execute(
+            text("SELECT countrycode, country_key FROM dim_country WHERE countrycode = ANY(:codes)"),
+            {'codes': codes}
+        ).all()
+    return dict(rows)
+
+
+def to_layout(df, kind, layout, engine):
+    """Cast a cleaned chunk to the column types of the target layout."""
+    if layout == 'standard':
+        return df
+    df = df.astype({col: 'float32' for col in df.columns if col in _MEASURES[kind]}).astype({'cell_id': 'int16'})
+    if kind == 'traffic':
+        keys = country_keys(engine, df['countrycode'].unique())
+        df = df.assign(country_key=df['countrycode'].map(keys).astype('int16')).drop(columns='countrycode')
+    return df
+
+
+def _scan_seconds(conn, table):
+    measures = [col for cols in _MEASURES.values() for col in cols]
+    columns = conn.execute(text(
+        "SELECT attname FROM pg_attribute WHERE attrelid = CAST(:table AS regclass) AND attnum > 0 "
+        "AND NOT attisdropped ORDER BY attnum"
+    ), {'table': table}).scalars().all()
+    sums = [f"SUM({col})" for col in columns if col in measures or col.startswith('total_')] or ["COUNT(*)"]
+    start = time.perf_counter()
+    conn.execute(text(f"SELECT COUNT(*), {', '.join(sums)} FROM {table}")).all()
+    return time.perf_counter() - start
+
+
+def storage_report(engine, scan=True):
+    """On-disk size (heap, indexes, bytes per row) and full-scan time of the fact tables.
+
+    Sizes include every partition of a partitioned table. The scan sums each measure
+    column, which is what the rollup and the KPI queries read.
+    """
+    # Imported here: this module is on the --setup path (get_layout), which does not need pandas
+    import pandas as pd
+
+    rows = []
+    with engine.connect() as conn:
+        layout = get_layout(conn)
+        for table in REPORT_TABLES:
+            if not conn.execute(text("SELECT to_regclass(:table) IS NOT NULL"), {'table': table}).scalar():
+                continue
+            size = conn.execute(text("""
+                WITH parts AS (
+                    SELECT relid FROM pg_partition_tree(CAST(:table AS regclass)) WHERE isleaf
+                )
+                SELECT CAST(COALESCE(SUM(pg_table_size(r.relid)), 0) AS BIGINT) AS table_bytes,
+                       CAST(COALESCE(SUM(pg_indexes_size(r.relid)), 0) AS BIGINT) AS index_bytes
+                FROM (
+                    SELECT relid FROM parts
+                    UNION ALL
+                    SELECT CAST(:table AS regclass) WHERE NOT EXISTS (SELECT 1 FROM parts)
+                ) r
+            """), {'table': table}).mappings().one()
+            count = conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+            total = size['table_bytes'] + size['index_bytes']
+            rows.append({
+                'layout': layout,
+                'table': table,
+                'rows': count,
+                'table_bytes': size['table_bytes'],
+                'index_bytes': size['index_bytes'],
+                'total_bytes': total,
+                'bytes_per_row': round(total / count, 1) if count else None,
+                'scan_seconds': round(_scan_seconds(conn, table), 3) if scan else None,
+            })
+    return pd.DataFrame(rows)
+
+
+def log_storage_report(engine):
+    report = storage_report(engine)
+    for row in report.itertuples():
+        per_row = f"{row.bytes_per_row:.1f} B/row" if row.rows else "empty"
+        logger.info(
+            f"    - {row.table} ({row.layout}): {row.rows} rows, {row.table_bytes / 1e6:.1f} MB heap + "
+            f"{row.index_bytes / 1e6:.1f} MB indexes ({per_row}), full scan {row.scan_seconds:.2f}s"
+        )
+    return report
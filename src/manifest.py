@@ -0,0 +1,183 @@
+import hashlib
+import logging
+from sqlalchemy import text
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MANIFEST_TABLE = 'etl_load_manifest'
+
+STATUS_LOADED = 'loaded'
+STATUS_FAILED = 'failed'
+
+
+def file_hash(path, block_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_fingerprint(source):
+    """Size, mtime and content hash of a source file (a sources.SourceFile)."""
+    size, mtime = source.stat()
+    return {
+        'file_size': size,
+        'file_mtime': mtime,
+        'content_hash': source.content_hash(),
+    }
+
+
+def read_manifest(engine, target_table):
+    """Return the manifest entries of ``target_table`` keyed by file name."""
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(f"SELECT * FROM {MANIFEST_TABLE} WHERE target_table = :table"),
+            {'table': target_table}
+        ).mappings().all()
+    return {row['file_name']: dict(row) for row in rows}
+
+
+def data_version(conn):
+    """A token that changes whenever a file load commits, e.g. to invalidate cached query results.
+
+    Writes that change query results without loading a file (rollup rebuild, cell/province
+    overlaps) call bump_data_version(), whose counter is part of the token.
+    """
+    row = conn.execute(text(f"""
+        SELECT COUNT(*), MAX(loaded_at), COALESCE(SUM(rows_loaded), 0),
+               (SELECT value FROM etl_schema_settings WHERE key = 'data_version')
+        FROM {MANIFEST_TABLE}
+        WHERE status = :status
+    """), {'status': STATUS_LOADED}).one()
+    return f"{row[0]}:{row[1].isoformat() if row[1] else '-'}:{row[2]}:{row[3] or 0}"
+
+
+def bump_data_version(conn):
+    """Change the data_version() token, in the caller's transaction."""
+    conn.execute(text("""
+        INSERT INTO etl_schema_settings (key, value) VALUES ('data_version', '1')
+        ON CONFLICT (key) DO UPDATE SET value = CAST(CAST(etl_schema_settings.value AS BIGINT) + 1 AS TEXT)
+    """))
+
+
+def plan_files(csv_files, manifest):
+    """Split files into those needing a (re)load and the count of unchanged ones.
+
+    Size and mtime are compared first so an unchanged data dir needs no hashing;
+    files that differ are hashed later by the loader before anything is deleted.
+    """
+    pending = []
+    unchanged = 0
+    for csv_file in csv_files:
+        previous = manifest.get(csv_file.name)
+        size, mtime = csv_file.stat()
+        if (previous and previous['status'] == STATUS_LOADED
+                and previous['file_size'] == size
+                and previous['file_mtime'] == mtime):
+            unchanged += 1
+            continue
+        pending.append((csv_file, previous))
+    return pending, unchanged
+
+
+def is_same_content(previous, fingerprint):
+    return (
+        previous is not None
+        and previous['status'] == STATUS_LOADED
+        and previous['content_hash'] == fingerprint['content_hash']
+    )
+
+
+def touch_manifest(engine, target_table, file_name, fingerprint):
+    """Refresh size/mtime of an entry whose content did not change."""
+    with engine.begin() as conn:
+        conn.execute(
+            text(f"""
+            UPDATE {MANIFEST_TABLE}
+            SET file_size = :file_size, file_mtime = :file_mtime
+            WHERE target_table = :table AND file_name = :file_name
+            """),
+            {'table': target_table, 'file_name': file_name, **fingerprint}
+        )
+
+
+def delete_file_rows(conn, target_table, previous):
+    """Delete the rows a previous load of this file wrote, identified by its recorded time range.
+
+    Source files each cover a disjoint time range (one day per file in the Milan dump).
+    """
+    if previous is None or previous['min_datetime'] is None:
+        return 0
+    result = conn.execute(
+        text(f"DELETE FROM {target_table} WHERE datetime BETWEEN :start AND :end"),
+        {'start': previous['min_datetime'], 'end': previous['max_datetime']}
+    )
+    return result.rowcount
+
+
+def record_loaded(conn, target_table, file_name, fingerprint, stats):
+    conn.execute(
+        text(f"""
+        INSERT INTO {MANIFEST_TABLE} (
+            target_table, file_name, file_size, file_mtime, content_hash,
+            rows_read, rows_loaded, rows_rejected, min_datetime, max_datetime,
+            status, error, loaded_at
+        ) VALUES (
+            :table, :file_name, :file_size, :file_mtime, :content_hash,
+            :rows_read, :rows_loaded, :rows_rejected, :min_datetime, :max_datetime,
+            :status, NULL, NOW()
+        )
+        ON CONFLICT (target_table, file_name) DO UPDATE SET
+            file_size = EXCLUDED.file_size,
+            file_mtime = EXCLUDED.file_mtime,
+            content_hash = EXCLUDED.content_hash,
+            rows_read = EXCLUDED.rows_read,
+            rows_loaded = EXCLUDED.rows_loaded,
+            rows_rejected = EXCLUDED.rows_rejected,
+            min_datetime = EXCLUDED.min_datetime,
+            max_datetime = EXCLUDED.max_datetime,
+            status = EXCLUDED.status,
+            error = NULL,
+            loaded_at = EXCLUDED.loaded_at
+        """),
+        {
+            'table': target_table,
+            'file_name': file_name,
+            **fingerprint,
+            'rows_read': stats['initial'],
+            'rows_loaded': stats['final'],
+            'rows_rejected': stats['rejected'],
+            'min_datetime': stats['min_datetime'],
+            'max_datetime': stats['max_datetime'],
+            'status': STATUS_LOADED,
+        }
+    )
+
+
+def record_failed(engine, target_table, file_name, fingerprint, error):
+    """Mark a file as failed; a previous successful load keeps its recorded range and rows."""
+    try:
+        with engine.begin() as conn:
+            conn.execute(
+                text(f"""
+                INSERT INTO {MANIFEST_TABLE} (
+                    target_table, file_name, file_size, file_mtime, content_hash, status, error, loaded_at
+                ) VALUES (
+                    :table, :file_name, :file_size, :file_mtime, :content_hash, :status, :error, NOW()
+                )
+                ON CONFLICT (target_table, file_name) DO UPDATE SET
+                    status = EXCLUDED.status,
+                    error = EXCLUDED.error
+                """),
+                {
+                    'table': target_table,
+                    'file_name': file_name,
+                    **fingerprint,
+                    'status': STATUS_FAILED,
+                    'error': str(error)[:1000],
+                }
+            )
+    except Exception as e:
+        logger.error(f"Could not record failure of {file_name} in the manifest: {e}")
@@ -0,0 +1,156 @@
+import logging
+import time
+import urllib.request
+from contextlib import contextmanager
+from pathlib import Path
+from .config import METRICS_TEXTFILE, PUSHGATEWAY_URL, METRICS_JOB
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PREFIX = 'milan_etl'
+
+# name -> (type, help); every sample is exported as a gauge of the last run
+METRICS = {
+    'stage_duration_seconds': ('gauge', 'Wall time of a pipeline stage'),
+    'stage_success': ('gauge', '1 if the stage completed, 0 if it failed'),
+    'stage_peak_rss_bytes': ('gauge', 'Peak RSS of the pipeline process up to the end of the stage'),
+    'stage_last_run_timestamp_seconds': ('gauge', 'Unix time the stage finished'),
+    'file_rows_read': ('gauge', 'Rows read from a source file'),
+    'file_rows_loaded': ('gauge', 'Rows written to the fact table from a source file'),
+    'file_rows_rejected': ('gauge', 'Rows of a source file rejected during cleaning, by reason'),
+    'file_bytes': ('gauge', 'Size of a source file'),
+    'file_phase_seconds': ('gauge', 'Time spent on a source file per phase (read, clean, stage, serialize, write, rollup)'),
+    'file_peak_rss_bytes': ('gauge', 'Peak RSS of the process that loaded a source file'),
+    'table_rows_read': ('gauge', 'Rows read by the last load of a fact table'),
+    'table_rows_loaded': ('gauge', 'Rows written by the last load of a fact table'),
+    'table_rows_rejected': ('gauge', 'Rows rejected by the last load of a fact table, by reason'),
+    'table_bytes': ('gauge', 'Source bytes processed by the last load of a fact table'),
+    'table_files': ('gauge', 'Source files loaded by the last load of a fact table'),
+    'table_phase_seconds': ('gauge', 'Time summed over the files of the last load of a fact table, per phase'),
+}
+
+PHASES = ('read', 'clean', 'stage', 'serialize', 'write', 'rollup')
+
+_samples = {}
+
+
+def peak_rss_bytes():
+    """Peak resident set size of the current process (0 where unavailable)."""
+    if resource is None:
+        return 0
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def set_metric(name, value, **labels):
+    if name not in METRICS:
+        raise ValueError(f"Unknown metric '{name}'")
+    _samples[(name, tuple(sorted(labels.items())))] = float(value)
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage and export the metrics when it ends, whether it failed or not."""
+    start = time.perf_counter()
+    success = 0
+    try:
+        yield
+        success = 1
+    finally:
+        set_metric('stage_duration_seconds', time.perf_counter() - start, stage=name)
+        set_metric('stage_success', success, stage=name)
+        set_metric('stage_peak_rss_bytes', peak_rss_bytes(), stage=name)
+        set_metric('stage_last_run_timestamp_seconds', time.time(), stage=name)
+        export()
+
+
+def record_files(table, file_stats, reasons):
+    """Record the per-file and per-table load metrics from the stats returned by the loaders."""
+    totals = {'rows_read': 0, 'rows_loaded': 0, 'bytes': 0}
+    rejected = dict.fromkeys(reasons, 0)
+    phases = dict.fromkeys(PHASES, 0.0)
+    for stats in file_stats:
+        labels = {'table': table, 'file': stats['file']}
+        set_metric('file_rows_read', stats['initial'], **labels)
+        set_metric('file_rows_loaded', stats['final'], **labels)
+        set_metric('file_bytes', stats.get('bytes', 0), **labels)
+        set_metric('file_peak_rss_bytes', stats.get('peak_rss', 0), **labels)
+        for reason in reasons:
+            set_metric('file_rows_rejected', stats.get(reason, 0), reason=reason, **labels)
+            rejected[reason] += stats.get(reason, 0)
+        for phase in PHASES:
+            seconds = stats.get('timings', {}).get(phase, 0.0)
+            set_metric('file_phase_seconds', seconds, phase=phase, **labels)
+            phases[phase] += seconds
+        totals['rows_read'] += stats['initial']
+        totals['rows_loaded'] += stats['final']
+        totals['bytes'] += stats.get('bytes', 0)
+
+    set_metric('table_rows_read', totals['rows_read'], table=table)
+    set_metric('table_rows_loaded', totals['rows_loaded'], table=table)
+    set_metric('table_bytes', totals['bytes'], table=table)
+    set_metric('table_files', len(file_stats), table=table)
+    for reason, count in rejected.items():
+        set_metric('table_rows_rejected', count, table=table, reason=reason)
+    for phase, seconds in phases.items():
+        set_metric('table_phase_seconds', seconds, table=table, phase=phase)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def render():
+    """The recorded samples in the Prometheus text exposition format."""
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        samples = sorted((labels, value) for (metric, labels), value in _samples.items() if metric == name)
+        if not samples:
+            continue
+        lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{_escape(val)}"' for key, val in labels)
+            lines.append(f"{PREFIX}_{name}{{{label_text}}} {value!r}" if labels else f"{PREFIX}_{name} {value!r}")
+    return '\n'.join(lines) + '\n' if lines else ''
+
+
+def write_textfile(path):
+    """Write the metrics for the node_exporter textfile collector (atomic rename)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + '.tmp')
+    tmp_path.write_text(render())
+    tmp_path.replace(path)
+
+
+def push(url, job=METRICS_JOB):
+    """Replace this job's metric group on a Prometheus pushgateway."""
+    request = urllib.request.Request(
+        f"{url.rstrip('/')}/metrics/job/{job}", data=render().encode(), method='PUT',
+        headers={'Content-Type': 'text/plain; version=0.0.4'}
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        response.read()
+
+
+def export():
+    """Write/push the metrics to the configured targets; failures never stop the pipeline."""
+    if not _samples:
+        return
+    if METRICS_TEXTFILE:
+        try:
+            write_textfile(METRICS_TEXTFILE)
+        except OSError as e:
+            logger.warning(f"⚠ Could not write metrics file {METRICS_TEXTFILE}: {e}")
+    if PUSHGATEWAY_URL:
+        try:
+            push(PUSHGATEWAY_URL)
+        except Exception as e:
+            logger.warning(f"⚠ Could not push metrics to {PUSHGATEWAY_URL}: {e}")
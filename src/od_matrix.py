@@ -0,0 +1,191 @@
+import hashlib
+import io
+import logging
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from .config import OD_CACHE_DIR
+from .cube import CELLS
+from .database import get_sqlalchemy_engine
+from .manifest import STATUS_LOADED, read_manifest
+
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Bumped when the cached file layout changes, which invalidates every cached day
+FORMAT_VERSION = 1
+
+# Flow directions, named after the fact_mobility_provinces measures
+DIRECTIONS = ('cell2province', 'province2cell')
+
+
+def _require_scipy():
+    if sparse is None:
+        raise ImportError("The scipy package is required for the OD matrices (pip install scipy)")
+
+
+@dataclass
+class ODMatrix:
+    """Mobility flows between the grid cells (rows) and the provinces (columns) over [start, end).
+
+    ``outgoing`` holds the cell -> province flows (cell2province) and ``incoming`` the
+    province -> cell flows (province2cell), both CSR matrices of shape (cells, provinces)
+    with the columns in ``provinces`` order. Windows add up: ``a.outgoing + b.outgoing``.
+    """
+    start: pd.Timestamp
+    end: pd.Timestamp
+    provinces: list
+    outgoing: object
+    incoming: object
+
+    def column(self, provincia):
+        return self.provinces.index(provincia)
+
+    def net(self):
+        """Outgoing minus incoming flows per (cell, province)."""
+        return self.outgoing - self.incoming
+
+    def province_totals(self):
+        return pd.DataFrame({
+            'cell2province': np.asarray(self.outgoing.sum(axis=0)).ravel(),
+            'province2cell': np.asarray(self.incoming.sum(axis=0)).ravel(),
+        }, index=pd.Index(self.provinces, name='provincia'))
+
+    def cell_totals(self):
+        return pd.DataFrame({
+            'cell2province': np.asarray(self.outgoing.sum(axis=1)).ravel(),
+            'province2cell': np.asarray(self.incoming.sum(axis=1)).ravel(),
+        }, index=pd.RangeIndex(CELLS, name='cell_id'))
+
+
+def _day_key(day, entries, provinces):
+    """Token of what a day's matrices depend on: the mobility files loaded over it and the provinces."""
+    end = day + pd.Timedelta(days=1)
+    files = sorted(
+        f"{name}|{entry['loaded_at'].isoformat()}" for name, entry in entries.items()
+        if entry['min_datetime'] < end and entry['max_datetime'] >= day
+    )
+    content = '\n'.join([str(FORMAT_VERSION), *provinces, *files])
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+
+def _cache_path(day):
+    return OD_CACHE_DIR / f"od-{day:%Y-%m-%d}.npz"
+
+
+def _read_cached(day, key):
+    path = _cache_path(day)
+    if not path.exists():
+        return None
+    with np.load(path) as cached:
+        if str(cached['key']) != key:
+            return None
+        return tuple(
+            sparse.csr_matrix(
+                (cached[f'{direction}_data'], cached[f'{direction}_indices'], cached[f'{direction}_indptr']),
+                shape=tuple(cached['shape'])
+            )
+            for direction in DIRECTIONS
+        )
+
+
+def _write_cached(day, key, matrices):
+    OD_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    arrays = {'key': np.array(key), 'shape': np.array(matrices[0].shape)}
+    for direction, matrix in zip(DIRECTIONS, matrices):
+        arrays.update({
+            f'{direction}_data': matrix.data,
+            f'{direction}_indices': matrix.indices,
+            f'{direction}_indptr': matrix.indptr,
+        })
+    path = _cache_path(day)
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    tmp_path.replace(path)
+
+
+def _query_day(conn, day, provinces):
+    """Both flow matrices of one day, summed over its time slots, read with COPY."""
+    cursor = conn.connection.cursor()
+    try:
+        query = cursor.mogrify("""
+            SELECT cell_id, provincia, SUM(cell2province), SUM(province2cell)
+            FROM fact_mobility_provinces
+            WHERE datetime >= %(start)s AND datetime < %(end)s
+            GROUP BY cell_id, provincia
+        """, {'start': day.to_pydatetime(), 'end': (day + pd.Timedelta(days=1)).to_pydatetime()}).decode()
+        buffer = io.StringIO()
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+    buffer.seek(0)
+    df = pd.read_csv(
+        buffer, header=None, names=['cell_id', 'provincia', *DIRECTIONS],
+        dtype={'cell_id': np.int32, 'provincia': 'category', 'cell2province': np.float64, 'province2cell': np.float64}
+    )
+    columns = pd.Categorical(df['provincia'], categories=provinces).codes
+    shape = (CELLS, len(provinces))
+    return tuple(
+        sparse.csr_matrix((df[direction].to_numpy(), (df['cell_id'].to_numpy(), columns)), shape=shape)
+        for direction in DIRECTIONS
+    )
+
+
+def build_od_matrix(start, end=None, engine=None, cache=True):
+    """Cell x province flow matrices of the whole days from ``start`` up to ``end`` (excluded).
+
+    ``end`` defaults to the day after ``start``; days are those of the database time zone.
+    Each day is built once and cached in OD_CACHE_DIR, keyed on the manifest entries of
+    the mobility files covering it, so reloading a day's file rebuilds only that day.
+    """
+    _require_scipy()
+    engine = engine or get_sqlalchemy_engine()
+    try:
+        with engine.connect() as conn:
+            timezone = conn.execute(text("SHOW TimeZone")).scalar()
+            provinces = conn.execute(text("SELECT provincia FROM dim_provinces_it ORDER BY provincia")).scalars().all()
+
+            first = pd.Timestamp(start)
+            first = (first.tz_localize(timezone) if first.tzinfo is None else first.tz_convert(timezone)).normalize()
+            last = first + pd.Timedelta(days=1) if end is None else pd.Timestamp(end)
+            if last.tzinfo is None:
+                last = last.tz_localize(timezone)
+            days = pd.date_range(first, last, freq='D', inclusive='left')
+            if days.empty:
+                raise ValueError(f"Empty OD window: {start} to {end}")
+
+            entries = {
+                name: entry for name, entry in read_manifest(engine, 'fact_mobility_provinces').items()
+                if entry['status'] == STATUS_LOADED and entry['min_datetime'] is not None
+            }
+            shape = (CELLS, len(provinces))
+            outgoing = sparse.csr_matrix(shape)
+            incoming = sparse.csr_matrix(shape)
+            cached = 0
+            for day in days:
+                key = _day_key(day, entries, provinces)
+                matrices = _read_cached(day, key) if cache else None
+                if matrices is None:
+                    matrices = _query_day(conn, day, provinces)
+                    if cache:
+                        _write_cached(day, key, matrices)
+                else:
+                    cached += 1
+                outgoing = outgoing + matrices[0]
+                incoming = incoming + matrices[1]
+
+        logger.info(
+            f"✓ OD matrix {days[0]:%Y-%m-%d} to {days[-1]:%Y-%m-%d}: {len(days)} days "
+            f"({cached} from cache), {outgoing.nnz} cell/province pairs"
+        )
+        return ODMatrix(days[0], days[-1] + pd.Timedelta(days=1), list(provinces), outgoing, incoming)
+    except Exception as e:
+        logger.error(f"OD matrix build error: {e}")
+        raise
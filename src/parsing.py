@@ -0,0 +1,313 @@
+import logging
+import numpy as np
+import pandas as pd
+from .config import PARSERS
+from .sources import as_source
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+    pc = None
+    pa_csv = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+METRIC_COLS = ['smsin', 'smsout', 'callin', 'callout', 'internet']
+FLOW_COLS = ['cell2province', 'province2cell']
+
+# One mobility fact per key; rows sharing it (e.g. two spellings of a province) are summed
+MOBILITY_KEY = ['datetime', 'cell_id', 'provincia']
+
+# Declared source schemas for the fast path. The datetime column is read as text and
+# parsed explicitly; cell ids are narrowed to int16 once out-of-range rows are gone.
+# Country codes are dialing prefixes with no upper bound in the source, so they stay int32.
+# Province names repeat ~110 values over millions of rows and are read dictionary-encoded.
+# Measures stay float64 so the NUMERIC columns of the standard layout keep every digit;
+# the compact layouts narrow them to float32 when casting to their REAL columns.
+TRAFFIC_DTYPES = {
+    'datetime': 'string',
+    'CellID': 'int32',
+    'countrycode': 'int32',
+    'smsin': 'float64',
+    'smsout': 'float64',
+    'callin': 'float64',
+    'callout': 'float64',
+    'internet': 'float64',
+}
+
+MOBILITY_DTYPES = {
+    'datetime': 'string',
+    'CellID': 'int32',
+    'provinceName': 'category',
+    'cell2Province': 'float64',
+    'Province2cell': 'float64',
+}
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+PROVINCE_MAP = {
+    "Monza E Della Brianza": "Monza e della Brianza",
+    "Reggio Nell'Emilia": "Reggio nell'Emilia",
+    "Reggio Di Calabria": "Reggio di Calabria",
+    "Pesaro E Urbino": "Pesaro e Urbino",
+    "Massa-Carrara": "Massa Carrara",
+    "Valle D'Aosta": "Aosta",
+    "Bolzano/Bozen": "Bolzano",
+}
+
+# Measures are left to pandas inference: a malformed value must not fail the whole file,
+# it is coerced to NaN (then 0) by the cleaning, as with --parser infer
+_PANDAS_DTYPES = {'string': 'object', 'category': 'category', 'int32': 'Int32', 'float64': None}
+
+# Integer columns stay integers when a field is empty (NA instead of a float64 column)
+_NULLABLE_TYPES = {pa.int32(): pd.Int32Dtype()} if pa is not None else {}
+
+# Rows of unknown province names are reported under this name when the name is missing
+MISSING_PROVINCE = '<missing>'
+
+
+def _arrow_type(dtype):
+    if dtype == 'category':
+        return pa.dictionary(pa.int32(), pa.string())
+    if dtype == 'float64':
+        # Read as text and cast per chunk (see _arrow_to_pandas)
+        return pa.string()
+    return getattr(pa, dtype)()
+
+
+def _arrow_types(dtypes):
+    return {name: _arrow_type(dtype) for name, dtype in dtypes.items()}
+
+
+def _arrow_to_pandas(table, dtypes):
+    """Convert to pandas, parsing the datetime and measure text in Arrow so no Python strings are built.
+
+    A measure column holding a malformed value (e.g. 'abc') is left as text for that chunk
+    and coerced by the cleaning, like the inference path, instead of failing the file.
+    """
+    if 'datetime' in table.column_names and pa.types.is_string(table.schema.field('datetime').type):
+        parsed = pc.strptime(table['datetime'], format=DATETIME_FORMAT, unit='s', error_is_null=True)
+        # All-null means another encoding (e.g. epoch ms); leave it to parse_datetime.
+        if parsed.null_count < len(parsed):
+            table = table.set_column(table.schema.get_field_index('datetime'), 'datetime', parsed)
+    for name, dtype in dtypes.items():
+        if dtype != 'float64' or name not in table.column_names:
+            continue
+        try:
+            values = pc.cast(table[name], pa.float64())
+        except pa.ArrowInvalid:
+            continue
+        table = table.set_column(table.schema.get_field_index(name), name, values)
+    return table.to_pandas(self_destruct=True, types_mapper=_NULLABLE_TYPES.get)
+
+
+def _read_arrow_chunks(csv_file, dtypes, chunk_rows):
+    # Empty fields become nulls rather than '' so the measure casts accept them
+    convert_options = pa_csv.ConvertOptions(column_types=_arrow_types(dtypes), strings_can_be_null=True)
+    if not chunk_rows:
+        yield _arrow_to_pandas(pa_csv.read_csv(csv_file, convert_options=convert_options), dtypes)
+        return
+
+    batches = []
+    rows = 0
+    yielded = False
+    with pa_csv.open_csv(csv_file, convert_options=convert_options) as reader:
+        schema = reader.schema
+        for batch in reader:
+            batches.append(batch)
+            rows += batch.num_rows
+            if rows >= chunk_rows:
+                table = pa.Table.from_batches(batches)
+                batches = []
+                rows = 0
+                yielded = True
+                yield _arrow_to_pandas(table, dtypes)
+    if batches:
+        yield _arrow_to_pandas(pa.Table.from_batches(batches), dtypes)
+    elif not yielded:
+        # A header-only file still gives one empty frame, like pandas and chunk_rows=0
+        yield _arrow_to_pandas(schema.empty_table(), dtypes)
+
+
+def read_csv_chunks(source, chunk_rows=None, dtypes=None):
+    """Yield the file as DataFrames of about ``chunk_rows`` rows (whole file if falsy).
+
+    ``source`` is a path or a SourceFile; compressed files and archive members are
+    decompressed as they are parsed. With ``dtypes`` the declared schema is applied while
+    parsing, through the pyarrow CSV reader when it is installed; without it pandas infers
+    the column types.
+    """
+    with as_source(source).open() as csv_file:
+        if dtypes and pa_csv is not None:
+            yield from _read_arrow_chunks(csv_file, dtypes, chunk_rows)
+            return
+
+        read_kwargs = {}
+        if dtypes:
+            read_kwargs['dtype'] = {
+                name: _PANDAS_DTYPES[dtype] for name, dtype in dtypes.items() if _PANDAS_DTYPES[dtype]
+            }
+
+        if not chunk_rows:
+            yield pd.read_csv(csv_file, **read_kwargs)
+            return
+        with pd.read_csv(csv_file, chunksize=chunk_rows, **read_kwargs) as reader:
+            yield from reader
+
+
+def parse_datetime(values):
+    """Parse the source datetime column, given either as epoch milliseconds or ISO text."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    if pd.api.types.is_numeric_dtype(values):
+        return pd.to_datetime(values, unit='ms', errors='coerce')
+
+    parsed = pd.to_datetime(values, format=DATETIME_FORMAT, errors='coerce')
+    if parsed.isna().any():
+        parsed = parsed.fillna(pd.to_datetime(values[parsed.isna()], format='ISO8601', errors='coerce'))
+    if len(values) and parsed.isna().all():
+        epoch_ms = pd.to_numeric(values, errors='coerce')
+        if epoch_ms.notna().any():
+            return pd.to_datetime(epoch_ms, unit='ms', errors='coerce')
+    return parsed
+
+
+def _numeric_block(df, columns):
+    """Return ``columns`` of ``df`` as one numeric frame, zero-filling missing columns."""
+    block = df.reindex(columns=columns, fill_value=0)
+    if not all(pd.api.types.is_numeric_dtype(dtype) for dtype in block.dtypes):
+        block = block.apply(pd.to_numeric, errors='coerce')
+    return block
+
+
+def _valid_cells(cell_ids):
+    valid = cell_ids.between(0, 9999)
+    if valid.dtype != bool:
+        valid = valid.fillna(False).astype(bool)
+    return valid
+
+
+def clean_traffic_chunk(df):
+    """Apply the traffic cleaning rules to one chunk; returns the cleaned frame and its stats."""
+    stats = {'initial': len(df), 'invalid_dates': 0, 'invalid_cells': 0, 'invalid_countries': 0, 'negative': {}}
+
+    datetimes = parse_datetime(df['datetime'])
+    valid_dates = datetimes.notna()
+    stats['invalid_dates'] = int((~valid_dates).sum())
+
+    metrics = _numeric_block(df, METRIC_COLS)
+    stats['negative'] = {col: int(count) for col, count in (metrics < 0).sum().items()}
+    metrics.fillna(0, inplace=True)
+    metrics.clip(lower=0, inplace=True)
+
+    valid_cells = _valid_cells(df['CellID'])
+    stats['invalid_cells'] = int((valid_dates & ~valid_cells).sum())
+
+    # countrycode is part of the key: rows without one cannot be loaded
+    countries = df['countrycode']
+    if not pd.api.types.is_numeric_dtype(countries):
+        countries = pd.to_numeric(countries, errors='coerce')
+    valid_countries = countries.notna()
+    stats['invalid_countries'] = int((valid_dates & valid_cells & ~valid_countries).sum())
+    keep = valid_dates & valid_cells & valid_countries
+
+    cleaned = pd.concat([
+        datetimes[keep].rename('datetime'),
+        df['CellID'][keep].astype('int16').rename('cell_id'),
+        countries[keep].astype('int32'),
+        metrics[keep],
+    ], axis=1, copy=False)
+
+    stats['final'] = len(cleaned)
+    return cleaned, stats
+
+
+class ProvinceNormalizer:
+    """Map raw ``provinceName`` values to the canonical dim_provinces_it names.
+
+    Only the distinct raw values are normalized (title case, PROVINCE_MAP aliases, lookup
+    in the canonical list) and the result is broadcast through categorical codes, so the
+    per-row work is integer indexing. Normalized values are remembered across chunks and
+    files; the cleaned ``provincia`` column is a categorical over the canonical names.
+    """
+
+    def __init__(self, valid_provinces, aliases=None):
+        self.dtype = pd.CategoricalDtype(sorted(set(valid_provinces)))
+        self.aliases = dict(PROVINCE_MAP if aliases is None else aliases)
+        self._codes = {}
+
+    def _code(self, raw):
+        if raw not in self._codes:
+            name = str(raw).title().strip()
+            self._codes[raw] = self.dtype.categories.get_indexer([self.aliases.get(name, name)])[0]
+        return self._codes[raw]
+
+    def normalize(self, names):
+        """Return ``names`` as a categorical of canonical provinces, NaN where unknown."""
+        if isinstance(names.dtype, pd.CategoricalDtype):
+            codes, uniques = names.cat.codes.to_numpy(), names.cat.categories
+        else:
+            codes, uniques = pd.factorize(names)
+        lookup = np.array([self._code(raw) for raw in uniques] + [-1], dtype=np.int16)
+        # Missing names have code -1, which picks the trailing "unknown" entry
+        categorical = pd.Categorical.from_codes(lookup[codes], dtype=self.dtype)
+        return pd.Series(categorical, index=names.index, name=names.name)
+
+
+def merge_duplicate_keys(df, keys, measures):
+    """Sum the ``measures`` of rows sharing ``keys``; returns the frame and the number of rows merged."""
+    if not df.duplicated(keys).any():
+        return df, 0
+    merged = df.groupby(keys, observed=True, sort=False, as_index=False)[measures].sum()
+    return merged, len(df) - len(merged)
+
+
+def clean_mobility_chunk(df, valid_provinces):
+    """Apply the mobility cleaning rules to one chunk; returns the cleaned frame and its stats.
+
+    ``valid_provinces`` is a ProvinceNormalizer or the list of canonical province names.
+    Rows of unknown provinces are counted per raw name in ``stats['unknown_provinces']``;
+    rows repeating a (datetime, cell, province) key are summed into one and counted in
+    ``stats['duplicates_merged']``.
+    """
+    normalizer = valid_provinces
+    if not isinstance(normalizer, ProvinceNormalizer):
+        normalizer = ProvinceNormalizer(valid_provinces)
+    stats = {
+        'initial': len(df), 'invalid_dates': 0, 'invalid_provinces': 0, 'invalid_cells': 0,
+        'duplicates_merged': 0, 'unknown_provinces': {},
+    }
+
+    datetimes = parse_datetime(df['datetime'])
+    valid_dates = datetimes.notna()
+    stats['invalid_dates'] = int((~valid_dates).sum())
+
+    flows = _numeric_block(df, ['cell2Province', 'Province2cell']).set_axis(FLOW_COLS, axis=1)
+    flows.fillna(0, inplace=True)
+
+    provinces = normalizer.normalize(df['provinceName'])
+    known_provinces = provinces.notna()
+    unknown = valid_dates & ~known_provinces
+    stats['invalid_provinces'] = int(unknown.sum())
+    if stats['invalid_provinces']:
+        names = df['provinceName'][unknown].astype(object).fillna(MISSING_PROVINCE)
+        stats['unknown_provinces'] = {str(name): int(count) for name, count in names.value_counts().items()}
+
+    valid_cells = _valid_cells(df['CellID'])
+    stats['invalid_cells'] = int((valid_dates & known_provinces & ~valid_cells).sum())
+    keep = valid_dates & known_provinces & valid_cells
+
+    cleaned = pd.concat([
+        datetimes[keep].rename('datetime'),
+        df['CellID'][keep].astype('int16').rename('cell_id'),
+        provinces[keep].rename('provincia'),
+        flows[keep],
+    ], axis=1, copy=False)
+    cleaned, stats['duplicates_merged'] = merge_duplicate_keys(cleaned, MOBILITY_KEY, FLOW_COLS)
+
+    stats['final'] = len(cleaned)
+    return cleaned, stats
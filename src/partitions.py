@@ -0,0 +1,109 @@
+import logging
+import pandas as pd
+from sqlalchemy import text
+from .config import GRANULARITIES
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Partitioned tables and their range key
+PARTITION_KEYS = {
+    'fact_traffic_milan': 'datetime',
+    'fact_mobility_provinces': 'datetime',
+    'fact_traffic_cell_totals': 'datetime',
+    'agg_hourly_traffic': 'hour',
+}
+
+
+def get_partitioning(conn):
+    """Return the partition granularity the fact tables were created with, or None."""
+    granularity = conn.execute(text("""
+        SELECT s.value
+        FROM etl_schema_settings s
+        WHERE s.key = 'partitioning'
+          AND EXISTS (
+              SELECT 1 FROM pg_partitioned_table
+              WHERE partrelid = 'fact_traffic_milan'::regclass
+          )
+    """)).scalar()
+    return granularity if granularity in GRANULARITIES else None
+
+
+def period_starts(timestamps, granularity):
+    """Map each timestamp to the start of its partition period (weeks start on Monday)."""
+    days = timestamps.dt.floor('D')
+    if granularity == 'weekly':
+        days = days - pd.to_timedelta(days.dt.weekday, unit='D')
+    return days
+
+
+def period_end(start, granularity):
+    return start + pd.Timedelta(days=7 if granularity == 'weekly' else 1)
+
+
+def partition_name(table, start):
+    return f"{table}_p{start:%Y%m%d}"
+
+
+def _bound(ts):
+    return f"'{ts:%Y-%m-%d %H:%M:%S}'"
+
+
+def _lock(conn, name):
+    conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:name))"), {'name': name})
+
+
+def create_partition(conn, table, start, granularity, attach=True):
+    """Create the partition of ``table`` for the period starting at ``start`` unless it exists.
+
+    The partition is created standalone and then attached, which only takes a SHARE UPDATE
+    EXCLUSIVE lock on the parent, so loads running into other partitions are not blocked.
+    With ``attach=False`` it is left detached and index-free for a bulk load, and must be
+    finished with attach_partition() in the same transaction.
+    Returns the partition name and whether this call created it.
+    """
+    name = partition_name(table, start)
+    _lock(conn, name)
+    exists = conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {'name': name}).scalar()
+    if exists:
+        return name, False
+
+    conn.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    if attach:
+        attach_partition(conn, table, name, start, granularity)
+    return name, True
+
+
+def attach_partition(conn, table, name, start, granularity):
+    """Attach a loaded partition; its indexes and foreign keys are built during the attach.
+
+    A matching CHECK constraint is added first so the attach skips its validation scan.
+    """
+    key = PARTITION_KEYS[table]
+    low, high = _bound(start), _bound(period_end(start, granularity))
+    conn.execute(text(f"ALTER TABLE {name} ADD CONSTRAINT {name}_bounds CHECK ({key} >= {low} AND {key} < {high})"))
+    conn.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ({low}) TO ({high})"))
+    conn.execute(text(f"ALTER TABLE {name} DROP CONSTRAINT {name}_bounds"))
+
+
+def ensure_partitions(engine, table, start, end, granularity):
+    """Create and attach any missing partitions of ``table`` covering [start, end].
+
+    Runs in its own short transaction so the parent is never locked for the length of a load.
+    """
+    if start is None:
+        return []
+    periods = pd.date_range(
+        period_starts(pd.Series([pd.Timestamp(start)]), granularity).iloc[0],
+        pd.Timestamp(end),
+        freq='7D' if granularity == 'weekly' else 'D'
+    )
+    created = []
+    with engine.begin() as conn:
+        for period in periods:
+            name, is_new = create_partition(conn, table, period, granularity)
+            if is_new:
+                created.append(name)
+    if created:
+        logger.info(f"    - created partitions {', '.join(created)}")
+    return created
@@ -0,0 +1,63 @@
+import queue
+import threading
+import time
+
+# Marks the end of the produced chunks in the queue
+_DONE = object()
+
+# Seconds between checks of the stop flag while the queue is full
+_PUT_TIMEOUT = 0.1
+
+
+def prefetch(chunks, depth, timings=None):
+    """Iterate ``chunks`` from a background thread that stays at most ``depth`` items ahead.
+
+    The producer thread reads and cleans the next chunks while the caller writes the
+    current one; the bounded queue blocks it once ``depth`` chunks are waiting, so at most
+    depth + 2 chunks are in memory. An exception raised by the producer is re-raised to
+    the caller. When the caller stops early (error or close()), the producer is stopped
+    and ``chunks`` is closed from its own thread, so generator cleanup still runs.
+    Time the caller spends waiting for chunks is added to ``timings['wait']``.
+    """
+    buffer = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=_PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        item = _DONE
+        try:
+            for chunk in chunks:
+                if not put(chunk):
+                    return
+        except BaseException as e:
+            item = e
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+        put(item)
+
+    producer = threading.Thread(target=produce, name='chunk-producer', daemon=True)
+    producer.start()
+    try:
+        while True:
+            start = time.perf_counter()
+            item = buffer.get()
+            if timings is not None:
+                timings['wait'] = timings.get('wait', 0.0) + time.perf_counter() - start
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+            del item
+    finally:
+        stop.set()
+        producer.join()
@@ -0,0 +1,191 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+import pandas as pd
+from .config import QUERY_CACHE_SIZE, QUERY_CACHE_TTL
+from .database import get_sqlalchemy_engine
+from .manifest import data_version
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Traffic measures of agg_hourly_traffic that the queries can rank or chart
+METRICS = ('smsin', 'smsout', 'callin', 'callout', 'internet', 'activity')
+PERIODS = ('hour', 'day', 'week')
+
+# name -> (SQL with $n placeholders, parameter types). {column} and {metric} are filled
+# from METRICS, so each metric gets its own prepared statement; everything else is a parameter.
+# Open time bounds are passed as -infinity/infinity rather than NULL so the generic plan
+# keeps its range conditions (and partition pruning).
+STATEMENTS = {
+    'top_cells': ("""
+        SELECT cell_id, SUM({column}) AS {metric}, COUNT(*) AS hours
+        FROM agg_hourly_traffic
+        WHERE hour >= $1 AND hour < $2
+        GROUP BY cell_id
+        ORDER BY SUM({column}) DESC, cell_id
+        LIMIT $3
+    """, ('timestamptz', 'timestamptz', 'integer')),
+    'top_provinces': ("""
+        SELECT o.provincia, SUM(CAST(a.{column} AS DOUBLE PRECISION) * o.weight) AS {metric},
+               COUNT(DISTINCT a.cell_id) AS cells
+        FROM agg_hourly_traffic a
+        JOIN dim_cell_province o ON o.cell_id = a.cell_id
+        WHERE a.hour >= $1 AND a.hour < $2
+        GROUP BY o.provincia
+        ORDER BY 2 DESC, o.provincia
+        LIMIT $3
+    """, ('timestamptz', 'timestamptz', 'integer')),
+    'cell_series': ("""
+        SELECT DATE_TRUNC($4, hour) AS period, SUM({column}) AS {metric}
+        FROM agg_hourly_traffic
+        WHERE hour >= $1 AND hour < $2 AND cell_id = $3
+        GROUP BY 1
+        ORDER BY 1
+    """, ('timestamptz', 'timestamptz', 'integer', 'text')),
+    'province_series': ("""
+        SELECT DATE_TRUNC($4, a.hour) AS period, SUM(CAST(a.{column} AS DOUBLE PRECISION) * o.weight) AS {metric}
+        FROM agg_hourly_traffic a
+        JOIN dim_cell_province o ON o.cell_id = a.cell_id
+        WHERE a.hour >= $1 AND a.hour < $2 AND o.provincia = $3
+        GROUP BY 1
+        ORDER BY 1
+    """, ('timestamptz', 'timestamptz', 'text', 'text')),
+}
+
+
+class QueryCache:
+    """LRU cache of query results whose entries also expire after ``ttl`` seconds.
+
+    Entries belong to one data version (see manifest.data_version()): seeing a new
+    version drops them all, and results computed under an older one are not stored.
+    """
+
+    def __init__(self, maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, version):
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            if version != self._version:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._version = None
+
+    def info(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries),
+                    'maxsize': self.maxsize, 'ttl': self.ttl, 'version': self._version}
+
+
+_cache = QueryCache()
+
+
+def clear_cache():
+    _cache.clear()
+
+
+def cache_info():
+    return _cache.info()
+
+
+def _column(metric):
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric '{metric}', expected one of {METRICS}")
+    return f"total_{metric}"
+
+
+def _bounds(start, end):
+    return (
+        '-infinity' if start is None else str(pd.Timestamp(start)),
+        'infinity' if end is None else str(pd.Timestamp(end)),
+    )
+
+
+def _execute(conn, statement, sql, types, values):
+    """EXECUTE a statement, PREPAREd once per pooled connection."""
+    prepared = conn.info.setdefault('prepared_statements', set())
+    try:
+        if statement not in prepared:
+            conn.exec_driver_sql(f"PREPARE {statement} ({', '.join(types)}) AS {sql}")
+            prepared.add(statement)
+        result = conn.exec_driver_sql(f"EXECUTE {statement} ({', '.join(['%s'] * len(values))})", values)
+        return pd.DataFrame.from_records(result.fetchall(), columns=list(result.keys()), coerce_float=True)
+    except Exception:
+        # Drop the session with its prepared statements, which may be stale (e.g. schema recreated)
+        conn.invalidate()
+        raise
+
+
+def _run(name, metric, values, engine=None, cache=True):
+    sql, types = STATEMENTS[name]
+    statement = f"q_{name}_{metric}"
+    sql = sql.format(column=_column(metric), metric=metric)
+    key = (statement, values)
+    try:
+        with (engine or get_sqlalchemy_engine()).connect() as conn:
+            version = data_version(conn)
+            df = _cache.get(key, version) if cache else None
+            if df is None:
+                df = _execute(conn, statement, sql, types, values)
+                if cache:
+                    _cache.put(key, df, version)
+    except Exception as e:
+        logger.error(f"{name} query error: {e}")
+        raise
+    return df.copy()
+
+
+def top_cells(limit=10, metric='activity', start=None, end=None, engine=None, cache=True):
+    """The ``limit`` cells with the highest total ``metric`` between ``start`` (included) and ``end``."""
+    return _run('top_cells', metric, (*_bounds(start, end), int(limit)), engine, cache)
+
+
+def top_provinces(limit=10, metric='activity', start=None, end=None, engine=None, cache=True):
+    """The ``limit`` provinces with the highest area-weighted ``metric`` (see dim_cell_province)."""
+    return _run('top_provinces', metric, (*_bounds(start, end), int(limit)), engine, cache)
+
+
+def _period(period):
+    if period not in PERIODS:
+        raise ValueError(f"Unknown period '{period}', expected one of {PERIODS}")
+    return period
+
+
+def cell_series(cell_id, metric='activity', start=None, end=None, period='hour', engine=None, cache=True):
+    """``metric`` of one cell per hour, day or week."""
+    return _run('cell_series', metric, (*_bounds(start, end), int(cell_id), _period(period)), engine, cache)
+
+
+def province_series(provincia, metric='activity', start=None, end=None, period='hour', engine=None, cache=True):
+    """Area-weighted ``metric`` of one province per hour, day or week."""
+    return _run('province_series', metric, (*_bounds(start, end), str(provincia), _period(period)), engine, cache)
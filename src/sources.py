@@ -0,0 +1,130 @@
+import gzip
+import hashlib
+import logging
+import time
+import zipfile
+from fnmatch import fnmatch
+from pathlib import Path, PurePosixPath
+from .config import DATA_DIR
+from .manifest import file_hash
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Compressed variants of a source file, by suffix. When the same CSV is present in several
+# forms, the plain file wins, then the suffixes in this order, then zip archive members.
+COMPRESSIONS = {'.gz': 'gzip', '.zst': 'zstd'}
+
+
+class SourceFile:
+    """A source CSV: a plain file, a .gz/.zst file or a member of a .zip archive.
+
+    ``name`` is the CSV file name without the compression suffix or archive path; it is
+    the manifest and staging key, so the same day keeps its entry whatever its packaging.
+    """
+
+    def __init__(self, path, member=None, member_info=None):
+        self.path = Path(path)
+        self.member = member
+        if member is not None:
+            self.compression = 'zip'
+            self.name = PurePosixPath(member).name
+            # (compressed size, mtime, CRC-32) read from the archive directory
+            self._member_info = member_info
+        else:
+            self.compression = COMPRESSIONS.get(self.path.suffix)
+            self.name = self.path.stem if self.compression else self.path.name
+
+    def __repr__(self):
+        return f"SourceFile({self.label!r})"
+
+    @property
+    def label(self):
+        return f"{self.path.name}:{self.member}" if self.member is not None else self.path.name
+
+    def stat(self):
+        """(size, mtime) of the stored bytes, for the manifest's cheap change check."""
+        if self.member is not None:
+            return self._member_info[0], self._member_info[1]
+        stat = self.path.stat()
+        return stat.st_size, stat.st_mtime
+
+    def content_hash(self):
+        """Hash of the stored (compressed) bytes, so no decompression is needed to detect changes.
+
+        Archive members are identified by their CRC-32 and sizes from the zip directory.
+        """
+        if self.member is not None:
+            size, _, crc = self._member_info
+            return hashlib.blake2b(f"{self.name}|{size}|{crc:08x}".encode(), digest_size=16).hexdigest()
+        return file_hash(self.path)
+
+    def open(self):
+        """Binary stream of the CSV text, decompressed on the fly (nothing is written to disk).
+
+        gzip and zstd go through Arrow's native codecs when available, which decompress
+        without holding the GIL; otherwise the gzip module or the zstandard package is used.
+        """
+        if self.member is not None:
+            # The member stream keeps the archive file open after the ZipFile is closed
+            with zipfile.ZipFile(self.path) as archive:
+                return archive.open(self.member)
+        if self.compression is None:
+            return open(self.path, 'rb')
+        if pa is not None and pa.Codec.is_available(self.compression):
+            return pa.input_stream(str(self.path), compression=self.compression)
+        if self.compression == 'gzip':
+            return gzip.open(self.path, 'rb')
+        if zstandard is None:
+            raise ImportError(f"Reading {self.path.name} requires pyarrow with zstd support or the zstandard package")
+        return zstandard.ZstdDecompressor().stream_reader(open(self.path, 'rb'), closefd=True)
+
+
+def as_source(source):
+    return source if isinstance(source, SourceFile) else SourceFile(source)
+
+
+def _archive_members(archive, pattern):
+    with zipfile.ZipFile(archive) as zf:
+        infos = [info for info in zf.infolist()
+                 if not info.is_dir() and fnmatch(PurePosixPath(info.filename).name, pattern)]
+    return [
+        SourceFile(archive, info.filename, (info.compress_size, time.mktime(info.date_time + (0, 0, -1)), info.CRC))
+        for info in sorted(infos, key=lambda info: info.filename)
+    ]
+
+
+def find_sources(pattern, data_dir=None):
+    """Source files of ``data_dir`` whose CSV name matches ``pattern``, sorted by name.
+
+    Matches ``pattern``, its .gz/.zst variants and members of the .zip archives of the
+    directory. A CSV present in several forms is read from the first one found only.
+    """
+    data_dir = Path(data_dir or DATA_DIR)
+    candidates = [
+        SourceFile(path)
+        for suffix in ('', *COMPRESSIONS)
+        for path in sorted(data_dir.glob(pattern + suffix))
+    ]
+    for archive in sorted(data_dir.glob('*.zip')):
+        try:
+            candidates += _archive_members(archive, pattern)
+        except zipfile.BadZipFile as e:
+            logger.warning(f"⚠ Skipping unreadable archive {archive.name}: {e}")
+
+    sources = {}
+    for source in candidates:
+        kept = sources.setdefault(source.name, source)
+        if kept is not source:
+            logger.warning(f"⚠ {source.label} ignored, {source.name} is already read from {kept.label}")
+    return [sources[name] for name in sorted(sources)]
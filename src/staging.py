@@ -0,0 +1,163 @@
+import hashlib
+import json
+import logging
+import shutil
+import pandas as pd
+from .config import STAGING_DIR
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    ds = None
+    pq = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Staged data lives in STAGING_DIR/<table>/day=YYYY-MM-DD/<source>.parquet. Entries are
+# described by STAGING_DIR/<table>/_sources/<source>.json; names starting with '_' are
+# ignored by pyarrow datasets, so readers only ever see published day files.
+SOURCES_DIR = '_sources'
+TMP_DIR = '_tmp'
+
+COMPRESSION = 'zstd'
+
+# Part of every staging key; bumped when the cleaned frames change
+# (2: float64 measures, 3: rows without countrycode rejected)
+FORMAT_VERSION = 3
+
+
+def staging_available():
+    return pq is not None
+
+
+def staging_key(content_hash, parser, variant=''):
+    """Identify one cleaned version of a source file: its content, parser and cleaning inputs."""
+    return hashlib.blake2b(f"{FORMAT_VERSION}|{content_hash}|{parser}|{variant}".encode(), digest_size=16).hexdigest()
+
+
+def _table_dir(table):
+    return STAGING_DIR / table
+
+
+def _sidecar(table, source_name):
+    return _table_dir(table) / SOURCES_DIR / f"{source_name}.json"
+
+
+def read_entry(table, source_name, key):
+    """Return the staging entry of a source file if it was staged with ``key``, else None."""
+    path = _sidecar(table, source_name)
+    if not path.exists():
+        return None
+    entry = json.loads(path.read_text())
+    if entry.get('key') != key:
+        return None
+    if not all((_table_dir(table) / part).exists() for part in entry['parts']):
+        return None
+    return entry
+
+
+def staged_chunks(table, entry):
+    """Yield the cleaned frames of a staged source file, one per row group."""
+    for part in entry['parts']:
+        parquet_file = pq.ParquetFile(_table_dir(table) / part)
+        for i in range(parquet_file.num_row_groups):
+            yield parquet_file.read_row_group(i).to_pandas(self_destruct=True)
+
+
+class StagedWriter:
+    """Write the cleaned chunks of one source file as compressed Parquet files, one per day.
+
+    Files are written to a private temporary directory and only replace the previous
+    staged version of the source in publish().
+    """
+
+    def __init__(self, table, source_name, key):
+        self.table = table
+        self.source_name = source_name
+        self.key = key
+        self.stem = source_name.split('.')[0]
+        self.tmp_dir = _table_dir(table) / TMP_DIR / self.stem
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        self.tmp_dir.mkdir(parents=True)
+        self.writers = {}
+
+    def write(self, df):
+        days = df['datetime'].dt.normalize()
+        unique_days = days.unique()
+        for day_start in unique_days:
+            part = df if len(unique_days) == 1 else df[days == day_start]
+            day = pd.Timestamp(day_start).strftime('%Y-%m-%d')
+            table = pa.Table.from_pandas(part, preserve_index=False)
+            if day not in self.writers:
+                path = self.tmp_dir / f"day={day}" / f"{self.stem}.parquet"
+                path.parent.mkdir(parents=True, exist_ok=True)
+                self.writers[day] = pq.ParquetWriter(path, table.schema, compression=COMPRESSION)
+            writer = self.writers[day]
+            writer.write_table(table.cast(writer.schema))
+
+    def publish(self, stats):
+        """Close the day files and swap them in for any previously staged version of the source.
+
+        ``stats`` are the cleaning counters of the file, restored when it is read back.
+        """
+        for writer in self.writers.values():
+            writer.close()
+
+        table_dir = _table_dir(self.table)
+        sidecar = _sidecar(self.table, self.source_name)
+        if sidecar.exists():
+            for part in json.loads(sidecar.read_text())['parts']:
+                (table_dir / part).unlink(missing_ok=True)
+
+        parts = []
+        for day in sorted(self.writers):
+            part = f"day={day}/{self.stem}.parquet"
+            (table_dir / part).parent.mkdir(parents=True, exist_ok=True)
+            (self.tmp_dir / part).replace(table_dir / part)
+            parts.append(part)
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+        entry = {'key': self.key, 'parts': parts, 'stats': stats}
+        sidecar.parent.mkdir(parents=True, exist_ok=True)
+        tmp_sidecar = sidecar.with_suffix('.tmp')
+        tmp_sidecar.write_text(json.dumps(entry))
+        tmp_sidecar.replace(sidecar)
+        return entry
+
+    def abort(self):
+        for writer in self.writers.values():
+            writer.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+def read_staged(table, columns=None, start=None, end=None, filter=None):
+    """Read staged cleaned rows of ``table`` with a datetime in [start, end) as a DataFrame.
+
+    The end is exclusive, as in the other range queries. Only ``columns`` are read, day
+    directories outside the range are skipped and the datetime bounds (plus an optional
+    pyarrow ``filter`` expression) are pushed down to the Parquet row groups.
+    """
+    if not staging_available():
+        raise ImportError("pyarrow is required to read the staging area")
+    table_dir = _table_dir(table)
+    if not table_dir.exists():
+        return pd.DataFrame(columns=columns)
+
+    partitioning = ds.partitioning(pa.schema([('day', pa.string())]), flavor='hive')
+    dataset = ds.dataset(table_dir, format='parquet', partitioning=partitioning)
+    expression = filter
+    # The day of an exclusive end can still hold rows before it, so days are compared inclusively
+    for bound, day_op, op in ((start, '__ge__', '__ge__'), (end, '__le__', '__lt__')):
+        if bound is None:
+            continue
+        bound = pd.Timestamp(bound)
+        day = getattr(ds.field('day'), day_op)(bound.strftime('%Y-%m-%d'))
+        value = getattr(ds.field('datetime'), op)(bound.to_pydatetime())
+        clause = day & value
+        expression = clause if expression is None else expression & clause
+    columns = columns or [name for name in dataset.schema.names if name != 'day']
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
@@ -0,0 +1,176 @@
+import logging
+from dataclasses import dataclass, field
+from sqlalchemy import text
+from .manifest import MANIFEST_TABLE
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Rules checked per table; each table is validated in a single scan.
+RULES = {
+    'dim_grid_milan': ['(cell_id BETWEEN 0 AND 9999)'],
+    'dim_provinces_it': ['(population >= 0)'],
+    'fact_traffic_milan': [
+        '(smsin >= 0)',
+        '(smsout >= 0)',
+        '(callin >= 0)',
+        '(callout >= 0)',
+        '(internet >= 0)',
+    ],
+    'fact_mobility_provinces': [
+        '(cell2province >= 0)',
+        '(province2cell >= 0)',
+    ],
+}
+
+# Tables that can be scoped by time range, file or partition
+FACT_TABLES = ('fact_traffic_milan', 'fact_mobility_provinces')
+
+
+@dataclass
+class RuleResult:
+    table: str
+    condition: str
+    violations: int
+
+
+@dataclass
+class TableCheck:
+    table: str
+    rows_checked: int
+    scope: str
+    sampled: bool = False
+
+
+@dataclass
+class ValidationReport:
+    results: list = field(default_factory=list)
+    tables: list = field(default_factory=list)
+
+    @property
+    def violations(self):
+        return sum(result.violations for result in self.results)
+
+    @property
+    def ok(self):
+        return self.violations == 0
+
+    def failed(self):
+        return [result for result in self.results if result.violations]
+
+    def to_dicts(self):
+        return [vars(result) for result in self.results]
+
+
+def _file_ranges(conn, table, files):
+    return conn.execute(
+        text(f"""
+        SELECT min_datetime, max_datetime FROM {MANIFEST_TABLE}
+        WHERE target_table = :table AND file_name = ANY(:files) AND min_datetime IS NOT NULL
+        """),
+        {'table': table, 'files': list(files)}
+    ).all()
+
+
+def _table_partitions(conn, table, partitions):
+    return conn.execute(
+        text("""
+        SELECT inhrelid::regclass::text FROM pg_inherits
+        WHERE inhparent = CAST(:table AS regclass) AND inhrelid::regclass::text = ANY(:partitions)
+        ORDER BY 1
+        """),
+        {'table': table, 'partitions': list(partitions)}
+    ).scalars().all()
+
+
+def _scope(conn, table, start, end, files, partitions):
+    """Return the relation to scan, its WHERE clause and params, or None if nothing is in scope."""
+    if table not in FACT_TABLES or not (start or end or files or partitions):
+        return table, [], {}, 'full'
+
+    relation = table
+    where, params, scope = [], {}, []
+    if partitions:
+        names = _table_partitions(conn, table, partitions)
+        if not names:
+            return None
+        relation = names[0] if len(names) == 1 else (
+            "(" + " UNION ALL ".join(f"SELECT * FROM {name}" for name in names) + ") AS scoped"
+        )
+        scope.append(f"partitions {', '.join(names)}")
+    if start is not None:
+        where.append("datetime >= :start")
+        params['start'] = start
+    if end is not None:
+        where.append("datetime < :end")
+        params['end'] = end
+    if start is not None or end is not None:
+        scope.append(f"datetime in [{start or '-'}, {end or '-'})")
+    if files:
+        ranges = _file_ranges(conn, table, files)
+        if not ranges:
+            return None
+        clauses = []
+        for i, (low, high) in enumerate(ranges):
+            clauses.append(f"datetime BETWEEN :file_start_{i} AND :file_end_{i}")
+            params[f'file_start_{i}'], params[f'file_end_{i}'] = low, high
+        where.append("(" + " OR ".join(clauses) + ")")
+        scope.append(f"{len(ranges)} files")
+    return relation, where, params, '; '.join(scope)
+
+
+def validate_table(conn, table, rules=None, sample_percent=None, seed=None,
+                   start=None, end=None, files=None, partitions=None):
+    """Check every rule of ``table`` in one scan with a COUNT(*) FILTER per rule.
+
+    ``sample_percent`` scans a TABLESAMPLE SYSTEM block sample instead of the whole table
+    (counts are then estimates for the sample only). On fact tables ``start``/``end``
+    (end excluded, as in src.queries), ``files`` (manifest file names) and ``partitions``
+    restrict the scan to those rows.
+    Returns the rule results and the TableCheck, or None when nothing is in scope.
+    """
+    rules = rules or RULES[table]
+    scoped = _scope(conn, table, start, end, files, partitions)
+    if scoped is None:
+        return None
+    relation, where, params, scope = scoped
+
+    sample = ""
+    if sample_percent:
+        if relation.startswith('('):
+            raise ValueError("Sampling is not supported across several partitions")
+        sample = f" TABLESAMPLE SYSTEM ({float(sample_percent)})"
+        if seed is not None:
+            sample += f" REPEATABLE ({int(seed)})"
+
+    counts = ",\n".join(
+        f"    COUNT(*) FILTER (WHERE NOT {condition}) AS rule_{i}" for i, condition in enumerate(rules)
+    )
+    query = f"SELECT COUNT(*) AS rows_checked,\n{counts}\nFROM {relation}{sample}"
+    if where:
+        query += "\nWHERE " + " AND ".join(where)
+
+    row = conn.execute(text(query), params).mappings().one()
+    results = [
+        RuleResult(table, condition, int(row[f'rule_{i}'])) for i, condition in enumerate(rules)
+    ]
+    check = TableCheck(table, int(row['rows_checked']), scope, sampled=bool(sample_percent))
+    return results, check
+
+
+def validate(engine, tables=None, sample_percent=None, seed=None,
+             start=None, end=None, files=None, partitions=None):
+    """Validate ``tables`` (default: all with rules) and return a ValidationReport."""
+    report = ValidationReport()
+    with engine.connect() as conn:
+        for table in tables or RULES:
+            checked = validate_table(
+                conn, table, sample_percent=sample_percent, seed=seed,
+                start=start, end=end, files=files, partitions=partitions
+            )
+            if checked is None:
+                continue
+            results, check = checked
+            report.results.extend(results)
+            report.tables.append(check)
+    return report
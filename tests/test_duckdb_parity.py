@@ -0,0 +1,107 @@
+"""The KPI queries return the same results on the DuckDB backend as on Postgres.
+
+Runs on a small synthetic DATA_DIR in a throwaway database (``DB_NAME`` suffixed with
+``_parity_test``) of the configured server, and is skipped without a reachable server
+with PostGIS or without duckdb. Both backends are built in a child process, because the
+configuration (DATA_DIR, DB_NAME, cache paths) is read when src.config is imported.
+"""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('duckdb')
+psycopg2 = pytest.importorskip('psycopg2')
+
+from benchmarks.synthetic import generate
+from src.config import DB_CONFIG
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+TEST_DB = f"{DB_CONFIG['dbname']}_parity_test"
+
+
+def _admin_connection():
+    conn = psycopg2.connect(
+        dbname='postgres', user=DB_CONFIG['user'], password=DB_CONFIG['password'],
+        host=DB_CONFIG['host'], port=DB_CONFIG['port'], connect_timeout=3
+    )
+    conn.autocommit = True
+    return conn
+
+
+def _postgis_available():
+    try:
+        conn = _admin_connection()
+    except psycopg2.OperationalError:
+        return False
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'postgis'")
+        available = cursor.fetchone() is not None
+    conn.close()
+    return available
+
+
+pytestmark = pytest.mark.skipif(not _postgis_available(), reason="needs a Postgres server with PostGIS")
+
+
+def _write_overlapping_mobility(data_dir):
+    """Repeat mobility keys within the second day file and across the two day files."""
+    first, second = sorted(Path(data_dir).glob('mi-to-provinces-*.csv'))
+    earlier = pd.read_csv(first, nrows=300)
+    earlier[['cell2Province', 'Province2cell']] *= 2
+    repeated = pd.read_csv(second, nrows=100)
+    pd.concat([earlier, repeated]).to_csv(second, mode='a', header=False, index=False)
+
+
+def compare_backends():
+    """Load the DATA_DIR into Postgres and DuckDB and compare the four KPI queries (child process)."""
+    from src import kpi
+    from src.database import create_database, create_schema
+    from src.duckdb_backend import build_duckdb_database
+    from src.etl import load_grid_geometries, load_provinces_geometries, load_traffic_data, load_mobility_data
+
+    create_database()
+    create_schema(drop_existing=True)
+    load_grid_geometries()
+    load_provinces_geometries()
+    load_traffic_data(workers=1, staging=False)
+    load_mobility_data(workers=1, staging=False)
+    build_duckdb_database(source='csv')
+
+    queries = {
+        'top cells': lambda backend: kpi.get_top_cells(limit=25, backend=backend),
+        'top provinces': lambda backend: kpi.get_top_provinces(limit=50, backend=backend),
+        'hourly profile': lambda backend: kpi.get_hourly_profile(backend=backend),
+        'cell hourly profile': lambda backend: kpi.get_hourly_profile(cell_id=4242, backend=backend),
+        'daily totals': lambda backend: kpi.get_daily_totals(backend=backend),
+    }
+    for name, query in queries.items():
+        postgres, duckdb = query('postgres'), query('duckdb')
+        assert len(postgres), f"{name}: no rows"
+        pd.testing.assert_frame_equal(postgres, duckdb, check_dtype=False, check_exact=True, obj=name)
+
+
+def test_kpi_queries_match_postgres(tmp_path):
+    data_dir = tmp_path / 'data'
+    generate(data_dir, days=2, traffic_rows=20_000, mobility_rows=20_000, bad_every=500)
+    _write_overlapping_mobility(data_dir)
+
+    env = dict(
+        os.environ, DB_NAME=TEST_DB, DATA_DIR=str(data_dir), PGTZ='UTC', ETL_WORKERS='1', ETL_STAGING='off',
+        ETL_GEO_CACHE_DIR=str(tmp_path / 'geo'), ETL_STAGING_DIR=str(tmp_path / 'staging'),
+        ETL_DUCKDB_PATH=str(tmp_path / 'milan.duckdb'),
+    )
+    try:
+        result = subprocess.run(
+            [sys.executable, '-c', 'from tests.test_duckdb_parity import compare_backends; compare_backends()'],
+            cwd=REPO_DIR, env=env, capture_output=True, text=True
+        )
+    finally:
+        conn = _admin_connection()
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP DATABASE IF EXISTS {TEST_DB}")
+        conn.close()
+    assert result.returncode == 0, result.stderr[-4000:]
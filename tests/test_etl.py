@@ -0,0 +1,16 @@
+"""Per-file cleaning counters of the loader."""
+from src.etl import FACT_TABLES, _cleaned_chunks
+from src.parsing import clean_traffic_chunk
+
+
+def test_cleaned_chunks_seeds_the_counters(monkeypatch, tmp_path):
+    # A reader yielding no chunk at all still leaves a complete set of counters
+    monkeypatch.setattr('src.etl.read_csv_chunks', lambda *args: iter(()))
+    path = tmp_path / 'source.csv'
+    stats = {'timings': {}}
+    options = {'staging': False, 'parser': 'fast', 'chunk_rows': 1000}
+
+    assert list(_cleaned_chunks('traffic', path, None, options, clean_traffic_chunk, stats)) == []
+
+    for key in ['initial', 'final'] + FACT_TABLES['traffic']['reasons']:
+        assert stats[key] == 0
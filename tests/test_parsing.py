@@ -0,0 +1,180 @@
+"""Cleaning rules of the traffic and mobility chunks, on both parsers."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.database import copy_payload
+from src.parsing import (
+    FLOW_COLS, METRIC_COLS, MISSING_PROVINCE, MOBILITY_DTYPES, MOBILITY_KEY, TRAFFIC_DTYPES,
+    ProvinceNormalizer, clean_mobility_chunk, clean_traffic_chunk, merge_duplicate_keys, read_csv_chunks
+)
+
+TRAFFIC_CSV = """datetime,CellID,countrycode,smsin,smsout,callin,callout,internet
+2013-11-01 00:00:00,1,39,0.5,abc,,1.25,-2
+2013-11-01 00:10:00,10000,39,1,1,1,1,1
+not-a-date,5,39,1,1,1,1,1
+2013-11-01 00:20:00,9999,0,0.0260887051098,0,0,0,3
+"""
+
+MOBILITY_CSV = """datetime,CellID,provinceName,cell2Province,Province2cell
+2013-11-01 00:00:00,1,MILANO,1.5,2
+2013-11-01 00:00:00,1,Milano,0.5,x
+2013-11-01 00:00:00,2,MASSA-CARRARA,1,1
+2013-11-01 00:00:00,3,ATLANTIDE,1,1
+2013-11-01 00:00:00,4,,1,1
+2013-11-01 01:00:00,10000,BERGAMO,1,1
+,5,BERGAMO,1,1
+"""
+
+PROVINCES = ['Milano', 'Massa Carrara', 'Bergamo']
+
+# Declared schema (fast path) and pandas inference (--parser infer)
+PARSERS = pytest.mark.parametrize('fast', [True, False], ids=['fast', 'infer'])
+
+
+def _read(tmp_path, text, dtypes, chunk_rows=0):
+    path = tmp_path / 'source.csv'
+    path.write_text(text)
+    return pd.concat(list(read_csv_chunks(path, chunk_rows, dtypes)), ignore_index=True)
+
+
+@PARSERS
+def test_clean_traffic_chunk(tmp_path, fast):
+    df, stats = clean_traffic_chunk(_read(tmp_path, TRAFFIC_CSV, TRAFFIC_DTYPES if fast else None))
+
+    assert stats == {
+        'initial': 4, 'invalid_dates': 1, 'invalid_cells': 1, 'invalid_countries': 0, 'final': 2,
+        'negative': {'smsin': 0, 'smsout': 0, 'callin': 0, 'callout': 0, 'internet': 1},
+    }
+    assert df['datetime'].tolist() == [pd.Timestamp('2013-11-01 00:00:00'), pd.Timestamp('2013-11-01 00:20:00')]
+    assert df['cell_id'].dtype == np.int16
+    assert df['cell_id'].tolist() == [1, 9999]
+    assert df['countrycode'].tolist() == [39, 0]
+    # Malformed and missing values become 0, negative ones are clipped to 0
+    assert df[METRIC_COLS].iloc[0].tolist() == [0.5, 0, 0, 1.25, 0]
+    # Measures keep their full precision for the NUMERIC columns
+    assert df['smsin'].iloc[1] == 0.0260887051098
+
+
+@PARSERS
+def test_clean_traffic_chunk_epoch_milliseconds(tmp_path, fast):
+    text = "datetime,CellID,countrycode,smsin,smsout,callin,callout,internet\n1383264000000,7,39,1,2,3,4,5\n"
+    df, stats = clean_traffic_chunk(_read(tmp_path, text, TRAFFIC_DTYPES if fast else None))
+
+    assert stats['final'] == 1
+    assert df['datetime'].tolist() == [pd.Timestamp('2013-11-01 00:00:00')]
+
+
+@PARSERS
+@pytest.mark.parametrize('chunk_rows', [0, 1000])
+def test_clean_traffic_chunk_blank_countrycode(tmp_path, fast, chunk_rows):
+    text = TRAFFIC_CSV.splitlines()[0] + "\n2013-11-01 00:00:00,1,39,1,1,1,1,1\n2013-11-01 00:00:00,2,,1,1,1,1,1\n"
+    df, stats = clean_traffic_chunk(_read(tmp_path, text, TRAFFIC_DTYPES if fast else None, chunk_rows))
+
+    assert stats['invalid_countries'] == 1 and stats['final'] == 1
+    assert df['countrycode'].dtype == np.int32
+    # Rendered for COPY into the INTEGER column as 39, not 39.0
+    assert copy_payload(df, ['cell_id', 'countrycode']).getvalue() == '1,39\n'
+
+
+@PARSERS
+@pytest.mark.parametrize('chunk_rows', [0, 1000])
+def test_header_only_file_gives_one_empty_chunk(tmp_path, fast, chunk_rows):
+    path = tmp_path / 'source.csv'
+    path.write_text(TRAFFIC_CSV.splitlines()[0] + '\n')
+
+    chunks = list(read_csv_chunks(path, chunk_rows, TRAFFIC_DTYPES if fast else None))
+
+    assert len(chunks) == 1 and chunks[0].empty
+    assert chunks[0].columns.tolist() == list(TRAFFIC_DTYPES)
+    df, stats = clean_traffic_chunk(chunks[0])
+    assert df.empty and stats['initial'] == stats['final'] == 0
+
+
+def test_clean_traffic_chunk_missing_metric_column():
+    df = pd.DataFrame({
+        'datetime': ['2013-11-01 00:00:00'], 'CellID': [3], 'countrycode': [39],
+        'smsin': [1.0], 'smsout': [2.0], 'callin': [3.0], 'callout': [4.0],
+    })
+    cleaned, stats = clean_traffic_chunk(df)
+
+    assert stats['final'] == 1
+    assert cleaned['internet'].tolist() == [0]
+
+
+@PARSERS
+def test_clean_mobility_chunk(tmp_path, fast):
+    df, stats = clean_mobility_chunk(_read(tmp_path, MOBILITY_CSV, MOBILITY_DTYPES if fast else None), PROVINCES)
+
+    assert stats == {
+        'initial': 7, 'invalid_dates': 1, 'invalid_provinces': 2, 'invalid_cells': 1,
+        'duplicates_merged': 1, 'final': 2,
+        'unknown_provinces': {'ATLANTIDE': 1, MISSING_PROVINCE: 1},
+    }
+    df = df.sort_values('cell_id', ignore_index=True)
+    assert df['cell_id'].tolist() == [1, 2]
+    assert df['provincia'].astype(str).tolist() == ['Milano', 'Massa Carrara']
+    # Both spellings of Milano share the key: their flows are summed, 'x' counting as 0
+    assert df[FLOW_COLS].values.tolist() == [[2.0, 2.0], [1.0, 1.0]]
+
+
+def test_clean_mobility_chunk_accepts_a_normalizer():
+    normalizer = ProvinceNormalizer(PROVINCES)
+    df = pd.DataFrame({
+        'datetime': ['2013-11-01 00:00:00', '2013-11-01 01:00:00'], 'CellID': [1, 1],
+        'provinceName': ['BERGAMO', 'bergamo'], 'cell2Province': [1.0, 2.0], 'Province2cell': [3.0, 4.0],
+    })
+    cleaned, stats = clean_mobility_chunk(df, normalizer)
+
+    assert stats['final'] == 2 and stats['duplicates_merged'] == 0
+    assert cleaned['provincia'].astype(str).tolist() == ['Bergamo', 'Bergamo']
+
+
+def test_province_normalizer_maps_aliases_and_casing():
+    normalizer = ProvinceNormalizer(PROVINCES + ["Reggio nell'Emilia", 'Aosta'])
+    names = pd.Series(['MILANO', 'milano', "REGGIO NELL'EMILIA", "Valle D'Aosta", 'Massa-Carrara', 'ATLANTIDE', None])
+
+    result = normalizer.normalize(names)
+
+    assert isinstance(result.dtype, pd.CategoricalDtype)
+    assert list(result.cat.categories) == sorted(PROVINCES + ["Reggio nell'Emilia", 'Aosta'])
+    assert result.astype(object).where(result.notna(), None).tolist() == [
+        'Milano', 'Milano', "Reggio nell'Emilia", 'Aosta', 'Massa Carrara', None, None
+    ]
+
+
+def test_province_normalizer_categorical_input_and_memo():
+    normalizer = ProvinceNormalizer(PROVINCES, aliases={'Milan': 'Milano'})
+    names = pd.Series(pd.Categorical(['MILAN', 'BERGAMO', 'MILAN', 'PAVIA']), index=[10, 11, 12, 13])
+
+    result = normalizer.normalize(names)
+
+    assert result.index.tolist() == [10, 11, 12, 13]
+    assert result.astype(object).where(result.notna(), None).tolist() == ['Milano', 'Bergamo', 'Milano', None]
+    # Raw values are normalized once and remembered for later chunks
+    assert set(normalizer._codes) == {'BERGAMO', 'MILAN', 'PAVIA'}
+    assert normalizer.normalize(pd.Series(['PAVIA', 'BERGAMO'])).isna().tolist() == [True, False]
+
+
+def test_merge_duplicate_keys_without_duplicates_returns_the_frame():
+    df = pd.DataFrame({'datetime': [1, 1], 'cell_id': [1, 2], 'provincia': ['a', 'a'],
+                       'cell2province': [1.0, 2.0], 'province2cell': [3.0, 4.0]})
+
+    merged, count = merge_duplicate_keys(df, MOBILITY_KEY, FLOW_COLS)
+
+    assert merged is df and count == 0
+
+
+def test_merge_duplicate_keys_sums_measures():
+    df = pd.DataFrame({
+        'datetime': [1, 1, 1, 2], 'cell_id': [1, 1, 1, 1],
+        'provincia': pd.Categorical(['a', 'a', 'b', 'a'], categories=['a', 'b', 'c']),
+        'cell2province': [1.0, 2.0, 5.0, 7.0], 'province2cell': [0.5, 0.25, 1.0, 2.0],
+    })
+
+    merged, count = merge_duplicate_keys(df, MOBILITY_KEY, FLOW_COLS)
+
+    assert count == 1
+    assert merged.columns.tolist() == MOBILITY_KEY + FLOW_COLS
+    rows = merged.astype({'provincia': str}).sort_values(MOBILITY_KEY).values.tolist()
+    assert rows == [[1, 1, 'a', 3.0, 0.75], [1, 1, 'b', 5.0, 1.0], [2, 1, 'a', 7.0, 2.0]]
@@ -0,0 +1,78 @@
+"""Bounded prefetch of the chunk pipeline."""
+import threading
+
+import pytest
+
+from src.pipeline import prefetch
+
+
+class Source:
+    """A chunk generator that records how far it got and whether it was closed."""
+
+    def __init__(self, count, fail_at=None):
+        self.count = count
+        self.fail_at = fail_at
+        self.produced = 0
+        self.closed = False
+        self.thread = None
+
+    def __iter__(self):
+        try:
+            for i in range(self.count):
+                if i == self.fail_at:
+                    raise ValueError(f"bad chunk {i}")
+                self.produced += 1
+                yield i
+        finally:
+            self.closed = True
+            self.thread = threading.current_thread().name
+
+
+def _producers():
+    return [thread for thread in threading.enumerate() if thread.name == 'chunk-producer']
+
+
+@pytest.mark.parametrize('depth', [0, 1, 3])
+def test_yields_every_chunk_in_order(depth):
+    timings = {}
+    assert list(prefetch(iter(range(10)), depth, timings)) == list(range(10))
+    assert timings['wait'] >= 0
+    assert not _producers()
+
+
+def test_producer_exception_is_raised_to_the_caller():
+    source = Source(5, fail_at=2)
+    received = []
+    with pytest.raises(ValueError, match='bad chunk 2'):
+        for chunk in prefetch(iter(source), 1):
+            received.append(chunk)
+
+    assert received == [0, 1]
+    assert source.closed
+    assert not _producers()
+
+
+def test_early_close_closes_the_source():
+    source = Source(100)
+    chunks = prefetch(iter(source), 2)
+
+    assert next(chunks) == 0
+    chunks.close()
+
+    assert source.closed
+    # The generator is closed from the producer thread, which is stopped before close() returns
+    assert source.thread == 'chunk-producer'
+    assert source.produced < 100
+    assert not _producers()
+
+
+def test_consumer_error_stops_the_producer():
+    source = Source(100)
+    with pytest.raises(RuntimeError):
+        for chunk in prefetch(iter(source), 1):
+            if chunk == 3:
+                raise RuntimeError("write failed")
+
+    assert source.closed
+    assert source.produced < 100
+    assert not _producers()
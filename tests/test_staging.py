@@ -0,0 +1,24 @@
+"""Range reads of the Parquet staging area."""
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from src import staging
+
+
+def test_read_staged_end_is_exclusive(monkeypatch, tmp_path):
+    monkeypatch.setattr(staging, 'STAGING_DIR', tmp_path)
+    hours = pd.date_range('2013-11-01 22:00', '2013-11-02 02:00', freq='h')
+    writer = staging.StagedWriter('fact_traffic_milan', 'source.csv', 'key')
+    writer.write(pd.DataFrame({'datetime': hours, 'cell_id': range(len(hours))}))
+    writer.publish({})
+
+    def read(start, end):
+        df = staging.read_staged('fact_traffic_milan', ['datetime'], start=start, end=end)
+        return sorted(df['datetime'].dt.strftime('%d %H'))
+
+    # An end on a row (here midnight, the first row of a day directory) is left out
+    assert read('2013-11-01 23:00', '2013-11-02 00:00') == ['01 23']
+    assert read('2013-11-01 23:00', '2013-11-02 01:00') == ['01 23', '02 00']
+    assert read('2013-11-02', None) == ['02 00', '02 01', '02 02']